@@ -1,4 +1,5 @@
 import os
+import json
 import logging
 
 from flask import Flask
@@ -7,6 +8,7 @@ from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
+from flask_migrate import Migrate
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -19,6 +21,7 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 csrf = CSRFProtect()
+migrate = Migrate()
 
 # Create the app
 app = Flask(__name__)
@@ -40,29 +43,123 @@ app.config['WTF_CSRF_ENABLED'] = True
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['UPLOAD_RETENTION_DAYS'] = int(os.environ.get("UPLOAD_RETENTION_DAYS", 30))  # unreferenced images older than this are pruned
+app.config['UPLOAD_JPEG_QUALITY'] = int(os.environ.get("UPLOAD_JPEG_QUALITY", 0))  # re-encode stored JPEGs at this quality (0 keeps the original)
+app.config['UPLOAD_THUMBNAIL_WIDTH'] = int(os.environ.get("UPLOAD_THUMBNAIL_WIDTH", 0))  # pixels; 0 for no thumbnails
+app.config['DASHBOARD_STATS_TTL'] = float(os.environ.get("DASHBOARD_STATS_TTL", 5))  # seconds dashboard numbers are cached per organization
+app.config['REPORT_MAX_DAYS'] = int(os.environ.get("REPORT_MAX_DAYS", 3660))  # longest date range the report APIs accept
+app.config['LIVE_EVENTS_BROKER'] = os.environ.get("LIVE_EVENTS_BROKER", "local")  # local, or a redis:// URL shared by all processes
+app.config['LIVE_EVENTS_QUEUE_SIZE'] = int(os.environ.get("LIVE_EVENTS_QUEUE_SIZE", 100))  # undelivered events per client before it resyncs
+app.config['LIVE_EVENTS_KEEPALIVE'] = float(os.environ.get("LIVE_EVENTS_KEEPALIVE", 15))  # seconds between SSE keepalives
+app.config['LIVE_EVENTS_MAX_AGE'] = float(os.environ.get("LIVE_EVENTS_MAX_AGE", 300))  # seconds before a live stream is closed (the browser reconnects)
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get("SSE_MAX_STREAMS", 48))  # open event streams per process; keep below the worker's thread count (gunicorn --threads)
+app.config['USER_CACHE_TTL'] = float(os.environ.get("USER_CACHE_TTL", 60))  # seconds a logged-in user's identity is cached
+app.config['USER_CACHE_SIZE'] = int(os.environ.get("USER_CACHE_SIZE", 1024))  # identities held per process
+
+# Face recognition configuration
+app.config['FACE_MATCH_TOLERANCE'] = float(os.environ.get("FACE_MATCH_TOLERANCE", 0.6))  # lower is stricter
+app.config['FACE_GALLERY_SYNC_INTERVAL'] = float(os.environ.get("FACE_GALLERY_SYNC_INTERVAL", 5))  # seconds between staleness checks
+app.config['FACE_INDEX_BACKEND'] = os.environ.get("FACE_INDEX_BACKEND", "exact")  # exact, ivf
+app.config['FACE_INDEX_NLIST'] = int(os.environ.get("FACE_INDEX_NLIST", 0))  # IVF clusters, 0 = 4 * sqrt(N)
+app.config['FACE_INDEX_NPROBE'] = int(os.environ.get("FACE_INDEX_NPROBE", 8))  # IVF clusters searched per query, higher = better recall
+app.config['FACE_INDEX_PATH'] = os.environ.get("FACE_INDEX_PATH")  # optional on-disk copy of the index
+app.config['FACE_BATCH_MAX_IMAGES'] = int(os.environ.get("FACE_BATCH_MAX_IMAGES", 32))  # images per /face-attendance/batch request
+app.config['FACE_ENCODING_DTYPE'] = os.environ.get("FACE_ENCODING_DTYPE", "float32")  # float32, float16
+app.config['FACE_ENCODING_ALLOW_PICKLE'] = os.environ.get("FACE_ENCODING_ALLOW_PICKLE", "true").lower() == "true"  # disable once migrate-face-encodings has run
+
+# CV worker pool configuration (0 workers runs jobs inline on the request thread)
+app.config['CV_POOL_WORKERS'] = int(os.environ.get("CV_POOL_WORKERS", 2))
+app.config['CV_QUEUE_LIMIT'] = int(os.environ.get("CV_QUEUE_LIMIT", 8))  # jobs running or waiting before new ones get a 503
+app.config['CV_JOB_CONCURRENCY'] = {
+    job_type: int(os.environ.get(f"CV_{job_type.upper()}_CONCURRENCY", 4))
+    for job_type in ('face', 'plate', 'parking')
+}
+app.config['CV_JOB_TIMEOUTS'] = {
+    'face': float(os.environ.get("CV_FACE_TIMEOUT", 10)),
+    'plate': float(os.environ.get("CV_PLATE_TIMEOUT", 10)),
+    'parking': float(os.environ.get("CV_PARKING_TIMEOUT", 15)),
+}
+
+# Background analysis jobs
+app.config['JOB_WORKERS'] = int(os.environ.get("JOB_WORKERS", 2))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+app.config['JOB_RESULT_TTL'] = int(os.environ.get("JOB_RESULT_TTL", 3600))  # seconds finished jobs stay queryable
+app.config['JOB_PERSISTENCE'] = os.environ.get("JOB_PERSISTENCE", "memory")  # memory, database
+app.config['JOB_STALE_AFTER'] = int(os.environ.get("JOB_STALE_AFTER", 300))  # seconds before a running job is considered orphaned
+app.config['JOB_EVENTS_KEEPALIVE'] = float(os.environ.get("JOB_EVENTS_KEEPALIVE", 15))  # seconds between SSE keepalives
+app.config['JOB_EVENTS_MAX_AGE'] = float(os.environ.get("JOB_EVENTS_MAX_AGE", 60))  # seconds before a job stream is closed (the browser polls instead)
+app.config['JOB_STORAGE_FOLDER'] = os.environ.get("JOB_STORAGE_FOLDER", os.path.join(app.root_path, 'instance', 'jobs'))
+
+# Video stream ingestion
+app.config['STREAM_FPS'] = float(os.environ.get("STREAM_FPS", 2))  # frames analysed per second
+app.config['STREAM_MOTION_THRESHOLD'] = float(os.environ.get("STREAM_MOTION_THRESHOLD", 0.01))  # fraction of changed pixels
+app.config['STREAM_BUFFER_SIZE'] = int(os.environ.get("STREAM_BUFFER_SIZE", 4))  # decoded frames held for the detectors
+
+# Repeated detections of the same plate/person within these windows are one event
+app.config['PLATE_DEDUP_WINDOW'] = int(os.environ.get("PLATE_DEDUP_WINDOW", 60))  # seconds
+app.config['ATTENDANCE_DEDUP_WINDOW'] = int(os.environ.get("ATTENDANCE_DEDUP_WINDOW", 120))  # seconds
+
+# Write-behind batching of new plate detection and check-in rows
+app.config['LOG_WRITE_BEHIND'] = os.environ.get("LOG_WRITE_BEHIND", "false").lower() == "true"
+app.config['LOG_WRITE_BEHIND_INTERVAL'] = float(os.environ.get("LOG_WRITE_BEHIND_INTERVAL", 0.5))  # seconds between flushes
+app.config['LOG_WRITE_BEHIND_BATCH_SIZE'] = int(os.environ.get("LOG_WRITE_BEHIND_BATCH_SIZE", 100))  # rows that trigger an early flush
+app.config['LOG_WRITE_BEHIND_MAX_PENDING'] = int(os.environ.get("LOG_WRITE_BEHIND_MAX_PENDING", 10000))  # rows kept for retry while the database is down
+
+# Plate detection and parking logs: monthly partitions (PostgreSQL) and retention
+app.config['PARTITION_MONTHS_AHEAD'] = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))  # months of partitions created in advance
+app.config['LOG_HISTORY_MONTHS'] = int(os.environ.get("LOG_HISTORY_MONTHS", 2))  # months shown in history lists, including the current one
+app.config['LOG_RETENTION_MONTHS'] = int(os.environ.get("LOG_RETENTION_MONTHS", 12))  # months kept by apply-log-retention
+app.config['LOG_ARCHIVE_FOLDER'] = os.environ.get("LOG_ARCHIVE_FOLDER", os.path.join(app.root_path, 'instance', 'archive'))
+
+# Parking occupancy hysteresis: fraction of feature pixels in a space's ROI
+app.config['PARKING_OCCUPIED_THRESHOLD'] = float(os.environ.get("PARKING_OCCUPIED_THRESHOLD", 0.18))  # free -> occupied above this
+app.config['PARKING_VACANT_THRESHOLD'] = float(os.environ.get("PARKING_VACANT_THRESHOLD", 0.12))  # occupied -> free below this
+app.config['PARKING_CHANGE_THRESHOLD'] = float(os.environ.get("PARKING_CHANGE_THRESHOLD", 0.02))  # changed pixels before a space is re-scored
+app.config['PARKING_REFERENCE_TTL'] = int(os.environ.get("PARKING_REFERENCE_TTL", 60))  # seconds between full re-scores per camera
+
+# Sampled debug images from the CV pipelines (off by default)
+app.config['DEBUG_ARTIFACTS'] = os.environ.get("DEBUG_ARTIFACTS", "false").lower() == "true"
+app.config['DEBUG_ARTIFACT_SAMPLE_RATE'] = int(os.environ.get("DEBUG_ARTIFACT_SAMPLE_RATE", 100))  # keep 1 in N
+app.config['DEBUG_ARTIFACT_FOLDER'] = os.environ.get("DEBUG_ARTIFACT_FOLDER", os.path.join(app.root_path, 'instance', 'debug'))
+app.config['DEBUG_ARTIFACT_MAX_AGE'] = int(os.environ.get("DEBUG_ARTIFACT_MAX_AGE", 86400))  # seconds
+app.config['DEBUG_ARTIFACT_MAX_BYTES'] = int(os.environ.get("DEBUG_ARTIFACT_MAX_BYTES", 100 * 1024 * 1024))
+
+# Plate OCR
+app.config['PLATE_OCR_BACKEND'] = os.environ.get("PLATE_OCR_BACKEND", "tesseract")  # tesseract, crnn, none
+app.config['PLATE_OCR_MODEL'] = os.environ.get("PLATE_OCR_MODEL")  # CRNN model file for the crnn backend
+app.config['PLATE_OCR_ALPHABET'] = os.environ.get("PLATE_OCR_ALPHABET", "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ")  # CRNN output classes after the CTC blank
+app.config['PLATE_OCR_MIN_CONFIDENCE'] = float(os.environ.get("PLATE_OCR_MIN_CONFIDENCE", 0.5))
+app.config['PLATE_MIN_LENGTH'] = int(os.environ.get("PLATE_MIN_LENGTH", 4))  # characters after normalisation
+app.config['PLATE_MAX_LENGTH'] = int(os.environ.get("PLATE_MAX_LENGTH", 10))
+app.config['PLATE_MATCH_MAX_DISTANCE'] = float(os.environ.get("PLATE_MATCH_MAX_DISTANCE", 0.5))  # edits; O/0-style confusions count 0.5
+app.config['PLATE_INDEX_TTL'] = int(os.environ.get("PLATE_INDEX_TTL", 30))  # seconds before another process's registrations are seen
+
+# Plate localisation
+app.config['PLATE_SEARCH_WIDTH'] = int(os.environ.get("PLATE_SEARCH_WIDTH", 640))  # frames are searched at this width
+app.config['PLATE_MAX_CANDIDATES'] = int(os.environ.get("PLATE_MAX_CANDIDATES", 3))  # crops sent to OCR per frame
+app.config['PLATE_GATE_ROIS'] = json.loads(os.environ.get("PLATE_GATE_ROIS", "{}"))  # {"camera_id": [x, y, w, h]} in frame pixels
 
 # Initialize extensions with app
 db.init_app(app)
 login_manager.init_app(app)
 csrf.init_app(app)
+migrate.init_app(app, db)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
 # Import models to ensure they're registered with SQLAlchemy
-with app.app_context():
-    # Import models
-    from models import User, FaceData, VehiclePlate, ParkingSpace, AttendanceRecord
-
-    # Create tables
-    db.create_all()
-    
-    logger.debug("Database tables created")
+# (the schema itself is managed by migrations: run `flask db upgrade`)
+from models import User, FaceData, VehiclePlate, ParkingSpace, AttendanceRecord, PlateDetectionLog, ParkingLog, AnalysisJob, CameraCalibration, ParkingROI, AttendanceRollup, PlateDetectionRollup  # noqa: F401
 
 # Import routes
 from routes import *
 
+# Register CLI commands
+import commands  # noqa: F401
+
 # Configure user loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    # Served from a short-lived identity cache instead of a query per request
+    from user_cache import user_cache
+    return user_cache.get(int(user_id))
@@ -0,0 +1,66 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundWriter:
+    """
+    Bounded queue of small I/O tasks run by one daemon thread.
+
+    Used for side effects (debug images, file writes) that must not block a
+    request or a CV worker. ``submit`` never waits: when the queue is full
+    the task is dropped and False returned, so a slow disk sheds load instead
+    of stalling callers. The thread is started lazily and again after a fork,
+    so each CV worker process gets its own.
+    """
+
+    def __init__(self, name, maxsize=64):
+        self.name = name
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            thread = threading.Thread(target=self._run, args=(self._queue,), name=self.name, daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _run(self, tasks):
+        while True:
+            fn, args, kwargs = tasks.get()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"{self.name} task failed: {str(e)}")
+            finally:
+                tasks.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(*args, **kwargs)``; returns False if it was dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        """Wait until every queued task has run."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+# Shared writer for this process; drained on interpreter exit
+background_writer = BackgroundWriter("background-writer")
+atexit.register(background_writer.flush)
@@ -0,0 +1,209 @@
+import logging
+
+import click
+
+from app import app, db
+from models import FaceData
+from face_codec import ENCODING_DIM, HEADER, DTYPES, DTYPE_CODES, decode_encoding, encode_encoding, is_binary_encoding
+
+logger = logging.getLogger(__name__)
+
+@app.cli.command('migrate-face-encodings')
+@click.option('--batch-size', default=500, show_default=True, help='Rows rewritten per transaction.')
+@click.option('--dtype', type=click.Choice(sorted(DTYPE_CODES)), default=None,
+              help='Storage precision (defaults to FACE_ENCODING_DTYPE).')
+def migrate_face_encodings(batch_size, dtype):
+    """Rewrite pickled face encodings in the fixed-width binary format."""
+    dtype = dtype or app.config.get('FACE_ENCODING_DTYPE', 'float32')
+    target_code = DTYPE_CODES[dtype]
+
+    last_id = 0
+    converted = 0
+    failed = 0
+
+    while True:
+        # Walk the table by primary key so each batch is an index range scan
+        batch = FaceData.query.filter(FaceData.id > last_id).order_by(FaceData.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for record in batch:
+            data = record.face_encoding
+            if is_binary_encoding(data) and HEADER.unpack_from(data)[2] == target_code:
+                continue
+            try:
+                record.face_encoding = encode_encoding(decode_encoding(data, allow_legacy=True), dtype)
+                converted += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Could not convert face encoding {record.id}: {str(e)}")
+
+        last_id = batch[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+        click.echo(f"Processed up to id {last_id}: {converted} converted, {failed} failed")
+
+    click.echo(f"Done. {converted} face encodings rewritten as {dtype} ({DTYPES[target_code].itemsize * ENCODING_DIM + HEADER.size} bytes each).")
+
+@app.cli.command('ingest-stream')
+@click.argument('source')
+@click.option('--organization', default=None, help='Organization plate detections are recorded for.')
+@click.option('--location', default=None, help='Camera or gate name stored with plate detections.')
+@click.option('--fps', type=float, default=None, help='Frames analysed per second (defaults to STREAM_FPS).')
+@click.option('--faces/--no-faces', default=True, show_default=True, help='Record face attendance.')
+@click.option('--plates/--no-plates', default=True, show_default=True, help='Record number plates.')
+@click.option('--max-frames', type=int, default=None, help='Stop after this many analysed frames.')
+def ingest_stream(source, organization, location, fps, faces, plates, max_frames):
+    """Record attendance and plate detections from a video file, URL or camera index."""
+    from streaming import StreamIngestor
+
+    ingestor = StreamIngestor(
+        int(source) if source.isdigit() else source,
+        organization=organization,
+        faces=faces,
+        plates=plates,
+        location=location,
+        fps=fps
+    )
+
+    try:
+        for result in ingestor.run(max_frames=max_frames):
+            for event in result["attendance"]:
+                click.echo(f"[{result['timestamp']:.1f}s] user {event['user_id']} {event['type']}")
+            for plate in result["plates"]:
+                status = "authorized" if plate["is_authorized"] else "unauthorized"
+                click.echo(f"[{result['timestamp']:.1f}s] plate {plate['plate_number']} ({status})")
+    except KeyboardInterrupt:
+        ingestor.stop()
+
+    stats = ingestor.stats
+    click.echo(f"Done. {stats['processed']} frames analysed, {stats['motion_skipped']} skipped without motion, {stats['dropped']} dropped.")
+
+@app.cli.command('benchmark-parking')
+@click.option('--spaces', type=int, multiple=True, default=(100, 1000, 10000), show_default=True,
+              help='Number of parking spaces to score (repeatable).')
+@click.option('--width', default=1920, show_default=True, help='Frame width in pixels.')
+@click.option('--height', default=1080, show_default=True, help='Frame height in pixels.')
+@click.option('--frames', default=20, show_default=True, help='Frames timed per size.')
+def benchmark_parking(spaces, width, height, frames):
+    """Time per-frame parking occupancy scoring for synthetic camera layouts."""
+    import time
+
+    import cv2
+    import numpy as np
+
+    from parking_rois import CompiledCalibration, apply_hysteresis
+
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+
+    def per_frame(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(frames):
+            fn()
+        return (time.perf_counter() - start) / frames * 1000
+
+    def threshold():
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        return cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+
+    thresh = threshold()
+    click.echo(f"{width}x{height} frame, threshold pass: {per_frame(threshold):.2f} ms")
+    click.echo(f"{'spaces':>8} {'rects':>8} {'compile s':>10} {'batched ms':>11} {'per-space ms':>13}")
+
+    for count in spaces:
+        # Slanted quads on a grid, like stalls seen at an angle
+        grid = int(np.ceil(np.sqrt(count)))
+        cell_w, cell_h = width / grid, height / grid
+        rois = []
+        for i in range(count):
+            x, y = (i % grid) * cell_w, (i // grid) * cell_h
+            skew = cell_h * 0.2
+            polygon = [[x + 1, y + skew], [x + cell_w - 2, y + 1], [x + cell_w - 2, y + cell_h - skew], [x + 1, y + cell_h - 2]]
+            rois.append((i, [[int(px), int(py)] for px, py in polygon], None, None))
+
+        start = time.perf_counter()
+        calibration = CompiledCalibration.build(width, height, rois)
+        compile_seconds = time.perf_counter() - start
+
+        was_occupied = np.zeros(count, dtype=bool)
+        occupied_above, vacant_below = calibration.thresholds(0.18, 0.12)
+        batched = per_frame(lambda: apply_hysteresis(calibration.score(thresh), was_occupied, occupied_above, vacant_below))
+
+        # The previous approach: slice and count every cell in a Python loop
+        cells = [(int(x0), int(y0), int(x1), int(y1)) for x0, y0, x1, y1 in CompiledCalibration.grid(range(count), width, height).rects]
+        def per_space():
+            return [np.sum(thresh[y0:y1, x0:x1] > 0) / max(1, (y1 - y0) * (x1 - x0)) > 0.15 for x0, y0, x1, y1 in cells]
+
+        click.echo(f"{count:>8} {len(calibration.rects):>8} {compile_seconds:>10.2f} {batched:>11.2f} {per_frame(per_space):>13.2f}")
+
+@app.cli.command('prune-uploads')
+@click.option('--days', type=int, default=None, help='Age of images removed (defaults to UPLOAD_RETENTION_DAYS).')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without deleting.')
+def prune_uploads(days, dry_run):
+    """Delete old uploaded images that no plate detection log refers to."""
+    from models import PlateDetectionLog
+    from upload_store import upload_store
+
+    days = days if days is not None else app.config.get('UPLOAD_RETENTION_DAYS', 30)
+
+    def referenced():
+        # Evidence for logged detections is kept however old it is; streamed in batches
+        yield from db.session.execute(
+            db.select(PlateDetectionLog.image_path).where(PlateDetectionLog.image_path.isnot(None))
+            .execution_options(yield_per=5000)
+        ).scalars()
+
+    removed, freed = upload_store.prune(days * 86400, referenced(), dry_run=dry_run)
+    action = "Would remove" if dry_run else "Removed"
+    click.echo(f"{action} {removed} images ({freed / (1024 * 1024):.1f} MB) older than {days} days.")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--days', type=int, default=30, show_default=True, help='Days back from today to recompute.')
+def rebuild_rollups_command(days):
+    """Recompute the attendance and plate report rollups from the raw logs."""
+    from datetime import datetime, timedelta
+
+    from rollups import rebuild_rollups
+
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days)
+    attendance_rows, plate_rows = rebuild_rollups(start, end)
+    click.echo(f"Rebuilt {start} to {end}: {attendance_rows} attendance and {plate_rows} plate rollup rows.")
+
+@app.cli.command('create-partitions')
+@click.option('--months-ahead', type=int, default=None, help='Months after the current one to create (defaults to PARTITION_MONTHS_AHEAD).')
+def create_partitions_command(months_ahead):
+    """Create the monthly plate detection and parking log partitions (PostgreSQL)."""
+    from partitions import ensure_partitions, partitioning_supported
+
+    if not partitioning_supported():
+        click.echo("Log partitioning needs PostgreSQL; nothing to do.")
+        return
+
+    created, failed = ensure_partitions(months_ahead)
+    click.echo(f"Created {len(created)} partitions{': ' + ', '.join(created) if created else '.'}")
+    for name, error in failed:
+        click.echo(f"Could not create {name}: {error}", err=True)
+    if failed:
+        # Exits non-zero so the scheduler reports it
+        raise click.ClickException(f"{len(failed)} partitions could not be created")
+
+@app.cli.command('apply-log-retention')
+@click.option('--months', type=int, default=None, help='Months of logs to keep, including the current one (defaults to LOG_RETENTION_MONTHS).')
+@click.option('--archive/--no-archive', default=True, show_default=True, help='Write removed rows to gzipped CSV files in LOG_ARCHIVE_FOLDER first.')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without removing it.')
+def apply_log_retention_command(months, archive, dry_run):
+    """Archive and remove plate detection and parking logs older than the retention period."""
+    from partitions import apply_retention
+
+    archive_folder = app.config['LOG_ARCHIVE_FOLDER'] if archive else None
+    removed = apply_retention(months, archive_folder=archive_folder, dry_run=dry_run)
+
+    action = "Would remove" if dry_run else "Removed"
+    for entry in removed:
+        archived = f" -> {entry['archive']}" if entry['archive'] else ""
+        click.echo(f"{action} {entry['rows']} {entry['table']} rows from {entry['month']:%Y-%m}{archived}")
+    if not removed:
+        click.echo("No logs older than the retention period.")
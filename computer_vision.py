@@ -1,11 +1,17 @@
-import pickle
 import logging
-import os
 import string
 import random
+from collections import namedtuple
 from datetime import datetime
 from app import db, app
-from models import FaceData, User, ParkingSpace
+from models import FaceData, User
+from face_gallery import face_gallery
+from face_codec import encode_encoding
+from cv_workers import cv_pool, CVWorkerError
+from parking_rois import CompiledCalibration, apply_hysteresis
+from debug_artifacts import debug_artifacts
+from plate_ocr import get_recognizer, is_plausible_plate
+from frames import Frame, reduction_for
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -21,6 +27,52 @@ except ImportError:
     CV_LIBRARIES_AVAILABLE = False
     logger.warning("Computer vision libraries not available - using placeholder implementations")
 
+def _detect_faces(image_stream, all_faces=True):
+    """
+    Locate and encode faces in an encoded image (runs in a CV worker).
+    
+    Args:
+        image_stream: The raw image file bytes
+        all_faces: Encode every face, or only the first one found
+        
+    Returns:
+        Tuple of (face_locations, face_encodings)
+    """
+    frame = Frame.decode(image_stream)
+    
+    if frame is None:
+        return [], []
+    
+    return detect_faces_in_image(frame, all_faces)
+
+def detect_faces_in_image(image, all_faces=True):
+    """
+    Locate and encode faces in a decoded image.
+    
+    Args:
+        image: A Frame, or the BGR image as a NumPy array
+        all_faces: Encode every face, or only the first one found
+        
+    Returns:
+        Tuple of (face_locations, face_encodings)
+    """
+    # face_recognition uses RGB
+    rgb_image = Frame.of(image).rgb
+    
+    # Detect faces in the image
+    face_locations = face_recognition.face_locations(rgb_image, model="hog")  # Use HOG for speed, CNN for accuracy
+    
+    if not face_locations:
+        return [], []
+    
+    if not all_faces:
+        # Use the first face found (assuming one person per image)
+        face_locations = face_locations[:1]
+    
+    # One call encodes every face found in the frame
+    face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+    return face_locations, face_encodings
+
 def process_face_recognition(file, verify=False):
     """
     Process an image file for face recognition.
@@ -35,30 +87,21 @@ def process_face_recognition(file, verify=False):
     """
     try:
         if CV_LIBRARIES_AVAILABLE:
-            # Read the image file
-            image_stream = file.read()
-            image = np.asarray(bytearray(image_stream), dtype=np.uint8)
-            image = cv2.imdecode(image, cv2.IMREAD_COLOR)
-            
-            # Convert to RGB (face_recognition uses RGB)
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces in the image
-            face_locations = face_recognition.face_locations(rgb_image, model="hog")  # Use HOG for speed, CNN for accuracy
+            # Detect and encode the face in a CV worker process
+            face_locations, face_encodings = cv_pool.run('face', _detect_faces, file.read(), False)
             
             if not face_locations:
                 logger.warning("No face detected in the image")
                 return None
             
-            # Use the first face found (assuming one person per image)
-            face_encoding = face_recognition.face_encodings(rgb_image, [face_locations[0]])[0]
+            face_encoding = face_encodings[0]
             
             if verify:
                 # Compare with existing face encodings
                 return verify_face(face_encoding)
             else:
                 # Return the encoding for storage
-                return pickle.dumps(face_encoding)
+                return encode_encoding(face_encoding)
         else:
             # Placeholder implementation when libraries aren't available
             logger.info("Using placeholder face recognition implementation")
@@ -71,52 +114,51 @@ def process_face_recognition(file, verify=False):
                 return verify_face(mock_encoding)
             else:
                 # Return the encoding for storage
-                return pickle.dumps(mock_encoding)
+                return encode_encoding(mock_encoding)
     
+    except CVWorkerError:
+        raise
     except Exception as e:
         logger.error(f"Error in face recognition: {str(e)}")
         return None
 
-def verify_face(face_encoding):
+def verify_face(face_encoding, tolerance=None):
     """
     Verify a face encoding against stored encodings.
     
     Args:
         face_encoding: The encoding to verify
+        tolerance: Maximum face distance accepted as a match
+                   (defaults to FACE_MATCH_TOLERANCE)
         
     Returns:
         User ID if match found, None otherwise
     """
     try:
-        # Get all face data from database
-        face_data_records = FaceData.query.all()
-        
-        if not face_data_records:
-            logger.warning("No face data found in database")
-            return None
-        
         if CV_LIBRARIES_AVAILABLE:
-            # Compare with each stored encoding
-            for record in face_data_records:
-                stored_encoding = pickle.loads(record.face_encoding)
-                
-                # Compare faces with a tolerance of 0.6 (lower is stricter)
-                # Use the face_distance method to get a continuous measure of face similarity
-                face_distance = face_recognition.face_distance([stored_encoding], face_encoding)[0]
-                
+            # Match against the in-memory gallery in a single batched distance computation
+            face_gallery.ensure_loaded()
+            
+            if not len(face_gallery):
+                logger.warning("No face data found in database")
+                return None
+            
+            user_id, face_distance = face_gallery.match(face_encoding, tolerance)
+            
+            if user_id is not None:
                 # Convert distance to similarity score (0-1 where 1 is perfect match)
                 similarity = 1 - face_distance
-                
-                # Use compare_faces with a specific tolerance threshold
-                is_match = face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=0.6)[0]
-                
-                if is_match:
-                    logger.info(f"Face match found for user ID: {record.user_id} with similarity: {similarity:.2f}")
-                    return record.user_id
+                logger.info(f"Face match found for user ID: {user_id} with similarity: {similarity:.2f}")
+                return user_id
         else:
             # Placeholder implementation - 50% chance of finding a match
-            if face_data_records and random.choice([True, False]):
-                record = face_data_records[0]
+            record = FaceData.query.first()
+            
+            if not record:
+                logger.warning("No face data found in database")
+                return None
+            
+            if random.choice([True, False]):
                 logger.info(f"Simulated face match found for user ID: {record.user_id}")
                 return record.user_id
         
@@ -127,92 +169,297 @@ def verify_face(face_encoding):
         logger.error(f"Error verifying face: {str(e)}")
         return None
 
-def process_plate_detection(file):
+def process_face_batch(files, tolerance=None):
+    """
+    Detect and identify every face in a batch of images.
+
+    Each image is encoded with a single face_encodings call covering all of
+    its faces, and all encodings from the batch are matched against the
+    gallery in one matrix operation.
+
+    Args:
+        files: The uploaded image files
+        tolerance: Maximum face distance accepted as a match
+                   (defaults to FACE_MATCH_TOLERANCE)
+
+    Returns:
+        List with one entry per image, each a list of dicts with the face
+        location (top, right, bottom, left), matched user ID (or None) and
+        distance
+    """
+    results = [[] for _ in files]
+    encodings = []
+    owners = []
+
+    try:
+        if CV_LIBRARIES_AVAILABLE:
+            # Fan the images out over the CV workers and share one deadline. A
+            # busy pool rejects the batch up front; past the first image, jobs
+            # wait for the slots the batch's own earlier jobs free up
+            deadline = cv_pool.deadline('face')
+            futures = []
+            try:
+                for file in files:
+                    futures.append(cv_pool.submit('face', _detect_faces, file.read(), True,
+                                                  wait=bool(futures), deadline=deadline))
+                detections = [cv_pool.result('face', future, deadline) for future in futures]
+            except CVWorkerError:
+                # Don't leave the rest of a failed batch queued
+                for future in futures:
+                    future.cancel()
+                raise
+        else:
+            # Placeholder: one random face per image
+            detections = [([(0, 0, 0, 0)], [[random.uniform(-1, 1) for _ in range(128)]]) for _ in files]
+        
+        for i, (face_locations, face_encodings) in enumerate(detections):
+            for location, encoding in zip(face_locations, face_encodings):
+                results[i].append({"location": list(location), "user_id": None, "distance": None})
+                encodings.append(encoding)
+                owners.append((i, len(results[i]) - 1))
+
+        if not encodings:
+            logger.warning("No faces detected in the batch")
+            return results
+
+        if CV_LIBRARIES_AVAILABLE:
+            face_gallery.ensure_loaded()
+            user_ids, distances = face_gallery.match_many(encodings, tolerance)
+        else:
+            user_ids = [verify_face(encoding) for encoding in encodings]
+            distances = [None] * len(encodings)
+
+        for (i, j), user_id, distance in zip(owners, user_ids, distances):
+            results[i][j]["user_id"] = user_id
+            results[i][j]["distance"] = distance
+
+        logger.info(f"Matched {sum(u is not None for u in user_ids)} of {len(encodings)} faces in {len(files)} images")
+        return results
+
+    except CVWorkerError:
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch face recognition: {str(e)}")
+        return results
+
+def _detect_plate(image_stream, roi=None):
     """
-    Process an image file for license plate detection.
+    Locate a license plate in an encoded image (runs in a CV worker).
     
     Args:
-        file: The uploaded image file
+        image_stream: The raw image file bytes
+        roi: Optional (x, y, w, h) gate region to search instead of the whole frame
+        
+    Returns:
+        Tuple of (plate_number, confidence) or (None, 0) if no plate detected
+    """
+    frame = Frame.decode(image_stream)
+    
+    if frame is None:
+        return None, 0
+    
+    return find_plate_in_image(frame, roi=roi)
+
+def plate_gate_roi(camera_id):
+    """
+    The fixed plate search region configured for a gate camera.
+    
+    Args:
+        camera_id: Camera or location name (a key of PLATE_GATE_ROIS)
+        
+    Returns:
+        Tuple of (x, y, w, h) in frame pixels, or None to search the whole frame
+    """
+    roi = app.config.get('PLATE_GATE_ROIS', {}).get(camera_id) if camera_id else None
+    return tuple(int(v) for v in roi) if roi else None
+
+# A plate-like region: grayscale crop at full resolution, its (x, y, w, h)
+# in the full frame, and a 0-1 score of how plate-like its outline is
+PlateCandidate = namedtuple('PlateCandidate', ['crop', 'rect', 'score'])
+
+PLATE_ASPECT_RANGE = (1.5, 5.0)  # width / height of a plate outline
+PLATE_STRONG_SCORE = 0.8  # candidates this good end the contour search early
+
+def _score_plate_contour(contour, frame_area):
+    """Score a contour as a plate outline; returns (score, bounding rect) or (0, None)."""
+    x, y, w, h = cv2.boundingRect(contour)
+    area = w * h
+    if h == 0 or not (0.0005 * frame_area <= area <= 0.25 * frame_area):
+        return 0, None
+    
+    aspect_ratio = w / h
+    if not PLATE_ASPECT_RANGE[0] <= aspect_ratio <= PLATE_ASPECT_RANGE[1]:
+        return 0, None
+    
+    # How well the outline fills its bounding box, with a bonus for a clean quadrilateral
+    perimeter = cv2.arcLength(contour, True)
+    approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
+    rectangularity = min(1.0, cv2.contourArea(cv2.convexHull(contour)) / area)
+    shape = 1.0 if len(approx) == 4 else 0.7
+    return rectangularity * shape, (x, y, w, h)
+
+def _overlap(a, b):
+    """Intersection over union of two (x, y, w, h) rectangles."""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    intersection = ix * iy
+    return intersection / float(a[2] * a[3] + b[2] * b[3] - intersection)
+
+def _locate_plates(image, max_candidates=None, roi=None):
+    """
+    Find the most plate-like regions in a decoded BGR image.
+    
+    The search (grayscale, bilateral filter, Canny, contours) runs on a copy
+    of the frame, or of its gate ROI, downscaled to PLATE_SEARCH_WIDTH;
+    only the winning rectangles are mapped back and cropped from the full
+    resolution frame. Contours are visited largest first and the search
+    stops once ``max_candidates`` strong outlines have been found.
+    
+    Args:
+        image: A Frame, or the BGR image as a NumPy array
+        max_candidates: Number of candidates to return (PLATE_MAX_CANDIDATES)
+        roi: Optional (x, y, w, h) region of the frame to search
+        
+    Returns:
+        List of PlateCandidate tuples, best score first (empty if none)
+    """
+    if max_candidates is None:
+        max_candidates = app.config.get('PLATE_MAX_CANDIDATES', 3)
+    
+    full_gray = Frame.of(image).gray
+    offset_x, offset_y = 0, 0
+    region = full_gray
+    if roi is not None:
+        x, y, w, h = roi
+        offset_x, offset_y = max(0, x), max(0, y)
+        region = full_gray[offset_y:y + h, offset_x:x + w]
+        if region.size == 0:
+            return []
+    
+    # Search a downscaled copy; plates stay a few dozen pixels wide at 640
+    height, width = region.shape[:2]
+    scale = min(1.0, app.config.get('PLATE_SEARCH_WIDTH', 640) / float(width))
+    gray = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else region
+    
+    filtered = cv2.bilateralFilter(gray, 11, 17, 17)
+    edged = cv2.Canny(filtered, 30, 200)
+    contours, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:30]
+    
+    frame_area = gray.shape[0] * gray.shape[1]
+    scored = []
+    strong = 0
+    for contour in contours:
+        score, rect = _score_plate_contour(contour, frame_area)
+        if rect is None:
+            continue
+        scored.append((score, rect))
+        if score >= PLATE_STRONG_SCORE:
+            strong += 1
+            if strong >= max_candidates:
+                break
+    
+    # Best first, dropping outlines of the same plate (inner and outer edges)
+    kept = []
+    for score, rect in sorted(scored, key=lambda item: item[0], reverse=True):
+        if all(_overlap(rect, other) < 0.3 for _, other in kept):
+            kept.append((score, rect))
+            if len(kept) == max_candidates:
+                break
+    
+    candidates = []
+    for score, (x, y, w, h) in kept:
+        # Back to full resolution, with a small margin for the characters' edges
+        pad = 2
+        x0 = offset_x + max(0, int((x - pad) / scale))
+        y0 = offset_y + max(0, int((y - pad) / scale))
+        x1 = offset_x + min(width, int((x + w + pad) / scale))
+        y1 = offset_y + min(height, int((y + h + pad) / scale))
+        # Unfiltered; the recognizer does its own cleanup
+        crop = full_gray[y0:y1, x0:x1]
+        candidates.append(PlateCandidate(crop, (x0, y0, x1 - x0, y1 - y0), score))
+    
+    # Keep a sample of plate crops for debugging (off by default)
+    if candidates and debug_artifacts.should_capture('plate'):
+        debug_artifacts.save('plate', candidates[0].crop)
+    
+    return candidates
+
+def find_plates_in_images(images, roi=None):
+    """
+    Locate and read license plates in a batch of decoded BGR images.
+    
+    The candidate crops of all images go through the recognizer in one
+    call; for each image the most confident plausible read wins.
+    
+    Args:
+        images: List of Frames or BGR arrays (e.g. consecutive video frames)
+        roi: Optional (x, y, w, h) gate region to search in every image
+        
+    Returns:
+        List with a (plate_number, confidence) tuple per image, (None, 0)
+        where no plate was found or read; plate numbers are normalised
+    """
+    results = [(None, 0)] * len(images)
+    
+    owners, crops = [], []
+    for i, image in enumerate(images):
+        if image is None:
+            continue
+        for candidate in _locate_plates(image, roi=roi):
+            owners.append(i)
+            crops.append(candidate.crop)
+    if not crops:
+        logger.warning("No license plate detected in the image")
+        return results
+    
+    recognizer = get_recognizer()
+    if recognizer is None:
+        logger.warning("No plate OCR backend available - plate text cannot be read")
+        return results
+    
+    min_confidence = app.config.get('PLATE_OCR_MIN_CONFIDENCE', 0.5)
+    for i, (plate_text, confidence) in zip(owners, recognizer.recognize(crops)):
+        if plate_text and is_plausible_plate(plate_text) and confidence >= min_confidence:
+            if confidence > results[i][1]:
+                results[i] = (plate_text, confidence)
+        else:
+            logger.debug(f"Plate candidate not readable (read '{plate_text}', confidence {confidence:.2f})")
+    
+    for plate_text, confidence in results:
+        if plate_text:
+            logger.info(f"Detected plate: {plate_text} with confidence {confidence:.2f}")
+    
+    return results
+
+def find_plate_in_image(image, roi=None):
+    """
+    Locate and read a license plate in a decoded image.
+    
+    Args:
+        image: A Frame, or the BGR image as a NumPy array
+        roi: Optional (x, y, w, h) gate region to search instead of the whole frame
+        
+    Returns:
+        Tuple of (plate_number, confidence) or (None, 0) if no plate detected
+    """
+    return find_plates_in_images([image], roi=roi)[0]
+
+def process_plate_detection(image_data, camera_id=None):
+    """
+    Process an image for license plate detection.
+    
+    Args:
+        image_data: The raw image file bytes
+        camera_id: Optional gate camera, whose PLATE_GATE_ROIS region is searched
         
     Returns:
         Tuple of (plate_number, confidence) or (None, 0) if no plate detected
     """
     try:
         if CV_LIBRARIES_AVAILABLE:
-            # Read the image file
-            image_stream = file.read()
-            image = np.asarray(bytearray(image_stream), dtype=np.uint8)
-            image = cv2.imdecode(image, cv2.IMREAD_COLOR)
-            
-            # Convert to grayscale for better processing
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply blur to reduce noise
-            gray = cv2.bilateralFilter(gray, 11, 17, 17)
-            
-            # Find edges
-            edged = cv2.Canny(gray, 30, 200)
-            
-            # Find contours
-            contours, _ = cv2.findContours(edged.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-            contours = sorted(contours, key=cv2.contourArea, reverse=True)[:10]
-            
-            # Create a copy of the original image for drawing
-            img_contours = image.copy()
-            cv2.drawContours(img_contours, contours, -1, (0, 255, 0), 3)
-            
-            # Variables to store the best plate candidate
-            plate_contour = None
-            plate_rect = None
-            max_rect_area = 0
-            
-            # Find the contour with 4 points (license plate is rectangular)
-            for contour in contours:
-                perimeter = cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
-                
-                # Look for contours with 4 points (rectangle shape)
-                if len(approx) == 4:
-                    # Check if it's a reasonable size for a license plate
-                    x, y, w, h = cv2.boundingRect(approx)
-                    aspect_ratio = float(w) / h
-                    
-                    # License plates typically have an aspect ratio between 2 and 5
-                    if 1.5 <= aspect_ratio <= 5.0:
-                        rect_area = w * h
-                        
-                        # Keep track of the largest rectangle that meets our criteria
-                        if rect_area > max_rect_area:
-                            max_rect_area = rect_area
-                            plate_contour = approx
-                            plate_rect = (x, y, w, h)
-            
-            if plate_contour is not None and plate_rect is not None:
-                # Extract the plate region
-                x, y, w, h = plate_rect
-                plate_img = gray[y:y+h, x:x+w]
-                
-                # Apply thresholding to prepare for OCR
-                _, thresh = cv2.threshold(plate_img, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-                
-                # Save the license plate image for debugging
-                debug_path = os.path.join(app.config['UPLOAD_FOLDER'], 'debug_plate.jpg')
-                cv2.imwrite(debug_path, plate_img)
-                
-                # Here, you would use a real OCR library like Tesseract
-                # Placeholder for OCR implementation
-                letters = ''.join(random.choices(string.ascii_uppercase, k=3))
-                numbers = ''.join(random.choices(string.digits, k=4))
-                plate_text = f"{letters}-{numbers}"
-                
-                # In a real system, you would calculate confidence based on OCR results
-                confidence = 0.85  # Placeholder confidence value
-                
-                logger.info(f"Detected plate: {plate_text} with confidence {confidence:.2f}")
-                return plate_text, confidence
-            
-            logger.warning("No license plate detected in the image")
-            return None, 0
+            # Run the plate finder in a CV worker process
+            return cv_pool.run('plate', _detect_plate, image_data, plate_gate_roi(camera_id))
         else:
             # Placeholder implementation
             logger.info("Using placeholder license plate detection implementation")
@@ -226,112 +473,155 @@ def process_plate_detection(file):
             logger.info(f"Simulated plate detection: {plate_text} with confidence {confidence:.2f}")
             return plate_text, confidence
     
+    except CVWorkerError:
+        raise
     except Exception as e:
         logger.error(f"Error in plate detection: {str(e)}")
         return None, 0
 
-def analyze_parking_spaces(file):
+# Result of scoring one parking frame: aligned space IDs, occupancy ratios
+# (NaN where a space was not re-scored) and changed flags, plus the frame's
+# grayscale image to use as the next reference
+ParkingScores = namedtuple('ParkingScores', ['space_ids', 'ratios', 'changed', 'gray'])
+
+def _parking_ratios(image_stream, calibration, space_ids, reference=None, change_threshold=0.0, pixel_delta=25):
     """
-    Process an image file to analyze parking spaces.
+    Score parking space occupancy ratios in an encoded image (runs in a CV worker).
+    
+    All spaces are scored in one batched pass: the frame is thresholded
+    once, and the fraction of feature pixels inside every space comes from
+    a single integral image (see CompiledCalibration.score).
+    
+    With a reference frame, spaces whose ROI changed by less than
+    ``change_threshold`` (fraction of pixels that moved by more than
+    ``pixel_delta``) are not re-scored, and only the part of the frame
+    covering the changed ROIs is thresholded.
     
     Args:
-        file: The uploaded image file
+        image_stream: The raw image file bytes
+        calibration: CompiledCalibration for the camera, or None to split
+            the frame into a grid with one cell per space
+        space_ids: IDs of the parking spaces, in grid order (grid only)
+        reference: Optional grayscale frame previously scored for this camera
+        
+    Returns:
+        ParkingScores
+    """
+    # Only grayscale is needed; calibrated cameras are scored at calibration
+    # size, so decode no larger than that
+    reduce = reduction_for(image_stream, calibration.width, calibration.height) if calibration is not None else 1
+    frame = Frame.decode(image_stream, reduce=reduce, grayscale=True)
+    if frame is None:
+        raise ValueError("Unreadable image")
+    gray = frame.gray
+    
+    if calibration is None:
+        # Uncalibrated camera: each grid cell corresponds to a parking space
+        h, w = gray.shape
+        calibration = CompiledCalibration.grid(space_ids, w, h)
+    elif gray.shape != (calibration.height, calibration.width):
+        # Score in the geometry the ROIs were drawn in
+        gray = cv2.resize(gray, (calibration.width, calibration.height), interpolation=cv2.INTER_AREA)
+    
+    if reference is not None and reference.shape == gray.shape:
+        # Which ROIs differ from the last frame scored for this camera
+        moved = cv2.absdiff(gray, reference) > pixel_delta
+        changed = calibration.score(moved) > change_threshold
+    else:
+        changed = np.ones(len(calibration.space_ids), dtype=bool)
+    
+    ratios = np.full(len(calibration.space_ids), np.nan)
+    if not changed.any():
+        return ParkingScores(calibration.space_ids, ratios, changed, gray)
+    
+    # Only threshold the part of the frame the changed ROIs cover, with a
+    # margin for the blur and adaptive threshold windows
+    h, w = gray.shape
+    rects = calibration.rects[changed[calibration.rect_space]]
+    margin = 8
+    x0, y0 = max(0, rects[:, 0].min() - margin), max(0, rects[:, 1].min() - margin)
+    x1, y1 = min(w, rects[:, 2].max() + margin), min(h, rects[:, 3].max() + margin)
+    
+    # Apply Gaussian blur to reduce noise
+    blurred = cv2.GaussianBlur(gray[y0:y1, x0:x1], (5, 5), 0)
+    
+    # Apply adaptive thresholding to get binary image (white = car features)
+    thresh = np.zeros_like(gray)
+    thresh[y0:y1, x0:x1] = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                 cv2.THRESH_BINARY_INV, 11, 2)
+    
+    ratios[changed] = calibration.score(thresh)[changed]
+    
+    if debug_artifacts.should_capture('parking'):
+        debug_artifacts.save('parking', thresh)
+    
+    return ParkingScores(calibration.space_ids, ratios, changed, gray)
+
+def analyze_parking_spaces(image_data, space_ids, calibration=None, previous=None, reference=None):
+    """
+    Process an image to analyze parking spaces.
+    
+    A space only changes state once its occupancy ratio crosses the far
+    hysteresis threshold (PARKING_OCCUPIED_THRESHOLD going up,
+    PARKING_VACANT_THRESHOLD going down, or the space's own calibrated
+    thresholds), so ratios hovering around a single cut-off don't flip
+    it on every frame.
+    
+    Args:
+        image_data: The raw image file bytes
+        space_ids: IDs of the organization's parking spaces, in grid order
+        calibration: Optional CompiledCalibration for the camera; when given
+            only the spaces with an ROI in this camera's view are scored
+        previous: Optional dict of space ID to current occupancy status
+        reference: Optional grayscale frame last scored for this camera;
+            spaces that did not change since are left out of the results
         
     Returns:
-        Dictionary mapping parking space IDs to occupancy status (True/False)
+        Tuple of (dict mapping the scored parking space IDs to occupancy
+        status (True/False), ParkingScores or None without CV libraries)
     """
     try:
-        # Get all parking spaces from the database
-        spaces = ParkingSpace.query.all()
         results = {}
+        scores = None
+        previous = previous or {}
         
         if CV_LIBRARIES_AVAILABLE:
-            # Read the image file
-            image_stream = file.read()
-            image = np.asarray(bytearray(image_stream), dtype=np.uint8)
-            image = cv2.imdecode(image, cv2.IMREAD_COLOR)
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply Gaussian blur to reduce noise
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            
-            # Apply adaptive thresholding to get binary image
-            thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                           cv2.THRESH_BINARY_INV, 11, 2)
-            
-            # In a real implementation, you would:
-            # 1. Have predefined coordinates for each parking space in your database
-            # 2. Extract features from each space region in the image
-            # 3. Use a machine learning model to classify if the space is occupied
-            
-            # For demonstration purposes, we'll implement a simple approach:
-            # - Dividing the image into a grid
-            # - Each grid cell corresponds to a parking space
-            # - Check the white pixel density in each cell to determine occupancy
-            
-            if spaces:
-                # Create a grid based on the number of spaces
-                num_spaces = len(spaces)
-                grid_size = int(np.ceil(np.sqrt(num_spaces)))
+            if space_ids:
+                # Score all spaces in a CV worker process
+                scores = cv_pool.run('parking', _parking_ratios, image_data, calibration, list(space_ids),
+                                     reference, app.config['PARKING_CHANGE_THRESHOLD'])
+                
+                if calibration is not None:
+                    occupied_above, vacant_below = calibration.thresholds(
+                        app.config['PARKING_OCCUPIED_THRESHOLD'], app.config['PARKING_VACANT_THRESHOLD'])
+                else:
+                    occupied_above = app.config['PARKING_OCCUPIED_THRESHOLD']
+                    vacant_below = app.config['PARKING_VACANT_THRESHOLD']
                 
-                # Divide the image into a grid
-                h, w = thresh.shape
-                cell_h, cell_w = h // grid_size, w // grid_size
+                was_occupied = np.array([bool(previous.get(int(space_id), False)) for space_id in scores.space_ids], dtype=bool)
+                occupied = apply_hysteresis(scores.ratios, was_occupied, occupied_above, vacant_below)
                 
-                for i, space in enumerate(spaces):
-                    if i >= grid_size * grid_size:
-                        break
-                        
-                    # Calculate grid cell position
-                    row, col = i // grid_size, i % grid_size
-                    y1, x1 = row * cell_h, col * cell_w
-                    y2, x2 = min(y1 + cell_h, h), min(x1 + cell_w, w)
-                    
-                    # Extract the cell
-                    cell = thresh[y1:y2, x1:x2]
-                    
-                    # Count white pixels (car features in the binary image)
-                    white_pixel_count = np.sum(cell > 0)
-                    
-                    # Calculate the percentage of white pixels in the cell
-                    white_pixel_percentage = white_pixel_count / (cell.shape[0] * cell.shape[1])
-                    
-                    # Determine if space is occupied based on white pixel density
-                    # (This threshold would be tuned based on your specific images)
-                    is_occupied = white_pixel_percentage > 0.15
-                    
-                    # Store the result
-                    results[space.id] = is_occupied
-                    
-                    # Debug: Draw the grid on the original image
-                    cv2.rectangle(image, (x1, y1), (x2, y2), 
-                                 (0, 0, 255) if is_occupied else (0, 255, 0), 2)
-                    
-                # Save the debug image
-                debug_path = os.path.join(app.config['UPLOAD_FOLDER'], 'debug_parking.jpg')
-                cv2.imwrite(debug_path, image)
+                visible = set(space_ids)
+                results = {
+                    int(space_id): bool(is_occupied)
+                    for space_id, is_occupied, changed in zip(scores.space_ids, occupied, scores.changed)
+                    if changed and int(space_id) in visible
+                }
             else:
                 logger.warning("No parking spaces defined in the database")
-            
-            # If we didn't process all spaces (e.g., more spaces than grid cells)
-            # Fill in the missing results
-            for space in spaces:
-                if space.id not in results:
-                    # Randomly determine occupancy for demo purposes
-                    results[space.id] = random.choice([True, False])
         else:
             # Placeholder implementation
             logger.info("Using placeholder parking space analysis implementation")
             
-            for space in spaces:
+            for space_id in space_ids:
                 # Randomly determine if space is occupied (for demo purposes)
-                results[space.id] = random.choice([True, False])
+                results[space_id] = random.choice([True, False])
         
         logger.info(f"Analyzed {len(results)} parking spaces")
-        return results
+        return results, scores
     
+    except CVWorkerError:
+        raise
     except Exception as e:
         logger.error(f"Error in parking space analysis: {str(e)}")
-        return {}
\ No newline at end of file
+        return {}, None
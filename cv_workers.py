@@ -0,0 +1,198 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+class CVWorkerError(Exception):
+    """Base class for errors raised by the CV worker tier."""
+
+class CVOverloadedError(CVWorkerError):
+    """Raised when a job is rejected because the queue for its type is full."""
+
+class CVTimeoutError(CVWorkerError):
+    """Raised when a job does not finish within its configured timeout."""
+
+def _init_worker():
+    """
+    Prepare a freshly forked CV worker process.
+
+    Drops the database connections inherited from the parent without closing
+    them (closing would tear down the parent's sockets), pins OpenCV to one
+    thread so workers don't oversubscribe the CPU, and runs the face detector
+    once so the dlib models are loaded before the first real job arrives.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    try:
+        import numpy as np
+        import cv2
+        cv2.setNumThreads(1)
+
+        import face_recognition
+        face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8), model="hog")
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"CV worker model preload failed: {str(e)}")
+
+class CVWorkerPool:
+    """
+    Process pool that runs CPU-heavy computer vision jobs off the request thread.
+
+    Each job type ('face', 'plate', 'parking') has its own concurrency limit
+    and timeout, and the pool as a whole accepts at most CV_QUEUE_LIMIT jobs
+    in flight (running or waiting). A job that would exceed either limit is
+    rejected immediately with CVOverloadedError instead of queueing without
+    bound, unless the caller asks to wait for a slot up to a deadline. The executor is created lazily so every gunicorn worker forks its
+    own pool after start-up. With CV_POOL_WORKERS = 0 jobs run inline.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._queue_slots = None
+        self._job_slots = {}
+
+    @property
+    def enabled(self):
+        return app.config.get('CV_POOL_WORKERS', 0) > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                workers = app.config['CV_POOL_WORKERS']
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=_init_worker,
+                )
+                self._queue_slots = threading.BoundedSemaphore(app.config.get('CV_QUEUE_LIMIT', 2 * workers))
+                logger.info(f"Started CV worker pool with {workers} processes")
+            return self._executor
+
+    def _slots_for(self, job_type):
+        with self._lock:
+            if job_type not in self._job_slots:
+                limit = app.config.get('CV_JOB_CONCURRENCY', {}).get(job_type, 1)
+                self._job_slots[job_type] = threading.BoundedSemaphore(limit)
+            return self._job_slots[job_type]
+
+    def submit(self, job_type, fn, *args, wait=False, deadline=None):
+        """
+        Queue a job on the pool.
+
+        Args:
+            job_type: Limit bucket for the job ('face', 'plate', 'parking')
+            fn: Module-level function to run in the worker process
+            *args: Picklable arguments for ``fn``
+            wait: Wait for a free slot instead of rejecting the job at once
+            deadline: time.monotonic() value bounding the wait, or None
+
+        Returns:
+            A concurrent.futures.Future for the job's result
+
+        Raises:
+            CVOverloadedError: If the job type or the pool is at capacity
+            CVTimeoutError: If ``wait`` is set and no slot freed up before the deadline
+        """
+        if not self.enabled:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        executor = self._get_executor()
+        job_slots = self._slots_for(job_type)
+        queue_slots = self._queue_slots
+
+        if not _acquire(job_slots, wait, deadline):
+            if wait:
+                raise CVTimeoutError(f"No {job_type} worker free before the deadline")
+            raise CVOverloadedError(f"Too many concurrent {job_type} jobs")
+        if not _acquire(queue_slots, wait, deadline):
+            job_slots.release()
+            if wait:
+                raise CVTimeoutError("No CV worker queue slot free before the deadline")
+            raise CVOverloadedError("CV worker queue is full")
+
+        def release(_):
+            job_slots.release()
+            queue_slots.release()
+
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            release(None)
+            self._reset()
+            raise CVOverloadedError("CV worker pool is restarting")
+
+        # Slots are held until the job really finishes, even if the caller timed out
+        future.add_done_callback(release)
+        return future
+
+    def result(self, job_type, future, deadline=None):
+        """
+        Wait for a submitted job.
+
+        Args:
+            job_type: The job's limit bucket, used to pick the timeout
+            future: Future returned by ``submit``
+            deadline: Optional time.monotonic() value shared by several jobs
+
+        Raises:
+            CVTimeoutError: If the job does not finish in time
+        """
+        if deadline is None:
+            timeout = app.config.get('CV_JOB_TIMEOUTS', {}).get(job_type)
+        else:
+            timeout = max(0.0, deadline - time.monotonic())
+
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise CVTimeoutError(f"{job_type} job timed out after {timeout:.1f}s")
+        except BrokenProcessPool:
+            self._reset()
+            raise CVOverloadedError("CV worker pool is restarting")
+
+    def run(self, job_type, fn, *args):
+        """Submit a job and wait for its result."""
+        return self.result(job_type, self.submit(job_type, fn, *args))
+
+    def deadline(self, job_type):
+        """Deadline for a group of jobs of one type submitted together."""
+        timeout = app.config.get('CV_JOB_TIMEOUTS', {}).get(job_type)
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            logger.error("CV worker pool broken, recreating")
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def _acquire(slots, wait, deadline):
+    if not wait:
+        return slots.acquire(blocking=False)
+    if deadline is None:
+        return slots.acquire()
+    return slots.acquire(timeout=max(0.0, deadline - time.monotonic()))
+
+# Shared pool for this process
+cv_pool = CVWorkerPool()
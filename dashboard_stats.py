@@ -0,0 +1,105 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import app, db
+from models import AttendanceRecord, ParkingSpace, PlateDetectionRollup
+
+def _query_face_count(user_id):
+    """Count a user's check-ins today."""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return db.session.execute(
+        db.select(func.count())
+        .select_from(AttendanceRecord)
+        .where(AttendanceRecord.user_id == user_id, AttendanceRecord.check_in_time >= today)
+    ).scalar_one()
+
+def _query_organization_stats(organization):
+    """Compute an organization's admin dashboard numbers in a single round-trip."""
+    # Summed from the hourly rollup: stays small, and still counts logs retention has removed
+    plate_count = (
+        db.select(func.coalesce(func.sum(PlateDetectionRollup.detections), 0))
+        .where(PlateDetectionRollup.organization_id == organization)
+        .scalar_subquery()
+    )
+    # Both parking figures come from one pass over the organization's spaces
+    row = db.session.execute(
+        db.select(
+            func.count(ParkingSpace.id),
+            func.count(ParkingSpace.id).filter(ParkingSpace.is_occupied.is_(True)),
+            plate_count,
+        ).where(ParkingSpace.organization_id == organization)
+    ).one()
+    parking_spaces, occupied_spaces, plates = row
+    return {
+        "plate_count": plates,
+        "parking_spaces": parking_spaces,
+        "occupied_spaces": occupied_spaces,
+        "free_spaces": parking_spaces - occupied_spaces,
+    }
+
+class DashboardStats:
+    """
+    Short-lived per-process cache of dashboard numbers.
+
+    The organization-wide admin figures are cached once per organization
+    and each user's check-in count once per user, so every admin of an
+    organization shares one aggregate query. Entries live for
+    DASHBOARD_STATS_TTL seconds. Writes that change the figures invalidate
+    their organization (or user) here; writes made by other processes show
+    up once the entry expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, organization, user_id, admin=False):
+        """
+        Dashboard numbers for a user.
+
+        Returns:
+            Dict with face_count (the user's check-ins today) and, for
+            admins, plate_count, parking_spaces, occupied_spaces and
+            free_spaces for the organization
+        """
+        stats = {"face_count": self._cached(('user', user_id), _query_face_count, user_id)}
+        if admin:
+            stats.update(self._cached(('organization', organization), _query_organization_stats, organization))
+        return stats
+
+    def _cached(self, key, query, arg):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        value = query(arg)
+        ttl = app.config.get('DASHBOARD_STATS_TTL', 5)
+        with self._lock:
+            self._entries[key] = (now + ttl, value)
+            # Drop expired entries so users who left don't accumulate
+            if len(self._entries) > 1024:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+        return value
+
+    def invalidate(self, organization=None, user_ids=None):
+        """
+        Drop cached numbers after a write.
+
+        Args:
+            organization: Drop the organization-wide figures of this organization
+            user_ids: Drop the check-in counts of these users
+        """
+        keys = {('user', user_id) for user_id in user_ids or ()}
+        if organization is not None:
+            keys.add(('organization', organization))
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+# Shared cache for this process
+dashboard_stats = DashboardStats()
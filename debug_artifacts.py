@@ -0,0 +1,104 @@
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app import app
+from background import BackgroundWriter
+
+logger = logging.getLogger(__name__)
+
+class DebugArtifacts:
+    """
+    Sampled debug images from the CV pipelines.
+
+    Off unless DEBUG_ARTIFACTS is set. When on, ``should_capture`` selects
+    one call in DEBUG_ARTIFACT_SAMPLE_RATE per kind, so callers only pay for
+    a copy of the image when it will actually be kept. ``save`` hands the
+    image to a background thread that JPEG-encodes it under a unique name in
+    DEBUG_ARTIFACT_FOLDER and then prunes the folder to
+    DEBUG_ARTIFACT_MAX_AGE seconds and DEBUG_ARTIFACT_MAX_BYTES in total.
+    """
+
+    PRUNE_EVERY = 20  # writes between retention passes
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._writes = itertools.count(1)
+        self._writer = BackgroundWriter("debug-artifacts", maxsize=16)
+
+    @property
+    def enabled(self):
+        return app.config.get('DEBUG_ARTIFACTS', False)
+
+    def should_capture(self, kind):
+        """Whether this call of ``kind`` is sampled for a debug image."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            counter = self._counters.setdefault(kind, itertools.count())
+        return next(counter) % max(1, app.config.get('DEBUG_ARTIFACT_SAMPLE_RATE', 100)) == 0
+
+    def save(self, kind, image):
+        """
+        Write an image in the background.
+
+        The caller must not modify ``image`` afterwards; pass a copy if it
+        is a view of a buffer that is still in use.
+
+        Returns:
+            False if the write was dropped because the writer is backed up
+        """
+        folder = app.config['DEBUG_ARTIFACT_FOLDER']
+        filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.jpg"
+        return self._writer.submit(self._write, folder, filename, image)
+
+    def _write(self, folder, filename, image):
+        import cv2
+
+        ok, encoded = cv2.imencode('.jpg', image)
+        if not ok:
+            return
+
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, filename)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(path + '.tmp', path)
+
+        if next(self._writes) % self.PRUNE_EVERY == 0:
+            self.prune(folder)
+
+    def prune(self, folder=None):
+        """Delete artifacts past the age limit, then the oldest over the size limit."""
+        folder = folder or app.config['DEBUG_ARTIFACT_FOLDER']
+        max_age = app.config.get('DEBUG_ARTIFACT_MAX_AGE', 86400)
+        max_bytes = app.config.get('DEBUG_ARTIFACT_MAX_BYTES', 100 * 1024 * 1024)
+
+        try:
+            entries = [entry for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith('.jpg')]
+        except FileNotFoundError:
+            return
+
+        files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+        cutoff = time.time() - max_age
+        total = 0
+        removed = 0
+        for mtime, size, path in files:
+            total += size
+            if mtime < cutoff or total > max_bytes:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+
+        if removed:
+            logger.debug(f"Pruned {removed} debug artifacts")
+
+# Shared sampler for this process
+debug_artifacts = DebugArtifacts()
@@ -0,0 +1,242 @@
+import logging
+from datetime import datetime
+
+from app import db
+from models import User, AttendanceRecord, PlateDetectionLog
+from tracking import attendance_tracker, plate_tracker
+from plate_ocr import normalize_plate
+from plate_index import plate_index
+from rollups import count_check_ins, count_plate_detections
+from live_events import live_events
+from log_writer import log_writer
+from dashboard_stats import dashboard_stats
+
+logger = logging.getLogger(__name__)
+
+def record_attendance(user_ids, detection_method='face_recognition', sync=False):
+    """
+    Check users in, or out if they already have an open record for today.
+
+    A user recognized again within ATTENDANCE_DEDUP_WINDOW of their last
+    sighting is not toggled again; their event is repeated with
+    ``repeat`` set and the sighting count. The remaining records are loaded
+    with one query and changed in the current session; the caller commits.
+    With LOG_WRITE_BEHIND, new check-in records are queued on the log
+    writer instead (check-outs update their record straight away).
+
+    Args:
+        user_ids: IDs of the recognized users
+        detection_method: Stored on newly created records
+        sync: Insert check-ins in the caller's transaction even with LOG_WRITE_BEHIND
+
+    Returns:
+        List of dicts with user_id, type (check_in/check_out), time,
+        repeat and count
+    """
+    if not user_ids:
+        return []
+
+    sightings = {}
+    for user_id in user_ids:
+        sightings[user_id] = attendance_tracker.observe(user_id)
+
+    to_toggle = [u for u, (sighting, repeat) in sightings.items() if not repeat or sighting.state is None]
+    open_by_user = {}
+    if to_toggle:
+        # A check-out needs the check-in row, which may still be queued
+        if {record.user_id for record in log_writer.pending_records(AttendanceRecord)} & set(to_toggle):
+            log_writer.flush()
+        today = datetime.now().date()
+        open_records = AttendanceRecord.query.filter(
+            AttendanceRecord.user_id.in_(to_toggle),
+            AttendanceRecord.check_in_time >= today,
+            AttendanceRecord.check_out_time.is_(None)
+        ).all()
+        for record in open_records:
+            open_by_user.setdefault(record.user_id, record)
+
+    events = []
+    check_ins = []
+    check_outs = []
+    now = datetime.now()
+    for user_id, (sighting, repeat) in sightings.items():
+        if user_id not in to_toggle:
+            # Still in front of the camera: report the event we already recorded
+            event_type, event_time = sighting.state
+            events.append({"user_id": user_id, "type": event_type, "time": event_time,
+                           "repeat": True, "count": sighting.count})
+            continue
+
+        existing_record = open_by_user.get(user_id)
+        if existing_record:
+            # Mark checkout time
+            existing_record.check_out_time = now
+            check_outs.append(user_id)
+            event = {"user_id": user_id, "type": "check_out", "time": now.strftime("%H:%M:%S")}
+        else:
+            # Create new attendance record
+            new_record = AttendanceRecord(
+                user_id=user_id,
+                check_in_time=datetime.utcnow(),
+                detection_method=detection_method
+            )
+            check_ins.append(new_record)
+            event = {"user_id": user_id, "type": "check_in", "time": new_record.check_in_time.strftime("%H:%M:%S")}
+
+        sighting.state = (event["type"], event["time"])
+        event.update(repeat=False, count=sighting.count)
+        events.append(event)
+
+    if check_ins:
+        if log_writer.enabled and not sync:
+            for record in check_ins:
+                log_writer.add(record)
+        else:
+            db.session.add_all(check_ins)
+            _check_ins_written(check_ins)
+    if check_outs:
+        organizations = _user_organizations(check_outs)
+        by_organization = {}
+        for user_id in check_outs:
+            by_organization.setdefault(organizations.get(user_id), []).append(user_id)
+        for organization, organization_user_ids in by_organization.items():
+            live_events.stage(organization, 'attendance', {"check_ins": {}, "check_outs": organization_user_ids})
+
+    return events
+
+def _user_organizations(user_ids):
+    return dict(db.session.query(User.id, User.organization).filter(User.id.in_(user_ids)).all())
+
+def _check_ins_written(records):
+    """Count new check-in records into the rollup and tell their organizations' dashboards."""
+    organizations = _user_organizations({record.user_id for record in records})
+    count_check_ins((record.user_id, record.check_in_time) for record in records)
+
+    # check_ins maps the day they count towards in reports to the users
+    by_organization = {}
+    for record in records:
+        days = by_organization.setdefault(organizations.get(record.user_id), {})
+        days.setdefault(record.check_in_time.date().isoformat(), []).append(record.user_id)
+    for organization, days in by_organization.items():
+        live_events.stage(organization, 'attendance', {"check_ins": days, "check_outs": []})
+
+def _check_ins_committed(records):
+    dashboard_stats.invalidate(user_ids={record.user_id for record in records})
+
+log_writer.register(AttendanceRecord, _check_ins_written, _check_ins_committed)
+
+def record_plate_detection(plate_number, confidence, organization, image_path=None, location=None, sync=False):
+    """
+    Look up a detected plate and log the detection.
+
+    The read is matched against the organization's registered plates in
+    the cached plate index, tolerating small OCR errors (see PlateIndex).
+    The entry keeps the plate as read, with the registered plate it matched
+    in ``matched_plate``; it is authorized only if the two differ by OCR
+    confusions at most.
+    A plate seen again at the same location within PLATE_DEDUP_WINDOW of its
+    last sighting updates the existing log entry's last_seen, detection_count
+    and best confidence instead of adding a new row.
+
+    Args:
+        plate_number: The recognized plate text (normalised before lookup)
+        confidence: Detection confidence (0-1)
+        organization: Organization the detection belongs to
+        image_path: Optional path of the evidence image, relative to static
+        location: Optional camera/gate description
+        sync: Insert a new entry in the caller's transaction even with LOG_WRITE_BEHIND
+
+    Returns:
+        Tuple of (PlateDetectionLog, PlateMatch or None); the caller commits.
+        With LOG_WRITE_BEHIND a new entry is queued on the log writer and
+        returned unsaved (no id yet) unless ``sync`` is set.
+    """
+    plate_number = normalize_plate(plate_number)
+    match = plate_index.match(plate_number, organization)
+    plate_record = match.plate if match else None
+
+    # Reads that differ only by OCR errors are the same vehicle
+    key_plate = plate_record.plate_number if plate_record else plate_number
+    sighting, repeat = plate_tracker.observe((organization, location, key_plate))
+    if repeat:
+        def update(log_entry):
+            log_entry.last_seen = sighting.last_seen
+            log_entry.detection_count = sighting.count
+            if confidence is not None and (log_entry.confidence is None or confidence > log_entry.confidence):
+                log_entry.confidence = confidence
+                if image_path:
+                    log_entry.image_path = image_path
+
+        pending = sighting.state
+        if pending is not None:
+            # The entry is still queued on the log writer: update it in the queue if we can
+            if log_writer.update(pending, update):
+                return pending.record, match
+            sighting.record_id = log_writer.wait(pending)
+            sighting.state = None
+
+        if sighting.record_id is not None:
+            # The timestamp narrows the lookup to the entry's monthly partition
+            log_entry = PlateDetectionLog.query.filter_by(
+                id=sighting.record_id, timestamp=sighting.first_seen
+            ).first()
+            if log_entry is not None:
+                update(log_entry)
+                live_events.stage(organization, 'plate', _plate_delta(log_entry, new=False))
+                return log_entry, match
+
+    log_entry = PlateDetectionLog(
+        plate_number=plate_number,
+        timestamp=sighting.first_seen,
+        last_seen=sighting.last_seen,
+        detection_count=1,
+        confidence=confidence,
+        matched_plate=plate_record.plate_number if plate_record else None,
+        is_authorized=bool(match and match.confusions_only and plate_record.is_authorized),
+        image_path=image_path,
+        location=location,
+        organization_id=organization
+    )
+
+    # Later sightings update this row; restart the count if the old row was lost
+    sighting.first_seen = log_entry.timestamp
+    sighting.count = 1
+
+    if log_writer.enabled and not sync:
+        sighting.record_id = None
+        sighting.state = log_writer.add(log_entry)
+        return log_entry, match
+
+    db.session.add(log_entry)
+    db.session.flush()
+    _plate_logs_written([log_entry])
+    sighting.record_id = log_entry.id
+    sighting.state = None
+    return log_entry, match
+
+def _plate_logs_written(log_entries):
+    """Count new plate detection log entries into the rollup and tell their organizations' dashboards."""
+    count_plate_detections(
+        (log_entry.organization_id, log_entry.timestamp, log_entry.is_authorized) for log_entry in log_entries
+    )
+    for log_entry in log_entries:
+        live_events.stage(log_entry.organization_id, 'plate', _plate_delta(log_entry, new=True))
+
+def _plate_logs_committed(log_entries):
+    for organization in {log_entry.organization_id for log_entry in log_entries}:
+        dashboard_stats.invalidate(organization)
+
+log_writer.register(PlateDetectionLog, _plate_logs_written, _plate_logs_committed)
+
+def _plate_delta(log_entry, new):
+    """Live event payload for a new or updated plate detection log entry."""
+    return {
+        "id": log_entry.id,
+        "plate_number": log_entry.plate_number,
+        "matched_plate": log_entry.matched_plate,
+        "is_authorized": bool(log_entry.is_authorized),
+        "location": log_entry.location,
+        "timestamp": log_entry.timestamp.isoformat(),
+        "detection_count": log_entry.detection_count,
+        "new": new
+    }
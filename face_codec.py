@@ -0,0 +1,103 @@
+import io
+import pickle
+import struct
+import logging
+
+import numpy as np
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+# face_recognition produces 128-dimensional encodings
+ENCODING_DIM = 128
+
+# Header: 2-byte magic, 1-byte format version, 1-byte dtype code
+MAGIC = b'KF'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<2sBB')
+
+# dtype code -> little-endian storage dtype
+DTYPES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+DTYPE_CODES = {'float32': 1, 'float16': 2}
+
+# Classes a legacy pickled encoding is allowed to reference
+_LEGACY_PICKLE_ALLOWED = {
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', 'scalar'),
+}
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Unpickler that only resolves the NumPy classes an encoding needs."""
+
+    def find_class(self, module, name):
+        if (module, name) not in _LEGACY_PICKLE_ALLOWED:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a face encoding")
+        return super().find_class(module, name)
+
+def is_binary_encoding(data):
+    """Check whether stored bytes already use the fixed-width format."""
+    return bytes(data[:2]) == MAGIC
+
+def encode_encoding(encoding, dtype=None):
+    """
+    Serialize a face encoding to the fixed-width binary format.
+
+    Args:
+        encoding: 128-value NumPy array or list of floats
+        dtype: 'float32' or 'float16' (defaults to FACE_ENCODING_DTYPE)
+
+    Returns:
+        Header followed by the raw little-endian values
+    """
+    dtype = dtype or app.config.get('FACE_ENCODING_DTYPE', 'float32')
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported face encoding dtype: {dtype}")
+
+    code = DTYPE_CODES[dtype]
+    values = np.asarray(encoding, dtype=DTYPES[code]).reshape(-1)
+    if values.shape[0] != ENCODING_DIM:
+        raise ValueError(f"Expected a {ENCODING_DIM}-dim face encoding, got {values.shape[0]}")
+
+    return HEADER.pack(MAGIC, FORMAT_VERSION, code) + values.tobytes()
+
+def decode_encoding(data, allow_legacy=None):
+    """
+    Convert a stored or freshly computed face encoding to a float32 vector.
+
+    Binary float32 encodings are returned as a zero-copy view of ``data``.
+
+    Args:
+        data: Stored bytes, a NumPy array or a list of floats
+        allow_legacy: Accept pickled encodings written before the binary
+                      format (defaults to FACE_ENCODING_ALLOW_PICKLE)
+
+    Returns:
+        1-D float32 NumPy array of length ENCODING_DIM
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        if is_binary_encoding(data):
+            _, version, code = HEADER.unpack_from(data)
+            if version != FORMAT_VERSION or code not in DTYPES:
+                raise ValueError(f"Unsupported face encoding format v{version} dtype {code}")
+            values = np.frombuffer(data, dtype=DTYPES[code], count=ENCODING_DIM, offset=HEADER.size)
+            return values if values.dtype == np.float32 else values.astype(np.float32)
+
+        if allow_legacy is None:
+            allow_legacy = app.config.get('FACE_ENCODING_ALLOW_PICKLE', True)
+        if not allow_legacy:
+            raise ValueError("Pickled face encodings are disabled; run 'flask migrate-face-encodings'")
+        data = _LegacyUnpickler(io.BytesIO(bytes(data))).load()
+
+    encoding = np.asarray(data, dtype=np.float32).reshape(-1)
+    if encoding.shape[0] != ENCODING_DIM:
+        raise ValueError(f"Expected a {ENCODING_DIM}-dim face encoding, got {encoding.shape[0]}")
+
+    return encoding
@@ -0,0 +1,558 @@
+import os
+import logging
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func
+
+from app import app, db
+from models import FaceData
+from face_codec import ENCODING_DIM, decode_encoding
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per query when pulling new encodings from the database
+SYNC_BATCH_SIZE = 1000
+
+class EncodingBlock:
+    """
+    Contiguous float32 storage for a set of encodings.
+
+    Keeps the (N x dim) matrix, the squared row norms and parallel arrays of
+    FaceData ids and user ids, growing geometrically on append.
+    """
+
+    def __init__(self, dim=ENCODING_DIM):
+        self.dim = dim
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+        self.record_ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+    def extend(self, record_ids, user_ids, vectors):
+        """Append a batch of encodings."""
+        count = len(record_ids)
+        if not count:
+            return
+
+        needed = self.size + count
+        if needed > self.vectors.shape[0]:
+            capacity = max(16, needed, 2 * self.size)
+            self.vectors = _grow(self.vectors, capacity)
+            self.sq_norms = _grow(self.sq_norms, capacity)
+            self.record_ids = _grow(self.record_ids, capacity)
+            self.user_ids = _grow(self.user_ids, capacity)
+
+        end = self.size + count
+        self.vectors[self.size:end] = vectors
+        self.sq_norms[self.size:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self.record_ids[self.size:end] = record_ids
+        self.user_ids[self.size:end] = user_ids
+        self.size = end
+
+    def remove(self, mask):
+        """Drop the rows selected by a boolean mask over the live rows."""
+        keep = ~mask[:self.size]
+        removed = self.size - int(keep.sum())
+        if removed:
+            self.vectors = self.vectors[:self.size][keep]
+            self.sq_norms = self.sq_norms[:self.size][keep]
+            self.record_ids = self.record_ids[:self.size][keep]
+            self.user_ids = self.user_ids[:self.size][keep]
+            self.size -= removed
+        return removed
+
+    def nearest(self, queries):
+        """
+        Exact nearest row for each query.
+
+        Returns:
+            Tuple of (row positions, squared distances), one per query
+        """
+        vectors = self.vectors[:self.size]
+        # |a - b|^2 = |a|^2 - 2 a.b + |b|^2, evaluated for every row at once
+        sq_distances = self.sq_norms[:self.size][None, :] - 2.0 * (queries @ vectors.T)
+        sq_distances += np.einsum('ij,ij->i', queries, queries)[:, None]
+        positions = np.argmin(sq_distances, axis=1)
+        best = sq_distances[np.arange(len(queries)), positions]
+        return positions, np.maximum(best, 0.0)
+
+class ExactIndex:
+    """Brute-force index: every query is compared with every stored encoding."""
+
+    name = 'exact'
+
+    def __init__(self, dim=ENCODING_DIM):
+        self.dim = dim
+        self.block = EncodingBlock(dim)
+
+    def __len__(self):
+        return self.block.size
+
+    def record_ids(self):
+        return self.block.record_ids[:self.block.size]
+
+    def add(self, record_ids, user_ids, vectors):
+        self.block.extend(record_ids, user_ids, vectors)
+
+    def remove_records(self, record_ids):
+        return self.block.remove(np.isin(self.block.record_ids, record_ids))
+
+    def remove_user(self, user_id):
+        return self.block.remove(self.block.user_ids == user_id)
+
+    def search(self, queries):
+        """
+        Find the closest stored encoding for each query.
+
+        Returns:
+            Tuple of (user_ids, distances) arrays; user id -1 when empty
+        """
+        if not self.block.size:
+            return np.full(len(queries), -1, dtype=np.int64), np.full(len(queries), np.inf)
+
+        positions, sq_distances = self.block.nearest(queries)
+        return self.block.user_ids[positions], np.sqrt(sq_distances)
+
+    def arrays(self):
+        """Return (record_ids, user_ids, vectors, list_ids) for persistence."""
+        size = self.block.size
+        return (self.block.record_ids[:size], self.block.user_ids[:size],
+                self.block.vectors[:size], np.zeros(size, dtype=np.int32))
+
+    def save(self, path):
+        _save_index(path, self, centroids=None)
+
+    @classmethod
+    def from_arrays(cls, dim, centroids, record_ids, user_ids, vectors, list_ids, **kwargs):
+        index = cls(dim)
+        index.add(record_ids, user_ids, vectors)
+        return index
+
+class IVFIndex:
+    """
+    Inverted-file approximate index.
+
+    Encodings are clustered around ``nlist`` k-means centroids and stored in
+    one contiguous block per cluster. A query is compared with the centroids
+    first and then only with the encodings in its ``nprobe`` closest clusters,
+    so raising ``nprobe`` trades latency for recall (nprobe == nlist is exact).
+    Until enough encodings exist to train the centroids the index behaves like
+    a single flat list.
+    """
+
+    name = 'ivf'
+
+    # Minimum encodings per centroid before the quantizer is trained
+    MIN_POINTS_PER_LIST = 8
+    KMEANS_ITERATIONS = 10
+    KMEANS_SAMPLE_PER_LIST = 256
+
+    def __init__(self, dim=ENCODING_DIM, nlist=0, nprobe=8):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self.lists = [EncodingBlock(dim)]
+        self._user_lists = {}
+
+    def __len__(self):
+        return sum(block.size for block in self.lists)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def record_ids(self):
+        return np.concatenate([block.record_ids[:block.size] for block in self.lists])
+
+    def _target_nlist(self, count):
+        if self.nlist:
+            return self.nlist
+        return max(1, int(4 * np.sqrt(count)))
+
+    def _assign(self, vectors):
+        sq_distances = (np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+                        - 2.0 * (vectors @ self.centroids.T))
+        return np.argmin(sq_distances, axis=1)
+
+    def train(self, vectors, seed=0):
+        """Fit the coarse quantizer with a few rounds of k-means."""
+        nlist = self._target_nlist(len(vectors))
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(len(vectors), nlist * self.KMEANS_SAMPLE_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.KMEANS_ITERATIONS):
+            self.centroids = centroids
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            filled = counts > 0
+            # Empty clusters keep their previous centroid
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.centroids = centroids.astype(np.float32)
+
+    def _redistribute(self):
+        record_ids, user_ids, vectors, _ = self.arrays()
+        record_ids, user_ids, vectors = record_ids.copy(), user_ids.copy(), vectors.copy()
+        self.train(vectors)
+        self.lists = [EncodingBlock(self.dim) for _ in range(len(self.centroids))]
+        self._user_lists = {}
+        self._insert(record_ids, user_ids, vectors)
+
+    def _insert(self, record_ids, user_ids, vectors):
+        labels = self._assign(vectors) if self.trained else np.zeros(len(vectors), dtype=np.int64)
+        for label in np.unique(labels):
+            selected = labels == label
+            self.lists[label].extend(record_ids[selected], user_ids[selected], vectors[selected])
+            for user_id in np.unique(user_ids[selected]):
+                self._user_lists.setdefault(int(user_id), set()).add(int(label))
+
+    def add(self, record_ids, user_ids, vectors):
+        record_ids = np.asarray(record_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        self._insert(record_ids, user_ids, vectors)
+
+        if not self.trained and len(self) >= self._target_nlist(len(self)) * self.MIN_POINTS_PER_LIST:
+            logger.info(f"Training IVF face index on {len(self)} encodings")
+            self._redistribute()
+
+    def remove_records(self, record_ids):
+        return sum(block.remove(np.isin(block.record_ids, record_ids)) for block in self.lists)
+
+    def remove_user(self, user_id):
+        removed = 0
+        for label in self._user_lists.pop(int(user_id), ()):
+            block = self.lists[label]
+            removed += block.remove(block.user_ids == user_id)
+        return removed
+
+    def search(self, queries):
+        """
+        Find the closest stored encoding for each query within the probed lists.
+
+        Returns:
+            Tuple of (user_ids, distances) arrays; user id -1 when nothing was found
+        """
+        user_ids = np.full(len(queries), -1, dtype=np.int64)
+        distances = np.full(len(queries), np.inf)
+
+        if not self.trained:
+            probes = np.zeros((len(queries), 1), dtype=np.int64)
+        else:
+            nprobe = min(self.nprobe, len(self.centroids))
+            centroid_distances = (np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+                                  - 2.0 * (queries @ self.centroids.T))
+            probes = np.argpartition(centroid_distances, nprobe - 1, axis=1)[:, :nprobe]
+
+        for i, query in enumerate(queries):
+            for label in probes[i]:
+                block = self.lists[label]
+                if not block.size:
+                    continue
+                positions, sq_distances = block.nearest(query[None, :])
+                distance = float(np.sqrt(sq_distances[0]))
+                if distance < distances[i]:
+                    distances[i] = distance
+                    user_ids[i] = block.user_ids[positions[0]]
+
+        return user_ids, distances
+
+    def arrays(self):
+        """Return (record_ids, user_ids, vectors, list_ids) for persistence."""
+        return (
+            np.concatenate([block.record_ids[:block.size] for block in self.lists]),
+            np.concatenate([block.user_ids[:block.size] for block in self.lists]),
+            np.concatenate([block.vectors[:block.size] for block in self.lists]),
+            np.concatenate([np.full(block.size, label, dtype=np.int32)
+                            for label, block in enumerate(self.lists)]),
+        )
+
+    def save(self, path):
+        _save_index(path, self, centroids=self.centroids)
+
+    @classmethod
+    def from_arrays(cls, dim, centroids, record_ids, user_ids, vectors, list_ids, **kwargs):
+        index = cls(dim, **kwargs)
+        if centroids is None:
+            index._insert(record_ids, user_ids, vectors)
+            return index
+
+        # Restore the stored clustering instead of re-running k-means
+        index.centroids = centroids
+        index.lists = [EncodingBlock(dim) for _ in range(len(centroids))]
+        for label in np.unique(list_ids):
+            selected = list_ids == label
+            index.lists[label].extend(record_ids[selected], user_ids[selected], vectors[selected])
+            for user_id in np.unique(user_ids[selected]):
+                index._user_lists.setdefault(int(user_id), set()).add(int(label))
+        return index
+
+INDEX_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+def create_index(backend=None):
+    """Build an empty index for the configured FACE_INDEX_BACKEND."""
+    backend = backend or app.config.get('FACE_INDEX_BACKEND', 'exact')
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown face index backend: {backend}")
+
+    if backend == IVFIndex.name:
+        return IVFIndex(nlist=app.config.get('FACE_INDEX_NLIST', 0),
+                        nprobe=app.config.get('FACE_INDEX_NPROBE', 8))
+    return ExactIndex()
+
+def _save_index(path, index, centroids):
+    record_ids, user_ids, vectors, list_ids = index.arrays()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            backend=np.array(index.name),
+            centroids=centroids if centroids is not None else np.empty((0, index.dim), dtype=np.float32),
+            record_ids=record_ids,
+            user_ids=user_ids,
+            vectors=vectors,
+            list_ids=list_ids,
+        )
+    os.replace(tmp_path, path)
+
+def load_index(path, backend=None):
+    """
+    Load a persisted index written by ``save``.
+
+    Returns:
+        The index, or None when the file is missing or holds another backend
+    """
+    if not path or not os.path.exists(path):
+        return None
+
+    backend = backend or app.config.get('FACE_INDEX_BACKEND', 'exact')
+    with np.load(path, allow_pickle=False) as data:
+        if str(data['backend']) != backend:
+            return None
+
+        template = create_index(backend)
+        centroids = data['centroids'] if len(data['centroids']) else None
+        kwargs = {'nlist': template.nlist, 'nprobe': template.nprobe} if backend == IVFIndex.name else {}
+        return INDEX_BACKENDS[backend].from_arrays(
+            template.dim, centroids, data['record_ids'], data['user_ids'],
+            data['vectors'], data['list_ids'], **kwargs
+        )
+
+def compare_recall(index, reference, queries, tolerance=None):
+    """
+    Measure how often an approximate index agrees with a reference index.
+
+    Args:
+        index: The index under test (e.g. IVFIndex)
+        reference: An exact index over the same encodings
+        queries: (Q x dim) float32 query encodings
+        tolerance: Only count queries the reference matches within this distance
+
+    Returns:
+        Fraction of reference matches that the index also returned
+    """
+    expected, expected_distances = reference.search(queries)
+    found, _ = index.search(queries)
+
+    relevant = expected >= 0
+    if tolerance is not None:
+        relevant &= expected_distances <= tolerance
+    if not relevant.any():
+        return 1.0
+    return float(np.mean(found[relevant] == expected[relevant]))
+
+class FaceGallery:
+    """
+    Process-resident index of all registered face encodings.
+
+    Encodings live in a pluggable index (exact brute force or IVF, chosen by
+    FACE_INDEX_BACKEND), so a lookup is a batched NumPy distance computation
+    instead of a Python loop over database rows. The gallery is loaded lazily
+    on first use, optionally warm-started from FACE_INDEX_PATH, and then kept
+    in sync incrementally: the routes that write FaceData update it directly,
+    and changes made by other processes are picked up by a cheap count/max(id)
+    check every FACE_GALLERY_SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self, dim=ENCODING_DIM):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._index = None
+        self._last_sync = 0.0
+
+    def __len__(self):
+        return len(self._index) if self._index is not None else 0
+
+    @property
+    def index(self):
+        return self._index
+
+    def load(self):
+        """(Re)build the gallery from the persisted index and the FaceData table."""
+        with self._lock:
+            path = app.config.get('FACE_INDEX_PATH')
+            index = None
+            try:
+                index = load_index(path)
+            except Exception as e:
+                logger.error(f"Ignoring unreadable face index at {path}: {str(e)}")
+
+            self._index = index or create_index()
+            changed = self._sync()
+            self._last_sync = time.monotonic()
+
+            if path and changed:
+                self.save(path)
+
+        logger.info(f"Loaded {len(self)} face encodings into the {self._index.name} gallery")
+
+    def save(self, path=None):
+        """Persist the index so the next process can skip the full table scan."""
+        path = path or app.config.get('FACE_INDEX_PATH')
+        if not path:
+            return
+        with self._lock:
+            self._index.save(path)
+
+    def _sync(self):
+        """Apply rows added or deleted in the database since the index was built."""
+        rows = db.session.query(FaceData.id).all()
+        db_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        local_ids = self._index.record_ids()
+
+        removed = np.setdiff1d(local_ids, db_ids, assume_unique=True)
+        added = np.setdiff1d(db_ids, local_ids, assume_unique=True)
+
+        if len(removed):
+            self._index.remove_records(removed)
+
+        for start in range(0, len(added), SYNC_BATCH_SIZE):
+            chunk = added[start:start + SYNC_BATCH_SIZE].tolist()
+            batch = db.session.query(
+                FaceData.id, FaceData.user_id, FaceData.face_encoding
+            ).filter(FaceData.id.in_(chunk)).all()
+
+            record_ids, user_ids, vectors = [], [], []
+            for record_id, user_id, data in batch:
+                try:
+                    vectors.append(decode_encoding(data))
+                except Exception as e:
+                    logger.error(f"Skipping unreadable face encoding {record_id}: {str(e)}")
+                    continue
+                record_ids.append(record_id)
+                user_ids.append(user_id)
+
+            if vectors:
+                self._index.add(np.array(record_ids, dtype=np.int64),
+                                np.array(user_ids, dtype=np.int64),
+                                np.vstack(vectors))
+
+        return bool(len(removed) or len(added))
+
+    def ensure_loaded(self):
+        """Load the gallery on first use and resync it if the table changed elsewhere."""
+        if self._index is None:
+            self.load()
+            return
+
+        interval = app.config.get('FACE_GALLERY_SYNC_INTERVAL', 5)
+        if time.monotonic() - self._last_sync < interval:
+            return
+
+        count, max_id = db.session.query(func.count(FaceData.id), func.max(FaceData.id)).one()
+        with self._lock:
+            local_ids = self._index.record_ids()
+            local_max = int(local_ids.max()) if len(local_ids) else None
+            if count != len(local_ids) or max_id != local_max:
+                logger.info("Face gallery out of date, resyncing")
+                self._sync()
+            self._last_sync = time.monotonic()
+
+    def add(self, record_id, user_id, encoding):
+        """Add a single encoding."""
+        vector = decode_encoding(encoding)
+        with self._lock:
+            if self._index is None:
+                self._index = create_index()
+            self._index.add(np.array([record_id], dtype=np.int64),
+                            np.array([user_id], dtype=np.int64),
+                            vector[None, :])
+
+    def remove_user(self, user_id):
+        """Drop every encoding belonging to a user."""
+        with self._lock:
+            if self._index is None:
+                return 0
+            return self._index.remove_user(user_id)
+
+    def replace_user(self, user_id, record_id, encoding):
+        """Swap a user's encodings for a newly registered one."""
+        with self._lock:
+            self.remove_user(user_id)
+            self.add(record_id, user_id, encoding)
+
+    def match(self, encoding, tolerance=None):
+        """
+        Find the closest registered face.
+
+        Args:
+            encoding: The query encoding
+            tolerance: Maximum euclidean distance counted as a match
+                       (defaults to FACE_MATCH_TOLERANCE)
+
+        Returns:
+            Tuple of (user_id, distance); user_id is None when the closest
+            face is further away than the tolerance or the gallery is empty
+        """
+        user_ids, distances = self.match_many([encoding], tolerance)
+        return user_ids[0], distances[0]
+
+    def match_many(self, encodings, tolerance=None):
+        """
+        Match several faces against the gallery in one matrix operation.
+
+        Args:
+            encodings: Sequence of query encodings
+            tolerance: Maximum euclidean distance counted as a match
+                       (defaults to FACE_MATCH_TOLERANCE)
+
+        Returns:
+            Tuple of (user_ids, distances) lists aligned with ``encodings``;
+            entries are None where no match or no gallery face was found
+        """
+        if tolerance is None:
+            tolerance = app.config.get('FACE_MATCH_TOLERANCE', 0.6)
+
+        if not len(encodings):
+            return [], []
+
+        queries = np.vstack([decode_encoding(encoding) for encoding in encodings])
+        with self._lock:
+            if not len(self):
+                return [None] * len(queries), [None] * len(queries)
+            found, found_distances = self._index.search(queries)
+
+        user_ids, distances = [], []
+        for user_id, distance in zip(found.tolist(), found_distances.tolist()):
+            distances.append(distance if np.isfinite(distance) else None)
+            user_ids.append(user_id if user_id >= 0 and distance <= tolerance else None)
+        return user_ids, distances
+
+def _grow(array, capacity):
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+# Shared gallery for this process
+face_gallery = FaceGallery()
@@ -0,0 +1,132 @@
+import struct
+from functools import cached_property
+
+import cv2
+import numpy as np
+
+# IMREAD_REDUCED_* flags by downscale factor; JPEG is decoded directly at the
+# reduced size (DCT scaling), other formats are decoded and then shrunk
+_REDUCED_COLOR = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+_REDUCED_GRAYSCALE = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def image_size(data):
+    """
+    Read an encoded image's (width, height) from its header without decoding.
+
+    Args:
+        data: Encoded JPEG or PNG bytes (or a memoryview of them)
+
+    Returns:
+        Tuple of (width, height), or None for other formats or a bad header
+    """
+    data = memoryview(data)
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+
+    if data[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1  # fill byte
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+def reduction_for(data, min_width, min_height):
+    """
+    Largest IMREAD_REDUCED factor that still decodes to at least the given size.
+
+    Returns:
+        1, 2, 4 or 8 (1 when the size is unknown)
+    """
+    size = image_size(data)
+    if size is None:
+        return 1
+    width, height = size
+    for factor in (8, 4, 2):
+        if width // factor >= min_width and height // factor >= min_height:
+            return factor
+    return 1
+
+class Frame:
+    """
+    One decoded image shared by every detector that looks at it.
+
+    Uploads are wrapped with ``np.frombuffer`` (no copy of the encoded
+    bytes) and decoded once, optionally at 1/2, 1/4 or 1/8 size or straight
+    to grayscale for consumers that need no more. The BGR, grayscale and RGB
+    views are computed on first use and cached, so the face, plate and
+    parking code paths working on the same frame convert it only once.
+    The views are shared: treat them as read-only.
+    """
+
+    def __init__(self, image, data=None, scale=1):
+        if image.ndim == 2:
+            self.__dict__['gray'] = image
+        else:
+            self.__dict__['bgr'] = image
+        self.data = data  # encoded bytes the frame was decoded from, if any
+        self.scale = scale  # source pixels per decoded pixel
+
+    @classmethod
+    def decode(cls, data, reduce=1, grayscale=False):
+        """
+        Decode encoded image bytes.
+
+        Args:
+            data: Encoded image (bytes, bytearray or memoryview)
+            reduce: Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale: Decode straight to a single channel
+
+        Returns:
+            The Frame, or None if the data is not a readable image
+        """
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        flags = (_REDUCED_GRAYSCALE if grayscale else _REDUCED_COLOR)[reduce]
+        image = cv2.imdecode(buffer, flags)
+        if image is None:
+            return None
+        return cls(image, data=data, scale=reduce)
+
+    @classmethod
+    def of(cls, image):
+        """Wrap a decoded BGR array (e.g. a video frame); Frames pass through."""
+        return image if isinstance(image, cls) else cls(image)
+
+    @property
+    def shape(self):
+        return self.__dict__.get('bgr', self.__dict__.get('gray')).shape
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    @cached_property
+    def bgr(self):
+        return cv2.cvtColor(self.gray, cv2.COLOR_GRAY2BGR)
+
+    @cached_property
+    def gray(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def rgb(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
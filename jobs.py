@@ -0,0 +1,335 @@
+import os
+import json
+import uuid
+import queue
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+FINISHED_STATES = (COMPLETED, FAILED)
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+class Job:
+    """In-memory state of a submitted analysis job."""
+
+    def __init__(self, job_id, job_type, params, status=QUEUED, result=None, error=None, created_at=None):
+        self.id = job_id
+        self.job_type = job_type
+        self.params = params
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created_at = created_at or datetime.utcnow()
+        self.updated_at = self.created_at
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "type": self.job_type,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(
+            record.id,
+            record.job_type,
+            json.loads(record.params or '{}'),
+            status=record.status,
+            result=json.loads(record.result) if record.result else None,
+            error=record.error,
+            created_at=record.created_at,
+        )
+        job.updated_at = record.updated_at or job.created_at
+        return job
+
+class JobQueue:
+    """
+    Background queue for long-running image analysis.
+
+    Submitting returns a job id straight away; a small pool of worker threads
+    runs the registered handler for the job type inside an app context and
+    records the result, which clients fetch by polling or over Server-Sent
+    Events. With JOB_PERSISTENCE = 'database' the upload is spooled to
+    JOB_STORAGE_FOLDER and the job tracked in the analysis_job table, so jobs
+    that were queued (or running) when a worker died are picked up again by
+    the next process that starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._jobs = {}
+        self._handlers = {}
+        self._queue = None
+        self._threads = []
+        self._recovered = False
+        self._last_expiry = 0.0
+
+    @property
+    def persistent(self):
+        return app.config.get('JOB_PERSISTENCE') == 'database'
+
+    def register(self, job_type, handler):
+        """
+        Register the function that runs a job type.
+
+        The handler is called as ``handler(payload, params)`` with the raw
+        upload bytes and the submit-time parameters, inside an app context,
+        and returns a JSON-serialisable result.
+        """
+        self._handlers[job_type] = handler
+
+    def start(self):
+        """Start the worker threads and, when persistent, recover pending jobs."""
+        if self._queue is not None:
+            return
+
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._queue = queue.Queue(maxsize=app.config.get('JOB_QUEUE_SIZE', 100))
+            for i in range(app.config.get('JOB_WORKERS', 2)):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        if self.persistent:
+            self._recover()
+
+    def submit(self, job_type, payload, params):
+        """
+        Queue a job.
+
+        Args:
+            job_type: A registered job type
+            payload: Raw upload bytes
+            params: JSON-serialisable parameters for the handler
+
+        Returns:
+            The new job's id
+
+        Raises:
+            JobQueueFullError: If the queue is at capacity
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+
+        self.start()
+        if self._queue.full():
+            raise JobQueueFullError("Job queue is full")
+
+        job = Job(uuid.uuid4().hex, job_type, params)
+
+        if self.persistent:
+            with open(self._payload_path(job.id), 'wb') as f:
+                f.write(payload)
+            db.session.add(AnalysisJob(
+                id=job.id,
+                job_type=job_type,
+                status=QUEUED,
+                params=json.dumps(params),
+                created_at=job.created_at,
+                updated_at=job.created_at
+            ))
+            db.session.commit()
+            # Workers re-read the spooled file, keeping the queue small
+            payload = None
+
+        with self._lock:
+            self._jobs[job.id] = job
+
+        try:
+            self._queue.put_nowait((job.id, payload))
+        except queue.Full:
+            self._update(job, FAILED, error="Job queue is full")
+            raise JobQueueFullError("Job queue is full")
+
+        return job.id
+
+    def get(self, job_id):
+        """Return the job with this id, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not self.persistent:
+            return job
+
+        # The job may belong to another worker process
+        record = db.session.get(AnalysisJob, job_id)
+        return Job.from_record(record) if record else None
+
+    def wait(self, job_id, last_status, timeout):
+        """
+        Block until the job leaves ``last_status`` or the timeout elapses.
+
+        Returns:
+            The job (possibly unchanged), or None if it is unknown
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                while job.status == last_status:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                return job
+
+        # Not ours: poll the shared table
+        while True:
+            job = self.get(job_id)
+            if job is None or job.status != last_status or time.monotonic() >= deadline:
+                return job
+            db.session.remove()
+            time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+
+    def _payload_path(self, job_id):
+        folder = app.config['JOB_STORAGE_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{job_id}.bin")
+
+    def _update(self, job, status, result=None, error=None):
+        with self._lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.updated_at = datetime.utcnow()
+            self._changed.notify_all()
+
+        if self.persistent:
+            AnalysisJob.query.filter_by(id=job.id).update({
+                "status": status,
+                "result": json.dumps(result) if result is not None else None,
+                "error": error,
+                "updated_at": job.updated_at
+            })
+            db.session.commit()
+
+    def _claim(self, job):
+        """Atomically move a persisted job from queued to running."""
+        claimed = AnalysisJob.query.filter_by(id=job.id, status=QUEUED).update({
+            "status": RUNNING,
+            "updated_at": datetime.utcnow()
+        })
+        db.session.commit()
+        return claimed == 1
+
+    def _work(self):
+        while True:
+            job_id, payload = self._queue.get()
+            try:
+                with app.app_context():
+                    self._run(job_id, payload)
+                    self._expire()
+            except Exception as e:
+                logger.error(f"Job worker error for {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id, payload):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return
+
+        if self.persistent:
+            if not self._claim(job):
+                # Another process already picked it up
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+                return
+            with open(self._payload_path(job_id), 'rb') as f:
+                payload = f.read()
+
+        self._update(job, RUNNING)
+        try:
+            result = self._handlers[job.job_type](payload, job.params)
+            self._update(job, COMPLETED, result=result)
+            logger.info(f"Job {job_id} ({job.job_type}) completed")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Job {job_id} ({job.job_type}) failed: {str(e)}")
+            self._update(job, FAILED, error=str(e))
+        finally:
+            if self.persistent:
+                try:
+                    os.remove(self._payload_path(job_id))
+                except OSError:
+                    pass
+
+    def _recover(self):
+        """Requeue persisted jobs left behind by a stopped worker process."""
+        if self._recovered:
+            return
+        self._recovered = True
+
+        stale_before = datetime.utcnow() - timedelta(seconds=app.config.get('JOB_STALE_AFTER', 300))
+        with app.app_context():
+            # Running jobs that stopped reporting belong to a dead worker
+            AnalysisJob.query.filter(
+                AnalysisJob.status == RUNNING,
+                AnalysisJob.updated_at < stale_before
+            ).update({"status": QUEUED}, synchronize_session=False)
+            db.session.commit()
+
+            records = AnalysisJob.query.filter_by(status=QUEUED).order_by(AnalysisJob.created_at).all()
+            for record in records:
+                if not os.path.exists(self._payload_path(record.id)):
+                    record.status = FAILED
+                    record.error = "Upload was lost before processing"
+                    continue
+                job = Job.from_record(record)
+                with self._lock:
+                    self._jobs[job.id] = job
+                try:
+                    self._queue.put_nowait((job.id, None))
+                except queue.Full:
+                    break
+            db.session.commit()
+
+        if records:
+            logger.info(f"Recovered {len(records)} queued analysis jobs")
+
+    def _expire(self):
+        """Forget finished jobs older than JOB_RESULT_TTL."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_expiry < 60:
+                return
+            self._last_expiry = now
+
+            cutoff = datetime.utcnow() - timedelta(seconds=app.config.get('JOB_RESULT_TTL', 3600))
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.status in FINISHED_STATES and job.updated_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+        if self.persistent:
+            AnalysisJob.query.filter(
+                AnalysisJob.status.in_(FINISHED_STATES),
+                AnalysisJob.updated_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+
+# Shared queue for this process
+job_queue = JobQueue()
@@ -0,0 +1,201 @@
+import json
+import logging
+import queue
+import threading
+
+from sqlalchemy import event
+
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Delivered instead of the dropped events when a subscriber falls behind
+RESYNC = {"event": "resync", "data": {}}
+
+class Subscription:
+    """Queue of one client's events from a LocalBroker."""
+
+    def __init__(self, broker, channel, maxsize):
+        self._broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lagged = False
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # A stalled client must not hold events for everyone; it refetches instead
+            self._lagged = True
+
+    def get(self, timeout):
+        """Next message, or None if nothing arrived within ``timeout`` seconds."""
+        if self._lagged:
+            self._lagged = False
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    return RESYNC
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker._unsubscribe(self)
+
+class LocalBroker:
+    """
+    In-process publish/subscribe.
+
+    Only reaches clients connected to the same process, which is all there
+    is with a single web worker; with several, use RedisBroker.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+class RedisSubscription:
+    """One client's Redis pub/sub connection."""
+
+    def __init__(self, client, channel):
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(channel)
+
+    def get(self, timeout):
+        message = self._pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    def close(self):
+        self._pubsub.close()
+
+class RedisBroker:
+    """Publish/subscribe through Redis, shared by every web and stream process."""
+
+    def __init__(self, url, prefix='live:'):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("redis is not installed")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(self.prefix + channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        return RedisSubscription(self._client, self.prefix + channel)
+
+def _channel(organization):
+    return f"org:{organization or ''}"
+
+class LiveEvents:
+    """
+    Per-organization change feed behind the dashboard's event stream.
+
+    Code that writes attendance, plate or parking rows stages a delta with
+    ``stage``; the deltas are held on the database session and published
+    once the transaction commits (and dropped if it rolls back), so clients
+    never see a change that did not happen. The broker is chosen by
+    LIVE_EVENTS_BROKER: 'local' for the in-process broker or a redis:// URL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._broker = None
+
+    @property
+    def broker(self):
+        with self._lock:
+            if self._broker is None:
+                setting = app.config.get('LIVE_EVENTS_BROKER', 'local')
+                queue_size = app.config.get('LIVE_EVENTS_QUEUE_SIZE', 100)
+                if setting.startswith(('redis://', 'rediss://', 'unix://')):
+                    try:
+                        self._broker = RedisBroker(setting)
+                    except Exception as e:
+                        logger.warning(f"Redis live events broker unavailable, using in-process: {str(e)}")
+                        self._broker = LocalBroker(queue_size)
+                else:
+                    self._broker = LocalBroker(queue_size)
+            return self._broker
+
+    @broker.setter
+    def broker(self, broker):
+        with self._lock:
+            self._broker = broker
+
+    def stage(self, organization, event_type, data):
+        """
+        Publish a delta to the organization's subscribers after the current commit.
+
+        Args:
+            organization: Organization the change belongs to
+            event_type: 'attendance', 'plate' or 'parking'
+            data: JSON-serialisable description of the change
+        """
+        db.session.info.setdefault('live_events', []).append(
+            (organization, {"event": event_type, "data": data})
+        )
+
+    def publish(self, organization, event_type, data):
+        """Publish a delta straight away (outside of a transaction)."""
+        try:
+            self.broker.publish(_channel(organization), {"event": event_type, "data": data})
+        except Exception as e:
+            # Clients resync on reconnect; a lost event must not fail the write
+            logger.error(f"Error publishing {event_type} event: {str(e)}")
+
+    def subscribe(self, organization):
+        """
+        Subscribe to an organization's deltas.
+
+        Returns:
+            Subscription with ``get(timeout)`` returning a dict with event and
+            data (or None on timeout) and ``close()``
+        """
+        return self.broker.subscribe(_channel(organization))
+
+    def _after_commit(self, session):
+        for organization, message in session.info.pop('live_events', ()):
+            self.publish(organization, message["event"], message["data"])
+
+    def _after_rollback(self, session, transaction):
+        # Savepoint rollbacks keep the outer transaction's deltas
+        if transaction.parent is None:
+            session.info.pop('live_events', None)
+
+# Shared feed for this process
+live_events = LiveEvents()
+
+event.listen(db.session, 'after_commit', live_events._after_commit)
+event.listen(db.session, 'after_soft_rollback', live_events._after_rollback)
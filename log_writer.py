@@ -0,0 +1,213 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+class PendingLog:
+    """A log row waiting in the LogWriter buffer."""
+
+    def __init__(self, record):
+        self.record = record  # Transient model instance; never attached to a session
+        self.id = None  # Set once written
+        self.taken = False  # Picked up by a flush; no longer changeable
+        self.written = threading.Event()
+
+class LogWriter:
+    """
+    Write-behind buffer for detection and attendance log inserts.
+
+    With LOG_WRITE_BEHIND enabled, callers hand new log rows to ``add``
+    instead of inserting them in their own transaction. A daemon thread
+    writes the buffer every LOG_WRITE_BEHIND_INTERVAL seconds, or as soon as
+    LOG_WRITE_BEHIND_BATCH_SIZE rows are waiting, all in one transaction:
+    a multi-row INSERT ... RETURNING per table where the database can return
+    the new ids in order (PostgreSQL), a statement per row otherwise
+    (SQLite). The handler registered for the model runs in that transaction
+    for the side effects of new rows (rollups, live events). The buffer is flushed on interpreter exit. A failed batch
+    is retried with the next flush while fewer than
+    LOG_WRITE_BEHIND_MAX_PENDING rows are waiting, then dropped.
+
+    Writes the caller's response depends on (updates of existing rows,
+    check-outs) stay synchronous; see ``enabled``.
+    """
+
+    def __init__(self, name="log-writer"):
+        self.name = name
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._handlers = {}
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return app.config.get('LOG_WRITE_BEHIND', False)
+
+    def register(self, model, handler, committed=None):
+        """
+        Set the functions run for new rows of ``model``.
+
+        Both are called with the list of newly inserted instances (ids
+        assigned): ``handler`` in the flushing session before it commits,
+        ``committed`` after the commit.
+        """
+        self._handlers[model] = (handler, committed)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child starts with its own empty buffer
+            self._pending = []
+            thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        interval = app.config.get('LOG_WRITE_BEHIND_INTERVAL', 0.5)
+        batch_size = app.config.get('LOG_WRITE_BEHIND_BATCH_SIZE', 100)
+        while True:
+            with self._lock:
+                if len(self._pending) < batch_size:
+                    self._wake.wait(interval)
+                if not self._pending:
+                    continue
+            if not self.flush():
+                # The database is unavailable; don't spin on the retries
+                time.sleep(interval)
+
+    def add(self, record):
+        """
+        Queue a new log row (a transient model instance) for the next flush.
+
+        Returns:
+            PendingLog tracking the row until it is written
+        """
+        self._ensure_started()
+        pending = PendingLog(record)
+        with self._lock:
+            self._pending.append(pending)
+            if len(self._pending) >= app.config.get('LOG_WRITE_BEHIND_BATCH_SIZE', 100):
+                self._wake.notify()
+        return pending
+
+    def update(self, pending, change):
+        """
+        Apply ``change(record)`` to a row that has not been picked up by a flush yet.
+
+        Returns:
+            False if the row is already being (or has been) written; wait for
+            it with ``wait`` and update the stored row instead
+        """
+        with self._lock:
+            if pending.taken:
+                return False
+            change(pending.record)
+            return True
+
+    def wait(self, pending, timeout=5):
+        """The id of a queued row once written, or None if it failed or timed out."""
+        pending.written.wait(timeout)
+        return pending.id
+
+    def pending_records(self, model):
+        """Queued rows of ``model`` not written yet."""
+        with self._lock:
+            return [pending.record for pending in self._pending if type(pending.record) is model]
+
+    def flush(self):
+        """
+        Write every queued row now (waits for a flush already running).
+
+        Returns:
+            False if the rows could not be written
+        """
+        if self._pid != os.getpid():
+            # Nothing was queued by this process (rows inherited over a fork aren't ours)
+            return True
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                for pending in batch:
+                    pending.taken = True
+            if not batch:
+                return True
+
+            # A context of its own, so a request's session is left alone
+            with app.app_context():
+                try:
+                    written = self._write(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    self._requeue(batch, e)
+                    return False
+            for pending in batch:
+                pending.written.set()
+
+            for model, (entries, records) in written.items():
+                committed = self._handlers.get(model, (None, None))[1]
+                if committed is not None:
+                    try:
+                        committed(records)
+                    except Exception as e:
+                        logger.error(f"{self.name} {model.__name__} commit handler failed: {str(e)}")
+            return True
+
+    def _write(self, batch):
+        by_model = {}
+        for pending in batch:
+            by_model.setdefault(type(pending.record), []).append(pending)
+
+        written = {}
+        for model, entries in by_model.items():
+            columns = [column.key for column in model.__mapper__.column_attrs if column.key != 'id']
+            # Copies, so the caller's instances never join this thread's session
+            records = [model(**{key: getattr(entry.record, key) for key in columns}) for entry in entries]
+            db.session.add_all(records)
+            written[model] = (entries, records)
+        # Batched by SQLAlchemy's insertmanyvalues where the dialect supports it
+        db.session.flush()
+
+        for model, (entries, records) in written.items():
+            handler = self._handlers.get(model, (None, None))[0]
+            if handler is not None:
+                handler(records)
+
+        for entries, records in written.values():
+            for entry, record in zip(entries, records):
+                entry.id = record.id
+        # Detached before the commit so their attributes stay readable afterwards
+        db.session.expunge_all()
+        db.session.commit()
+
+        for entries, records in written.values():
+            for entry, record in zip(entries, records):
+                entry.record.id = entry.id
+        logger.debug(f"{self.name} wrote {len(batch)} rows")
+        return written
+
+    def _requeue(self, batch, error):
+        with self._lock:
+            if len(self._pending) + len(batch) <= app.config.get('LOG_WRITE_BEHIND_MAX_PENDING', 10000):
+                for pending in batch:
+                    pending.taken = False
+                self._pending[:0] = batch
+                logger.error(f"{self.name} failed to write {len(batch)} rows, retrying: {str(error)}")
+                return
+            self.dropped += len(batch)
+        logger.error(f"{self.name} dropped {len(batch)} rows: {str(error)}")
+        for pending in batch:
+            pending.written.set()
+
+# Shared buffer for this process; flushed on interpreter exit
+log_writer = LogWriter()
+atexit.register(log_writer.flush)
@@ -0,0 +1,102 @@
+"""initial schema
+
+Revision ID: 1a7c3e9d2b40
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a7c3e9d2b40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables as previously created by db.create_all(); databases that were
+    # set up that way should be stamped with this revision, not upgraded
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=64), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password_hash', sa.String(length=256), nullable=False),
+    sa.Column('first_name', sa.String(length=64), nullable=True),
+    sa.Column('last_name', sa.String(length=64), nullable=True),
+    sa.Column('role', sa.String(length=20), nullable=True),
+    sa.Column('organization', sa.String(length=128), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('vehicle_plate',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('plate_number', sa.String(length=20), nullable=False),
+    sa.Column('owner_name', sa.String(length=128), nullable=True),
+    sa.Column('vehicle_make', sa.String(length=64), nullable=True),
+    sa.Column('vehicle_model', sa.String(length=64), nullable=True),
+    sa.Column('is_authorized', sa.Boolean(), nullable=True),
+    sa.Column('organization_id', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('parking_space',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('space_identifier', sa.String(length=20), nullable=False),
+    sa.Column('location_description', sa.String(length=128), nullable=True),
+    sa.Column('is_occupied', sa.Boolean(), nullable=True),
+    sa.Column('organization_id', sa.String(length=128), nullable=False),
+    sa.Column('last_updated', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('plate_detection_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('plate_number', sa.String(length=20), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('location', sa.String(length=128), nullable=True),
+    sa.Column('confidence', sa.Float(), nullable=True),
+    sa.Column('is_authorized', sa.Boolean(), nullable=True),
+    sa.Column('image_path', sa.String(length=256), nullable=True),
+    sa.Column('organization_id', sa.String(length=128), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('face_data',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('face_encoding', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('attendance_record',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('check_in_time', sa.DateTime(), nullable=True),
+    sa.Column('check_out_time', sa.DateTime(), nullable=True),
+    sa.Column('detection_method', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('parking_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('space_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('is_occupied', sa.Boolean(), nullable=False),
+    sa.Column('vehicle_plate', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['space_id'], ['parking_space.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('parking_log')
+    op.drop_table('attendance_record')
+    op.drop_table('face_data')
+    op.drop_table('plate_detection_log')
+    op.drop_table('parking_space')
+    op.drop_table('vehicle_plate')
+    op.drop_table('user')
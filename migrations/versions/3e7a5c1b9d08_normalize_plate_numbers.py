@@ -0,0 +1,62 @@
+"""normalize plate numbers
+
+Revision ID: 3e7a5c1b9d08
+Revises: c14097f7bfa9
+Create Date: 2026-10-18 18:02:41.318204
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7a5c1b9d08'
+down_revision = 'c14097f7bfa9'
+branch_labels = None
+depends_on = None
+
+# Inlined from plate_ocr.normalize_plate so the migration does not depend on
+# the application module as it changes
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+
+
+def _normalize(text):
+    return _NON_ALPHANUMERIC.sub('', (text or '').upper())
+
+
+def upgrade():
+    connection = op.get_bind()
+    plates = sa.table('vehicle_plate', sa.column('id'), sa.column('organization_id'), sa.column('plate_number'))
+
+    rows = connection.execute(
+        sa.select(plates.c.id, plates.c.organization_id, plates.c.plate_number).order_by(plates.c.id.desc())
+    ).all()
+
+    # Registrations that only differed in separators or case collapse into
+    # one; keep the most recent, as the unique constraint migration did
+    seen = set()
+    duplicates = []
+    renamed = []
+    for id, organization_id, plate_number in rows:
+        normalized = _normalize(plate_number)
+        if (organization_id, normalized) in seen:
+            duplicates.append(id)
+            continue
+        seen.add((organization_id, normalized))
+        if normalized != plate_number:
+            renamed.append({'row_id': id, 'plate': normalized})
+
+    if duplicates:
+        connection.execute(plates.delete().where(plates.c.id.in_(duplicates)))
+    if renamed:
+        connection.execute(
+            plates.update().where(plates.c.id == sa.bindparam('row_id')).values(plate_number=sa.bindparam('plate')),
+            renamed,
+        )
+
+
+def downgrade():
+    # Original spellings are not kept; normalised plates remain valid
+    pass
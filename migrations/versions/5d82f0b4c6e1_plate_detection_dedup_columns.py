@@ -0,0 +1,28 @@
+"""plate detection dedup columns
+
+Revision ID: 5d82f0b4c6e1
+Revises: 2f6b8d1c4a57
+Create Date: 2026-10-18 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d82f0b4c6e1'
+down_revision = '2f6b8d1c4a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('plate_detection_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seen', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('detection_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('plate_detection_log', schema=None) as batch_op:
+        batch_op.drop_column('detection_count')
+        batch_op.drop_column('last_seen')
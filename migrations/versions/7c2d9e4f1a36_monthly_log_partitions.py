@@ -0,0 +1,109 @@
+"""monthly log partitions
+
+Revision ID: 7c2d9e4f1a36
+Revises: b2fd001f4703
+Create Date: 2026-10-18 18:05:12.114320
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d9e4f1a36'
+down_revision = 'b2fd001f4703'
+branch_labels = None
+depends_on = None
+
+# Indexes and foreign keys rebuilt on the partitioned tables
+LOG_TABLES = {
+    'plate_detection_log': {
+        'indexes': {'ix_plate_detection_log_org_timestamp': 'organization_id, "timestamp"'},
+        'foreign_keys': [],
+    },
+    'parking_log': {
+        'indexes': {'ix_parking_log_space_timestamp': 'space_id, "timestamp"'},
+        'foreign_keys': ['CONSTRAINT parking_log_space_id_fkey FOREIGN KEY (space_id) REFERENCES parking_space (id)'],
+    },
+}
+
+# Partitions created past the current month; the app keeps creating them from there
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return datetime(month.year + years, month_index + 1, 1)
+
+
+def upgrade():
+    # The partition key can't be NULL
+    op.execute('UPDATE plate_detection_log SET "timestamp" = COALESCE(last_seen, CURRENT_TIMESTAMP) WHERE "timestamp" IS NULL')
+    op.execute('UPDATE parking_log SET "timestamp" = CURRENT_TIMESTAMP WHERE "timestamp" IS NULL')
+    for table in LOG_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, spec in LOG_TABLES.items():
+            _partition(table, **spec)
+
+
+def _partition(table, indexes, foreign_keys):
+    """Rebuild ``table`` as a table partitioned by month of its timestamp."""
+    connection = op.get_bind()
+    old = f'{table}_unpartitioned'
+    op.execute(f'ALTER TABLE {table} RENAME TO {old}')
+    op.execute(f'ALTER INDEX {table}_pkey RENAME TO {old}_pkey')
+    for name in indexes:
+        op.execute(f'DROP INDEX {name}')
+
+    # Partitioned tables need the partition key in the primary key; ids stay unique through the sequence
+    op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY (id, "timestamp")) '
+               f'PARTITION BY RANGE ("timestamp")')
+    for foreign_key in foreign_keys:
+        op.execute(f'ALTER TABLE {table} ADD {foreign_key}')
+    op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    oldest = connection.execute(sa.text(f'SELECT min("timestamp") FROM {old}')).scalar()
+    current = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month = datetime(oldest.year, oldest.month, 1) if oldest is not None else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        op.execute(f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+                   f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')")
+        month = _add_months(month, 1)
+
+    op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    for name, columns in indexes.items():
+        op.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    op.execute(f'DROP TABLE {old}')
+
+
+def _unpartition(table, indexes, foreign_keys):
+    """Rebuild a partitioned ``table`` as a plain table."""
+    old = f'{table}_partitioned'
+    op.execute(f'ALTER TABLE {table} RENAME TO {old}')
+    op.execute(f'ALTER INDEX {table}_pkey RENAME TO {old}_pkey')
+    for name in indexes:
+        op.execute(f'DROP INDEX {name}')
+    op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY (id))')
+    op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    op.execute(f'DROP TABLE {old}')
+    for foreign_key in foreign_keys:
+        op.execute(f'ALTER TABLE {table} ADD {foreign_key}')
+    for name, columns in indexes.items():
+        op.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, spec in LOG_TABLES.items():
+            _unpartition(table, **spec)
+
+    for table in LOG_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
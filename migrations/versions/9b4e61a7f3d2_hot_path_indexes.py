@@ -0,0 +1,62 @@
+"""hot path indexes and unique plate per organization
+
+Revision ID: 9b4e61a7f3d2
+Revises: 5d82f0b4c6e1
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e61a7f3d2'
+down_revision = '5d82f0b4c6e1'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_attendance_record_user_check_in', 'attendance_record', ['user_id', 'check_in_time']),
+    ('ix_plate_detection_log_org_timestamp', 'plate_detection_log', ['organization_id', 'timestamp']),
+    ('ix_parking_space_org_occupied', 'parking_space', ['organization_id', 'is_occupied']),
+    ('ix_parking_log_space_timestamp', 'parking_log', ['space_id', 'timestamp']),
+]
+
+
+def _is_postgresql():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade():
+    # Keep the most recent registration of any plate registered twice
+    op.execute(
+        "DELETE FROM vehicle_plate WHERE id NOT IN ("
+        "SELECT MAX(id) FROM vehicle_plate GROUP BY organization_id, plate_number)"
+    )
+
+    if _is_postgresql():
+        # Build without locking out writes on the large log tables; CONCURRENTLY
+        # cannot run inside the migration transaction. If a build is interrupted
+        # it leaves an invalid index behind: drop it and run the upgrade again.
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+            op.create_index('uq_vehicle_plate_org_plate', 'vehicle_plate', ['organization_id', 'plate_number'],
+                            unique=True, postgresql_concurrently=True, if_not_exists=True)
+        op.execute(
+            "ALTER TABLE vehicle_plate ADD CONSTRAINT uq_vehicle_plate_org_plate "
+            "UNIQUE USING INDEX uq_vehicle_plate_org_plate"
+        )
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns)
+        with op.batch_alter_table('vehicle_plate', schema=None) as batch_op:
+            batch_op.create_unique_constraint('uq_vehicle_plate_org_plate', ['organization_id', 'plate_number'])
+
+
+def downgrade():
+    with op.batch_alter_table('vehicle_plate', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_vehicle_plate_org_plate', type_='unique')
+
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -46,6 +46,10 @@ class VehiclePlate(db.Model):
     organization_id = db.Column(db.String(128), nullable=False)  # To group by organization
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.UniqueConstraint('organization_id', 'plate_number', name='uq_vehicle_plate_org_plate'),
+    )
+    
     def __repr__(self):
         return f'<VehiclePlate {self.plate_number}>'
 
@@ -57,6 +61,10 @@ class ParkingSpace(db.Model):
     organization_id = db.Column(db.String(128), nullable=False)  # To group by organization
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_parking_space_org_occupied', 'organization_id', 'is_occupied'),
+    )
+    
     def __repr__(self):
         return f'<ParkingSpace {self.space_identifier} {"Occupied" if self.is_occupied else "Free"}>'
 
@@ -67,31 +75,121 @@ class AttendanceRecord(db.Model):
     check_out_time = db.Column(db.DateTime, nullable=True)
     detection_method = db.Column(db.String(20), default='face_recognition')  # face_recognition, manual, etc.
     
+    __table_args__ = (
+        db.Index('ix_attendance_record_user_check_in', 'user_id', 'check_in_time'),
+    )
+    
     def __repr__(self):
         return f'<AttendanceRecord for User {self.user_id} on {self.check_in_time.strftime("%Y-%m-%d")}>'
 
 class PlateDetectionLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    plate_number = db.Column(db.String(20), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    plate_number = db.Column(db.String(20), nullable=False)  # As read
+    matched_plate = db.Column(db.String(20), nullable=True)  # Registered plate the read matched, if any
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # First seen; monthly partition key
+    last_seen = db.Column(db.DateTime, nullable=True)  # Last frame the plate was seen in
+    detection_count = db.Column(db.Integer, default=1)  # Frames collapsed into this entry
     location = db.Column(db.String(128), nullable=True)
     confidence = db.Column(db.Float, nullable=True)  # Confidence score of detection
     is_authorized = db.Column(db.Boolean, default=False)
     image_path = db.Column(db.String(256), nullable=True)  # Path to the captured image
     organization_id = db.Column(db.String(128), nullable=False)  # To group by organization
     
+    __table_args__ = (
+        db.Index('ix_plate_detection_log_org_timestamp', 'organization_id', 'timestamp'),
+    )
+    
     def __repr__(self):
         return f'<PlateDetectionLog {self.plate_number} at {self.timestamp}>'
 
 class ParkingLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     space_id = db.Column(db.Integer, db.ForeignKey('parking_space.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Monthly partition key
     is_occupied = db.Column(db.Boolean, nullable=False)
     vehicle_plate = db.Column(db.String(20), nullable=True)
     
     # Define relationship
     space = db.relationship('ParkingSpace', backref='logs')
     
+    __table_args__ = (
+        db.Index('ix_parking_log_space_timestamp', 'space_id', 'timestamp'),
+    )
+    
     def __repr__(self):
         return f'<ParkingLog for Space {self.space_id} {"Occupied" if self.is_occupied else "Freed"} at {self.timestamp}>'
+
+class AnalysisJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    job_type = db.Column(db.String(20), nullable=False)  # parking, plate
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    params = db.Column(db.Text, nullable=True)  # JSON parameters for the handler
+    result = db.Column(db.Text, nullable=True)  # JSON result once completed
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} {self.job_type} {self.status}>'
+
+class CameraCalibration(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.String(128), nullable=False)
+    camera_id = db.Column(db.String(64), nullable=False, default='default')
+    frame_width = db.Column(db.Integer, nullable=False)  # Size of the frame the ROIs were drawn on
+    frame_height = db.Column(db.Integer, nullable=False)
+    compiled = db.Column(db.LargeBinary, nullable=True)  # Precomputed ROI lookup tables
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    rois = db.relationship('ParkingROI', backref='calibration', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.UniqueConstraint('organization_id', 'camera_id', name='uq_camera_calibration_org_camera'),
+    )
+    
+    def __repr__(self):
+        return f'<CameraCalibration {self.camera_id} for {self.organization_id}>'
+
+class ParkingROI(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    calibration_id = db.Column(db.Integer, db.ForeignKey('camera_calibration.id'), nullable=False)
+    space_id = db.Column(db.Integer, db.ForeignKey('parking_space.id'), nullable=False)
+    polygon = db.Column(db.Text, nullable=False)  # JSON list of [x, y] points in frame pixels
+    occupied_threshold = db.Column(db.Float, nullable=True)  # Ratio above which a free space becomes occupied
+    vacant_threshold = db.Column(db.Float, nullable=True)  # Ratio below which an occupied space frees up
+    
+    space = db.relationship('ParkingSpace', backref='rois')
+    
+    __table_args__ = (
+        db.UniqueConstraint('calibration_id', 'space_id', name='uq_parking_roi_calibration_space'),
+    )
+    
+    def __repr__(self):
+        return f'<ParkingROI for Space {self.space_id}>'
+
+class AttendanceRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Reports join the user's current organization
+    day = db.Column(db.Date, nullable=False)  # Date of check_in_time
+    check_ins = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_attendance_rollup_user_day'),
+    )
+    
+    def __repr__(self):
+        return f'<AttendanceRollup for User {self.user_id} on {self.day}>'
+
+class PlateDetectionRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.String(128), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)  # Start of the hour the detections were first seen in
+    detections = db.Column(db.Integer, nullable=False, default=0)
+    unauthorized = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('organization_id', 'hour', name='uq_plate_detection_rollup_org_hour'),
+    )
+    
+    def __repr__(self):
+        return f'<PlateDetectionRollup {self.organization_id} at {self.hour}>'
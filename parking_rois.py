@@ -0,0 +1,341 @@
+import io
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+import cv2
+
+from app import app, db
+from models import CameraCalibration
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAMERA = 'default'
+
+class CalibrationError(ValueError):
+    """Raised when submitted ROIs cannot be used for a calibration."""
+
+def validate_polygon(points, width, height):
+    """
+    Check and normalise one ROI polygon.
+
+    Args:
+        points: Sequence of [x, y] vertices in calibration frame pixels
+        width, height: Calibration frame size
+
+    Returns:
+        List of [x, y] integer pairs
+
+    Raises:
+        CalibrationError: If the polygon is malformed or outside the frame
+    """
+    try:
+        polygon = [[int(round(float(x))), int(round(float(y)))] for x, y in points]
+    except (TypeError, ValueError):
+        raise CalibrationError("Polygon must be a list of [x, y] points")
+
+    if len(polygon) < 3:
+        raise CalibrationError("Polygon needs at least 3 points")
+    for x, y in polygon:
+        if not (0 <= x <= width and 0 <= y <= height):
+            raise CalibrationError(f"Point ({x}, {y}) is outside the {width}x{height} frame")
+    return polygon
+
+def validate_thresholds(occupied_threshold, vacant_threshold):
+    """
+    Check optional per-space hysteresis thresholds.
+
+    Returns:
+        Tuple of (occupied_threshold, vacant_threshold) as floats or None
+
+    Raises:
+        CalibrationError: If a threshold is out of range or they cross
+    """
+    try:
+        high = None if occupied_threshold is None else float(occupied_threshold)
+        low = None if vacant_threshold is None else float(vacant_threshold)
+    except (TypeError, ValueError):
+        raise CalibrationError("Thresholds must be numbers")
+
+    for value in (high, low):
+        if value is not None and not 0 <= value <= 1:
+            raise CalibrationError("Thresholds must be between 0 and 1")
+    if high is not None and low is not None and low > high:
+        raise CalibrationError("vacant_threshold must not exceed occupied_threshold")
+    return high, low
+
+def rasterize_polygon(polygon, width, height):
+    """Pixel mask (uint8, 0/1) of a polygon in a width x height frame."""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.asarray(polygon, dtype=np.int32)], 1)
+    return mask
+
+def mask_to_rects(mask):
+    """
+    Decompose a mask into axis-aligned rectangles for integral-image sums.
+
+    Consecutive rows covering the same column span are merged into one
+    rectangle, so a rectangular ROI becomes a single rectangle and a slanted
+    one a band per distinct span. Rows with more than one span (concave
+    polygons) contribute one rectangle per span.
+
+    Returns:
+        int32 array of shape (n, 4) holding (x0, y0, x1, y1), end-exclusive
+    """
+    rects = []
+    open_spans = {}  # (x0, x1) -> first row
+    for y in range(mask.shape[0] + 1):
+        spans = set()
+        if y < mask.shape[0]:
+            row = np.concatenate(([0], mask[y], [0])).astype(np.int8)
+            edges = np.flatnonzero(np.diff(row))
+            spans = set(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+        for span in list(open_spans):
+            if span not in spans:
+                rects.append((span[0], open_spans.pop(span), span[1], y))
+        for span in spans:
+            open_spans.setdefault(span, y)
+
+    return np.asarray(rects, dtype=np.int32).reshape(-1, 4)
+
+def apply_hysteresis(ratios, was_occupied, occupied_above, vacant_below):
+    """
+    Occupancy states with hysteresis, for all spaces at once.
+
+    A free space becomes occupied only above ``occupied_above`` and an
+    occupied one frees up only below ``vacant_below``; ratios in between
+    keep the previous state. Thresholds may be scalars or per-space arrays.
+    """
+    return np.where(ratios > occupied_above, True, np.where(ratios < vacant_below, False, was_occupied))
+
+class CompiledCalibration:
+    """
+    Lookup tables for scoring one camera's ROIs against a frame.
+
+    Every space's mask is stored as rectangles (``rects``) tagged with the
+    index of their space (``rect_space``), so scoring a frame is one integral
+    image plus four lookups per rectangle. ``occupied_above`` and
+    ``vacant_below`` hold per-space hysteresis thresholds (NaN = default).
+    """
+
+    def __init__(self, width, height, space_ids, rects, rect_space, areas,
+                 occupied_above=None, vacant_below=None):
+        self.width = width
+        self.height = height
+        self.space_ids = space_ids
+        self.rects = rects
+        self.rect_space = rect_space
+        self.areas = areas
+        self.occupied_above = occupied_above if occupied_above is not None else np.full(len(space_ids), np.nan)
+        self.vacant_below = vacant_below if vacant_below is not None else np.full(len(space_ids), np.nan)
+
+    @classmethod
+    def build(cls, width, height, rois):
+        """
+        Rasterize ROIs into lookup tables.
+
+        Args:
+            width, height: Calibration frame size
+            rois: Iterable of (space_id, polygon, occupied_above, vacant_below)
+                tuples; thresholds may be None to use the defaults
+        """
+        space_ids, all_rects, rect_space, areas, occupied_above, vacant_below = [], [], [], [], [], []
+        for index, (space_id, polygon, high, low) in enumerate(rois):
+            # Rasterize within the polygon's bounding box, then shift back
+            points = np.asarray(polygon, dtype=np.int32)
+            x_min, y_min = points.min(axis=0)
+            x_max, y_max = np.minimum(points.max(axis=0) + 1, (width, height))
+            mask = rasterize_polygon(points - (x_min, y_min), x_max - x_min, y_max - y_min)
+            rects = mask_to_rects(mask) + np.array([x_min, y_min, x_min, y_min], dtype=np.int32)
+            space_ids.append(space_id)
+            all_rects.append(rects)
+            rect_space.append(np.full(len(rects), index, dtype=np.int32))
+            areas.append(int(mask.sum()))
+            occupied_above.append(np.nan if high is None else high)
+            vacant_below.append(np.nan if low is None else low)
+
+        return cls(
+            width,
+            height,
+            np.asarray(space_ids, dtype=np.int64),
+            np.concatenate(all_rects) if all_rects else np.zeros((0, 4), dtype=np.int32),
+            np.concatenate(rect_space) if rect_space else np.zeros(0, dtype=np.int32),
+            np.asarray(areas, dtype=np.int64),
+            np.asarray(occupied_above, dtype=np.float64),
+            np.asarray(vacant_below, dtype=np.float64),
+        )
+
+    @classmethod
+    def grid(cls, space_ids, width, height):
+        """Split a frame into a square grid with one cell per space, in order."""
+        n = len(space_ids)
+        grid_size = max(1, int(np.ceil(np.sqrt(n))))
+        cell_h, cell_w = height // grid_size, width // grid_size
+
+        index = np.arange(n)
+        x0 = (index % grid_size) * cell_w
+        y0 = (index // grid_size) * cell_h
+        x1 = np.minimum(x0 + cell_w, width)
+        y1 = np.minimum(y0 + cell_h, height)
+        rects = np.stack([x0, y0, x1, y1], axis=1).astype(np.int32)
+
+        return cls(
+            width,
+            height,
+            np.asarray(space_ids, dtype=np.int64),
+            rects,
+            index.astype(np.int32),
+            ((x1 - x0) * (y1 - y0)).astype(np.int64),
+        )
+
+    def thresholds(self, occupied_above, vacant_below):
+        """Per-space hysteresis thresholds, filling unset ones with the defaults."""
+        return (np.where(np.isnan(self.occupied_above), occupied_above, self.occupied_above),
+                np.where(np.isnan(self.vacant_below), vacant_below, self.vacant_below))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, size=np.asarray([self.width, self.height]), space_ids=self.space_ids,
+                 rects=self.rects, rect_space=self.rect_space, areas=self.areas,
+                 occupied_above=self.occupied_above, vacant_below=self.vacant_below)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            width, height = (int(v) for v in arrays['size'])
+            return cls(width, height, arrays['space_ids'], arrays['rects'],
+                       arrays['rect_space'], arrays['areas'],
+                       arrays['occupied_above'] if 'occupied_above' in arrays else None,
+                       arrays['vacant_below'] if 'vacant_below' in arrays else None)
+
+    def score(self, binary):
+        """
+        Fraction of set pixels inside each ROI.
+
+        Args:
+            binary: Thresholded frame (non-zero = feature) at calibration size
+
+        Returns:
+            float array of occupancy ratios aligned with ``space_ids``
+        """
+        integral = cv2.integral((binary > 0).astype(np.uint8))
+        x0, y0, x1, y1 = self.rects.T
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        totals = np.bincount(self.rect_space, weights=sums, minlength=len(self.space_ids))
+        return totals / np.maximum(self.areas, 1)
+
+class CalibrationCache:
+    """
+    Per-process cache of compiled calibrations.
+
+    Entries are keyed by calibration id and checked against the row's
+    updated_at, so an edit saved by any process is picked up on the next frame.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compiled = {}
+
+    def get(self, organization, camera_id):
+        """Compiled calibration for a camera, or None if it has none."""
+        row = db.session.execute(
+            db.select(CameraCalibration.id, CameraCalibration.updated_at)
+            .filter_by(organization_id=organization, camera_id=camera_id or DEFAULT_CAMERA)
+        ).first()
+        if row is None:
+            return None
+
+        with self._lock:
+            cached = self._compiled.get(row.id)
+        if cached is not None and cached[0] == row.updated_at:
+            return cached[1]
+
+        calibration = db.session.get(CameraCalibration, row.id)
+        compiled = CompiledCalibration.from_bytes(calibration.compiled)
+        with self._lock:
+            self._compiled[row.id] = (calibration.updated_at, compiled)
+        return compiled
+
+    def invalidate(self, calibration_id):
+        with self._lock:
+            self._compiled.pop(calibration_id, None)
+
+calibration_cache = CalibrationCache()
+
+class ReferenceFrame:
+    """Last scored frame of a camera and the state it was scored against."""
+
+    def __init__(self, gray, calibration, space_ids, occupancy):
+        self.gray = gray
+        self.calibration = calibration
+        self.space_ids = space_ids
+        self.occupancy = occupancy  # space ID -> occupied
+        self.created = time.monotonic()
+
+class ReferenceFrames:
+    """
+    Per-process reference frame for each (organization, camera).
+
+    Holding the calibration, space list and occupancy alongside the frame
+    lets an unchanged upload be answered without touching the database.
+    A reference older than PARKING_REFERENCE_TTL is dropped, forcing a full
+    pass that re-reads spaces and calibration and re-scores every ROI.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {}
+
+    def get(self, organization, camera_id):
+        key = (organization, camera_id or DEFAULT_CAMERA)
+        with self._lock:
+            reference = self._frames.get(key)
+            if reference is not None and time.monotonic() - reference.created > app.config.get('PARKING_REFERENCE_TTL', 60):
+                del self._frames[key]
+                reference = None
+        return reference
+
+    def put(self, organization, camera_id, reference):
+        with self._lock:
+            self._frames[(organization, camera_id or DEFAULT_CAMERA)] = reference
+
+    def reset(self, organization, camera_id=None):
+        """Forget one camera's reference, or all of an organization's."""
+        with self._lock:
+            for key in list(self._frames):
+                if key[0] == organization and camera_id in (None, key[1]):
+                    del self._frames[key]
+
+reference_frames = ReferenceFrames()
+
+def compile_calibration(calibration):
+    """Rebuild a calibration's lookup tables from its ROI rows (caller commits)."""
+    rois = [(roi.space_id, json.loads(roi.polygon), roi.occupied_threshold, roi.vacant_threshold)
+            for roi in sorted(calibration.rois, key=lambda roi: roi.space_id)]
+    calibration.compiled = CompiledCalibration.build(
+        calibration.frame_width, calibration.frame_height, rois
+    ).to_bytes()
+    calibration_cache.invalidate(calibration.id)
+    reference_frames.reset(calibration.organization_id, calibration.camera_id)
+
+def calibration_to_dict(calibration):
+    return {
+        "camera_id": calibration.camera_id,
+        "frame_width": calibration.frame_width,
+        "frame_height": calibration.frame_height,
+        "updated_at": calibration.updated_at.isoformat() if calibration.updated_at else None,
+        "rois": [
+            {
+                "space_id": roi.space_id,
+                "identifier": roi.space.space_identifier,
+                "polygon": json.loads(roi.polygon),
+                "occupied_threshold": roi.occupied_threshold,
+                "vacant_threshold": roi.vacant_threshold
+            }
+            for roi in sorted(calibration.rois, key=lambda roi: roi.space_id)
+        ]
+    }
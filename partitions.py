@@ -0,0 +1,263 @@
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import func, text
+
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+# Append-only logs stored in monthly range partitions of their timestamp column
+PARTITIONED_TABLES = ('plate_detection_log', 'parking_log')
+
+_PARTITION_NAME = re.compile(r'_p(\d{4})(\d{2})$')
+
+def month_start(when):
+    return datetime(when.year, when.month, 1)
+
+def add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return datetime(month.year + years, month_index + 1, 1)
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+def is_partition_name(name):
+    """Whether ``name`` is a monthly or default partition of one of the partitioned tables."""
+    return any(
+        name == f"{table}_default" or (name.startswith(f"{table}_p") and _PARTITION_NAME.search(name))
+        for table in PARTITIONED_TABLES
+    )
+
+def history_since(months=None):
+    """
+    Start of the window history pages show (the current month and the ones before it).
+
+    Bounding queries by it lets PostgreSQL scan only the recent partitions.
+    """
+    months = months if months is not None else app.config.get('LOG_HISTORY_MONTHS', 2)
+    return add_months(month_start(datetime.utcnow()), -(max(months, 1) - 1))
+
+def partitioning_supported():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def is_partitioned(table):
+    """Whether ``table`` is a partitioned table (always False outside PostgreSQL)."""
+    if not partitioning_supported():
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {"table": table}).first() is not None
+
+def create_partition_sql(table, month):
+    """DDL creating the partition of ``table`` for the month starting at ``month``."""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    )
+
+def list_partitions(table):
+    """
+    The monthly partitions of a partitioned table.
+
+    Returns:
+        List of (partition name, month start) in month order; the default
+        partition is not included
+    """
+    rows = db.session.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid)"
+    ), {"table": table}).scalars()
+    partitions = []
+    for name in rows:
+        found = _PARTITION_NAME.search(name)
+        if found:
+            partitions.append((name, datetime(int(found.group(1)), int(found.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def ensure_partitions(months_ahead=None):
+    """
+    Create the partitions for the current month and the next ``months_ahead``.
+
+    Meant to run from a scheduled job (``flask create-partitions``), not
+    from requests. Rows outside every monthly partition land in the table's
+    default partition, so a missed run never fails an insert; the rows are
+    moved into their partition when it is created. Each partition is
+    created and committed on its own, so one failure doesn't stop the rest.
+    Does nothing outside PostgreSQL.
+
+    Returns:
+        Tuple of (names of the partitions created, list of (name, error) for
+        the ones that could not be)
+    """
+    if not partitioning_supported():
+        return [], []
+    months_ahead = months_ahead if months_ahead is not None else app.config.get('PARTITION_MONTHS_AHEAD', 3)
+
+    created = []
+    failed = []
+    current = month_start(datetime.utcnow())
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            continue
+        existing = {name for name, _ in list_partitions(table)}
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            try:
+                moved = _create_partition(table, month)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error creating log partition {name}: {str(e)}")
+                failed.append((name, str(e)))
+                continue
+            created.append(name)
+            if moved:
+                logger.info(f"Moved {moved} rows from {table}_default into {name}")
+
+    if created:
+        logger.info(f"Created log partitions: {', '.join(created)}")
+    return created, failed
+
+def _create_partition(table, month):
+    """
+    Create the partition of ``table`` for ``month`` in the current transaction.
+
+    PostgreSQL refuses to create a partition while the default partition
+    holds rows in its range, so those rows are first copied into a plain
+    table that is then attached as the partition.
+
+    Returns:
+        Number of rows moved out of the default partition
+    """
+    default_rows = _rows_of(f"{table}_default", table)
+    in_month = (default_rows.c.timestamp >= month) & (default_rows.c.timestamp < add_months(month, 1))
+    if db.session.execute(db.select(default_rows.c.id).where(in_month).limit(1)).first() is None:
+        db.session.execute(text(create_partition_sql(table, month)))
+        return 0
+
+    name = partition_name(table, month)
+    # Rows can't reach the default partition while they are being moved
+    db.session.execute(text(f"LOCK TABLE {table}_default IN EXCLUSIVE MODE"))
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = db.session.execute(
+        db.insert(_rows_of(name, table)).from_select(list(default_rows.c.keys()), db.select(default_rows).where(in_month))
+    ).rowcount
+    db.session.execute(default_rows.delete().where(in_month))
+    # Indexes, the primary key and foreign keys are added from the parent when attached
+    db.session.execute(text(
+        f"ALTER TABLE {table} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    ))
+    return moved
+
+def _rows_of(source, table):
+    """``table``'s columns read from ``source`` (one of its partitions, or the table itself)."""
+    return db.table(source, *(db.column(column.name, column.type) for column in db.metadata.tables[table].columns))
+
+def _archive(source, table, month, folder):
+    """
+    Write the rows of ``source`` (a partition or the table itself) for one month to a gzipped CSV.
+
+    Returns:
+        Tuple of (archive path, rows written)
+    """
+    rows_of = _rows_of(source, table)
+    query = (
+        db.select(rows_of)
+        .where(rows_of.c.timestamp >= month, rows_of.c.timestamp < add_months(month, 1))
+        .order_by(rows_of.c.timestamp)
+    )
+
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{table}_{month:%Y%m}.csv.gz")
+    suffix = 1
+    while os.path.exists(path):
+        # Stragglers archived by a later run go next to the first archive
+        path = os.path.join(folder, f"{table}_{month:%Y%m}.{suffix}.csv.gz")
+        suffix += 1
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    with gzip.open(temp_path, 'wt', newline='') as archive:
+        writer = csv.writer(archive)
+        writer.writerow(rows_of.c.keys())
+        for row in db.session.execute(query.execution_options(yield_per=5000)):
+            writer.writerow(row)
+            count += 1
+    if count:
+        os.replace(temp_path, path)
+    else:
+        os.remove(temp_path)
+        path = None
+    return path, count
+
+def apply_retention(months=None, archive_folder=None, dry_run=False):
+    """
+    Remove log rows older than the retention period, archiving them first.
+
+    Whole monthly partitions are archived, detached and dropped; rows in
+    non-partitioned tables (or a default partition) are archived and deleted
+    month by month. The report rollups are kept, so reports still cover the
+    removed months. Commits after each month.
+
+    Args:
+        months: Months of logs to keep, including the current one (LOG_RETENTION_MONTHS by default)
+        archive_folder: Folder for gzipped CSV archives, or None to drop without archiving
+        dry_run: Only report what would be removed
+
+    Returns:
+        List of dicts with table, month, rows and archive (path or None)
+    """
+    months = months if months is not None else app.config.get('LOG_RETENTION_MONTHS', 12)
+    cutoff = add_months(month_start(datetime.utcnow()), -(max(months, 1) - 1))
+    removed = []
+
+    for table in PARTITIONED_TABLES:
+        # Rows outside the monthly partitions: the default partition, or the whole table when it isn't partitioned
+        loose_rows = table
+        if is_partitioned(table):
+            loose_rows = f"{table}_default"
+            for name, month in list_partitions(table):
+                if add_months(month, 1) > cutoff:
+                    break
+                rows = db.session.execute(text(f"SELECT count(*) FROM {name}")).scalar_one()
+                if not dry_run:
+                    path = _archive(name, table, month, archive_folder)[0] if archive_folder else None
+                    db.session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    db.session.execute(text(f"DROP TABLE {name}"))
+                    db.session.commit()
+                else:
+                    path = None
+                removed.append({"table": table, "month": month, "rows": rows, "archive": path})
+
+        rows_of = _rows_of(loose_rows, table)
+        oldest = db.session.execute(
+            db.select(func.min(rows_of.c.timestamp)).where(rows_of.c.timestamp < cutoff)
+        ).scalar()
+        month = month_start(oldest) if oldest is not None else cutoff
+        while month < cutoff:
+            in_month = (rows_of.c.timestamp >= month) & (rows_of.c.timestamp < add_months(month, 1))
+            rows = db.session.execute(db.select(func.count()).select_from(rows_of).where(in_month)).scalar_one()
+            path = None
+            if rows and not dry_run:
+                path = _archive(loose_rows, table, month, archive_folder)[0] if archive_folder else None
+                db.session.execute(rows_of.delete().where(in_month))
+                db.session.commit()
+            if rows:
+                removed.append({"table": table, "month": month, "rows": rows, "archive": path})
+            month = add_months(month, 1)
+
+    if not dry_run:
+        logger.info(f"Log retention removed {len(removed)} month(s) before {cutoff:%Y-%m}")
+    return removed
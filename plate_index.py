@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from app import app, db
+from models import VehiclePlate
+
+logger = logging.getLogger(__name__)
+
+# Registered plate fields the detection path needs, detached from the session
+PlateEntry = namedtuple('PlateEntry', ['id', 'plate_number', 'owner_name', 'vehicle_make',
+                                       'vehicle_model', 'is_authorized'])
+
+# A registered plate matched by a read, the edit distance between them, and
+# whether they differ only by OCR confusions (O/0, B/8...) so the match may
+# stand in for the plate when checking authorization
+PlateMatch = namedtuple('PlateMatch', ['plate', 'distance', 'confusions_only'])
+
+# Characters OCR commonly mistakes for each other; swapping one for its pair
+# costs half an edit
+CONFUSABLE_PAIRS = ['O0', 'Q0', 'D0', 'I1', 'L1', 'T1', 'B8', 'S5', 'Z2', 'G6', 'A4']
+
+_CONFUSABLE = {frozenset(pair) for pair in CONFUSABLE_PAIRS}
+
+# Distances are computed in half edits so they stay integers
+_UNIT = 2
+
+def _substitution_cost(a, b):
+    if a == b:
+        return 0
+    return 1 if frozenset((a, b)) in _CONFUSABLE else _UNIT
+
+def plate_distance(a, b):
+    """
+    Confusion-aware edit distance between two normalised plates, in half edits.
+
+    Insertions, deletions and substitutions cost 2; substituting one
+    character of a confusable pair for the other (O/0, I/1, B/8, ...) costs 1.
+    PlateTrie.search computes the same distance incrementally.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(0, _UNIT * (len(b) + 1), _UNIT))
+    for i, ca in enumerate(a, 1):
+        current = [i * _UNIT]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + _UNIT,
+                current[j - 1] + _UNIT,
+                previous[j - 1] + _substitution_cost(ca, cb),
+            ))
+        previous = current
+    return previous[-1]
+
+def only_confusions(a, b):
+    """Whether two normalised plates are equal up to confusable character swaps."""
+    return len(a) == len(b) and all(_substitution_cost(ca, cb) < _UNIT for ca, cb in zip(a, b))
+
+class PlateTrie:
+    """
+    Character trie of plates searched with a plate_distance edit row per node.
+
+    Walking the trie shares the edit-distance rows of common prefixes, and a
+    branch is abandoned as soon as every entry of its row exceeds the search
+    radius, so a bounded search touches only the few prefixes that are still
+    within reach of the read rather than every stored plate.
+    """
+
+    _END = ''  # child key marking a complete plate
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, plate):
+        node = self._root
+        for char in plate:
+            node = node.setdefault(char, {})
+        if self._END not in node:
+            node[self._END] = plate
+            self.size += 1
+
+    def search(self, plate, max_distance):
+        """
+        Every stored plate within ``max_distance`` (half edits) of ``plate``.
+
+        Returns:
+            List of (distance, plate) tuples
+        """
+        found = []
+        first_row = list(range(0, _UNIT * (len(plate) + 1), _UNIT))
+        stack = [(self._root, first_row)]
+        while stack:
+            node, row = stack.pop()
+            for char, child in node.items():
+                if char == self._END:
+                    continue
+                current = [row[0] + _UNIT]
+                for j, target in enumerate(plate, 1):
+                    current.append(min(
+                        row[j] + _UNIT,
+                        current[j - 1] + _UNIT,
+                        row[j - 1] + _substitution_cost(char, target),
+                    ))
+                if current[-1] <= max_distance and self._END in child:
+                    found.append((current[-1], child[self._END]))
+                if min(current) <= max_distance:
+                    stack.append((child, current))
+        return found
+
+class OrganizationPlates:
+    """Registered plates of one organization: a dict for exact reads, a trie for the rest."""
+
+    def __init__(self, entries):
+        self.entries = {entry.plate_number: entry for entry in entries}
+        self.trie = PlateTrie()
+        for plate_number in self.entries:
+            self.trie.add(plate_number)
+        self.loaded = time.monotonic()
+
+    def match(self, plate_number, max_distance):
+        entry = self.entries.get(plate_number)
+        if entry is not None:
+            return PlateMatch(entry, 0.0, True)
+        if max_distance <= 0:
+            return None
+
+        candidates = self.trie.search(plate_number, max_distance)
+        if not candidates:
+            return None
+        candidates.sort()
+        # Two registered plates equally close to the read: refuse to guess
+        if len(candidates) > 1 and candidates[0][0] == candidates[1][0]:
+            logger.info(f"Plate read {plate_number} is equally close to "
+                        f"{candidates[0][1]} and {candidates[1][1]}; not matching")
+            return None
+        distance, matched = candidates[0]
+        return PlateMatch(self.entries[matched], distance / float(_UNIT), only_confusions(plate_number, matched))
+
+class PlateIndex:
+    """
+    Per-process cache of each organization's registered plates.
+
+    Replaces the VehiclePlate query per detection with an O(1) dict lookup,
+    falling back to a bounded trie search for reads within PLATE_MATCH_MAX_DISTANCE
+    edits of a registered plate (OCR confusions such as O/0 count as half an
+    edit). A match that needs any other edit is only a suggestion: it does
+    not make the read authorized (see PlateMatch.confusions_only).
+    /register-plate invalidates its organization in this process;
+    changes made by other processes are picked up after PLATE_INDEX_TTL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._organizations = {}
+        self._generation = 0
+
+    def _load(self, organization):
+        rows = db.session.execute(
+            db.select(VehiclePlate.id, VehiclePlate.plate_number, VehiclePlate.owner_name,
+                      VehiclePlate.vehicle_make, VehiclePlate.vehicle_model, VehiclePlate.is_authorized)
+            .filter_by(organization_id=organization)
+        ).all()
+        plates = OrganizationPlates(PlateEntry(*row) for row in rows)
+        logger.debug(f"Loaded {len(plates.entries)} registered plates for {organization}")
+        return plates
+
+    def get(self, organization):
+        """The organization's plates, loading them if missing or expired."""
+        ttl = app.config.get('PLATE_INDEX_TTL', 30)
+        with self._lock:
+            plates = self._organizations.get(organization)
+            generation = self._generation
+        if plates is not None and time.monotonic() - plates.loaded < ttl:
+            return plates
+
+        plates = self._load(organization)
+        with self._lock:
+            # Don't cache a load that raced with an invalidation
+            if generation == self._generation:
+                self._organizations[organization] = plates
+        return plates
+
+    def match(self, plate_number, organization, max_distance=None):
+        """
+        Find the registered plate a read refers to.
+
+        Args:
+            plate_number: Normalised plate read
+            organization: Organization whose plates are searched
+            max_distance: Edits allowed (defaults to PLATE_MATCH_MAX_DISTANCE;
+                          0 for exact matches only)
+
+        Returns:
+            PlateMatch, or None if no registered plate is close enough or
+            several are equally close
+        """
+        if max_distance is None:
+            max_distance = app.config.get('PLATE_MATCH_MAX_DISTANCE', 0.5)
+        return self.get(organization).match(plate_number, int(round(max_distance * _UNIT)))
+
+    def invalidate(self, organization=None):
+        """Drop one organization's plates (or every organization's)."""
+        with self._lock:
+            self._generation += 1
+            if organization is None:
+                self._organizations.clear()
+            else:
+                self._organizations.pop(organization, None)
+
+# Shared index for this process
+plate_index = PlateIndex()
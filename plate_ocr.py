@@ -0,0 +1,206 @@
+import logging
+import re
+import threading
+
+import numpy as np
+import cv2
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+PLATE_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+
+def normalize_plate(text):
+    """
+    Canonical form of a plate number: upper case letters and digits only.
+
+    'abc-1234', 'ABC 1234' and 'ABC.1234' all become 'ABC1234', so registered
+    plates and OCR output compare equal regardless of separators.
+    """
+    if not text:
+        return ''
+    return _NON_ALPHANUMERIC.sub('', text.upper())
+
+def is_plausible_plate(text):
+    """Whether a normalised string looks like a plate rather than OCR noise."""
+    min_length = app.config.get('PLATE_MIN_LENGTH', 4)
+    max_length = app.config.get('PLATE_MAX_LENGTH', 10)
+    return min_length <= len(text) <= max_length and any(c.isdigit() for c in text)
+
+def prepare_plate_crop(crop, height=32):
+    """
+    Normalise a plate crop for recognition.
+
+    Returns a grayscale image of the given height with dark characters on a
+    light background, whatever the plate's own colours are.
+    """
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    h, w = crop.shape
+    width = max(1, int(round(w * height / max(h, 1))))
+    crop = cv2.resize(crop, (width, height), interpolation=cv2.INTER_CUBIC)
+    _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Characters cover less area than the plate background
+    if np.count_nonzero(binary) < binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+class PlateRecognizer:
+    """
+    Reads the text on cropped plate images.
+
+    ``recognize`` takes a batch of crops (from one frame or several) and
+    returns one (text, confidence) pair per crop, with the text normalised
+    and confidence in 0-1; unreadable crops give ('', 0.0).
+    """
+
+    name = None
+
+    def recognize(self, crops):
+        raise NotImplementedError
+
+class TesseractRecognizer(PlateRecognizer):
+    """
+    Tesseract via pytesseract.
+
+    The batch is stacked into a single page, one crop per line, so a batch
+    costs one tesseract process instead of one per crop; words are mapped
+    back to their crop by vertical position.
+    """
+
+    name = 'tesseract'
+
+    LINE_HEIGHT = 48
+    GAP = 24
+
+    def __init__(self):
+        if not TESSERACT_AVAILABLE:
+            raise RuntimeError("pytesseract is not installed")
+        self.config = f"--psm 6 -c tessedit_char_whitelist={PLATE_ALPHABET}"
+
+    def recognize(self, crops):
+        if not crops:
+            return []
+
+        lines = [prepare_plate_crop(crop, self.LINE_HEIGHT) for crop in crops]
+        width = max(line.shape[1] for line in lines) + 2 * self.GAP
+        pitch = self.LINE_HEIGHT + self.GAP
+        page = np.full((self.GAP + pitch * len(lines), width), 255, dtype=np.uint8)
+        for i, line in enumerate(lines):
+            top = self.GAP + i * pitch
+            page[top:top + self.LINE_HEIGHT, self.GAP:self.GAP + line.shape[1]] = line
+
+        data = pytesseract.image_to_data(page, config=self.config, output_type=pytesseract.Output.DICT)
+
+        words = [[] for _ in crops]
+        for text, conf, top, height, left in zip(data['text'], data['conf'], data['top'], data['height'], data['left']):
+            conf = float(conf)
+            if not text.strip() or conf < 0:
+                continue
+            index = int((top + height / 2 - self.GAP) // pitch)
+            if 0 <= index < len(crops):
+                words[index].append((left, text, conf))
+
+        results = []
+        for line_words in words:
+            line_words.sort()
+            text = normalize_plate(''.join(text for _, text, _ in line_words))
+            confidence = min((conf for _, _, conf in line_words), default=0.0) / 100.0
+            results.append((text, confidence) if text else ('', 0.0))
+        return results
+
+class CRNNRecognizer(PlateRecognizer):
+    """
+    A CRNN text recognition model (ONNX or any format cv2.dnn reads) on CPU.
+
+    Crops are resized to the model input and run as one blob; the output is
+    CTC-decoded greedily with the blank at index 0 followed by
+    PLATE_OCR_ALPHABET. Confidence is the geometric mean of the emitted
+    characters' probabilities.
+    """
+
+    name = 'crnn'
+
+    def __init__(self, model_path, alphabet=PLATE_ALPHABET, input_size=(100, 32)):
+        if not model_path:
+            raise RuntimeError("PLATE_OCR_MODEL is not set")
+        self.net = cv2.dnn.readNet(model_path)
+        self.alphabet = alphabet
+        self.input_size = input_size
+
+    def recognize(self, crops):
+        if not crops:
+            return []
+
+        width, height = self.input_size
+        images = [cv2.resize(prepare_plate_crop(crop, height), (width, height)) for crop in crops]
+        blob = cv2.dnn.blobFromImages(images, scalefactor=1 / 127.5, size=(width, height), mean=127.5)
+        self.net.setInput(blob)
+        output = self.net.forward()
+
+        # (T, N, C) from most CRNN exports; accept (N, T, C) too
+        output = np.squeeze(output)
+        if output.ndim == 2:
+            output = output[:, None, :] if len(crops) == 1 else output[None]
+        if output.shape[1] != len(crops) and output.shape[0] == len(crops):
+            output = output.transpose(1, 0, 2)
+
+        probs = output
+        if not np.allclose(probs.sum(axis=2), 1.0, atol=1e-3):
+            exp = np.exp(output - output.max(axis=2, keepdims=True))
+            probs = exp / exp.sum(axis=2, keepdims=True)
+
+        return [self._decode(probs[:, i, :]) for i in range(len(crops))]
+
+    def _decode(self, probs):
+        best = probs.argmax(axis=1)
+        chars, confidences = [], []
+        previous = 0
+        for t, index in enumerate(best):
+            if index != 0 and index != previous and index - 1 < len(self.alphabet):
+                chars.append(self.alphabet[index - 1])
+                confidences.append(probs[t, index])
+            previous = index
+
+        text = normalize_plate(''.join(chars))
+        if not text:
+            return '', 0.0
+        return text, float(np.exp(np.mean(np.log(np.maximum(confidences, 1e-9)))))
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+def get_recognizer():
+    """
+    The recognizer selected by PLATE_OCR_BACKEND, created once per process.
+
+    Returns:
+        A PlateRecognizer, or None if the backend is 'none' or unavailable
+    """
+    global _recognizer
+    with _recognizer_lock:
+        if _recognizer is None:
+            backend = app.config.get('PLATE_OCR_BACKEND', 'tesseract')
+            try:
+                if backend == 'tesseract':
+                    _recognizer = TesseractRecognizer()
+                elif backend == 'crnn':
+                    _recognizer = CRNNRecognizer(
+                        app.config.get('PLATE_OCR_MODEL'),
+                        app.config.get('PLATE_OCR_ALPHABET', PLATE_ALPHABET),
+                    )
+                else:
+                    _recognizer = False
+            except Exception as e:
+                logger.warning(f"Plate OCR backend '{backend}' unavailable: {str(e)}")
+                _recognizer = False
+        return _recognizer or None
@@ -0,0 +1,200 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import User, AttendanceRecord, PlateDetectionLog, AttendanceRollup, PlateDetectionRollup
+
+logger = logging.getLogger(__name__)
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def truncate_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+def _increment(model, keys, increments, **columns):
+    """
+    Add ``increments`` to the rollup row identified by ``keys``.
+
+    The row is created if needed, with ``columns`` filled in; all in the
+    caller's transaction, so the rollup commits or rolls back with the log
+    rows it counts. That also means the row stays locked until the caller
+    commits: concurrent transactions counting into the same row (one
+    organization's detections within an hour) wait for each other. Callers
+    count a whole batch at once, and with LOG_WRITE_BEHIND the log writer's
+    single thread does all the counting, so there is nothing to wait for.
+    """
+    table = model.__table__
+    insert = _UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        statement = insert(table).values(**keys, **increments, **columns)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + statement.excluded[column] for column in increments}
+        )
+        db.session.execute(statement)
+        return
+
+    # Other databases: update, then insert if there was no row yet
+    match = [table.c[column] == value for column, value in keys.items()]
+    result = db.session.execute(
+        table.update().where(*match).values({column: table.c[column] + value for column, value in increments.items()})
+    )
+    if not result.rowcount:
+        db.session.execute(table.insert().values(**keys, **increments, **columns))
+
+def count_check_ins(check_ins):
+    """
+    Add new attendance records to the daily rollup.
+
+    Args:
+        check_ins: Iterable of (user_id, check_in_time)
+    """
+    counts = Counter((user_id, when.date()) for user_id, when in check_ins)
+    # Rows are locked in key order, so two batches can't deadlock
+    for (user_id, day), count in sorted(counts.items()):
+        _increment(AttendanceRollup, {'user_id': user_id, 'day': day}, {'check_ins': count})
+
+def count_plate_detections(detections):
+    """
+    Add new plate detection log entries to the hourly rollup, one row update per organization and hour.
+
+    Args:
+        detections: Iterable of (organization, timestamp, is_authorized)
+    """
+    counts = {}
+    for organization, timestamp, is_authorized in detections:
+        total = counts.setdefault((organization, truncate_hour(timestamp)), [0, 0])
+        total[0] += 1
+        if not is_authorized:
+            total[1] += 1
+    # Rows are locked in key order, so two batches can't deadlock
+    for (organization, hour), (count, unauthorized) in sorted(counts.items()):
+        _increment(PlateDetectionRollup, {'organization_id': organization, 'hour': hour},
+                   {'detections': count, 'unauthorized': unauthorized})
+
+def attendance_by_day(start, end, organization=None, user_id=None):
+    """
+    Check-ins per day from the rollup.
+
+    Args:
+        start: First day (date, inclusive)
+        end: Last day (date, inclusive)
+        organization: Count every current user of this organization...
+        user_id: ...or only this user
+
+    Returns:
+        List of (day, count) tuples in date order, days without check-ins omitted
+    """
+    query = db.select(AttendanceRollup.day, func.sum(AttendanceRollup.check_ins)).where(
+        AttendanceRollup.day >= start, AttendanceRollup.day <= end
+    )
+    if user_id is not None:
+        query = query.where(AttendanceRollup.user_id == user_id)
+    else:
+        # Like the reports on the raw records: users who moved bring their history with them
+        query = query.join(User, AttendanceRollup.user_id == User.id).where(User.organization == organization)
+    rows = db.session.execute(query.group_by(AttendanceRollup.day).order_by(AttendanceRollup.day)).all()
+    return [(day, int(count)) for day, count in rows if count]
+
+def plate_detections_by_period(organization, start, end, granularity='day'):
+    """
+    Plate detections per day or hour from the hourly rollup.
+
+    Args:
+        organization: Organization the detections belong to
+        start: First day (date, inclusive)
+        end: Last day (date, inclusive)
+        granularity: 'day' or 'hour'
+
+    Returns:
+        List of (period start datetime, detections, unauthorized) tuples in order
+    """
+    start_hour = datetime.combine(start, datetime.min.time())
+    end_hour = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    rows = db.session.execute(
+        db.select(PlateDetectionRollup.hour, PlateDetectionRollup.detections, PlateDetectionRollup.unauthorized)
+        .where(PlateDetectionRollup.organization_id == organization,
+               PlateDetectionRollup.hour >= start_hour,
+               PlateDetectionRollup.hour < end_hour)
+        .order_by(PlateDetectionRollup.hour)
+    ).all()
+    if granularity == 'hour':
+        return [tuple(row) for row in rows if row[1]]
+
+    # At most 24 rows per day, so folding hours into days here is cheap
+    days = {}
+    for hour, detections, unauthorized in rows:
+        day = datetime.combine(hour.date(), datetime.min.time())
+        total = days.setdefault(day, [0, 0])
+        total[0] += detections
+        total[1] += unauthorized
+    return [(day, detections, unauthorized) for day, (detections, unauthorized) in days.items() if detections]
+
+def rebuild_rollups(start, end, batch_size=5000):
+    """
+    Recompute both rollups for a range of days from the raw logs.
+
+    Used to backfill after an upgrade and to repair counts after the logs
+    were changed outside the application (e.g. rows deleted by hand).
+    Commits.
+
+    Args:
+        start: First day (date, inclusive)
+        end: Last day (date, inclusive)
+
+    Returns:
+        Tuple of (attendance rollup rows, plate rollup rows) written
+    """
+    start_time = datetime.combine(start, datetime.min.time())
+    end_time = datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+    check_ins = Counter()
+    records = db.session.execute(
+        db.select(AttendanceRecord.user_id, AttendanceRecord.check_in_time)
+        .where(AttendanceRecord.check_in_time >= start_time, AttendanceRecord.check_in_time < end_time)
+        .execution_options(yield_per=batch_size)
+    )
+    for user_id, check_in_time in records:
+        check_ins[(user_id, check_in_time.date())] += 1
+
+    detections = Counter()
+    unauthorized = Counter()
+    logs = db.session.execute(
+        db.select(PlateDetectionLog.organization_id, PlateDetectionLog.timestamp, PlateDetectionLog.is_authorized)
+        .where(PlateDetectionLog.timestamp >= start_time, PlateDetectionLog.timestamp < end_time)
+        .execution_options(yield_per=batch_size)
+    )
+    for organization, timestamp, is_authorized in logs:
+        key = (organization, truncate_hour(timestamp))
+        detections[key] += 1
+        if not is_authorized:
+            unauthorized[key] += 1
+
+    db.session.execute(AttendanceRollup.__table__.delete().where(
+        AttendanceRollup.day >= start, AttendanceRollup.day <= end))
+    db.session.execute(PlateDetectionRollup.__table__.delete().where(
+        PlateDetectionRollup.hour >= start_time, PlateDetectionRollup.hour < end_time))
+
+    if check_ins:
+        db.session.execute(AttendanceRollup.__table__.insert(), [
+            {'user_id': user_id, 'day': day, 'check_ins': count}
+            for (user_id, day), count in check_ins.items()
+        ])
+    if detections:
+        db.session.execute(PlateDetectionRollup.__table__.insert(), [
+            {'organization_id': organization, 'hour': hour, 'detections': count,
+             'unauthorized': unauthorized[(organization, hour)]}
+            for (organization, hour), count in detections.items()
+        ])
+    db.session.commit()
+
+    logger.info(f"Rebuilt rollups for {start} to {end}: {len(check_ins)} attendance, {len(detections)} plate rows")
+    return len(check_ins), len(detections)
@@ -1,13 +1,30 @@
-import os
+import io
+import json
 import logging
+import threading
+import time
 from datetime import datetime
-from flask import render_template, redirect, url_for, flash, request, jsonify, Response
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
 from app import app, db
-from models import User, FaceData, VehiclePlate, ParkingSpace, AttendanceRecord, PlateDetectionLog, ParkingLog
-from computer_vision import process_face_recognition, process_plate_detection, analyze_parking_spaces
+from models import User, FaceData, VehiclePlate, ParkingSpace, AttendanceRecord, PlateDetectionLog, ParkingLog, CameraCalibration, ParkingROI
+from computer_vision import process_face_recognition, process_face_batch, process_plate_detection, analyze_parking_spaces
+from face_gallery import face_gallery
+from cv_workers import CVWorkerError, CVOverloadedError
+from jobs import job_queue, JobQueueFullError, FINISHED_STATES
+from detections import record_attendance, record_plate_detection
+from plate_ocr import normalize_plate
+from plate_index import plate_index
+from upload_store import upload_store
+from rollups import attendance_by_day, plate_detections_by_period
+from dashboard_stats import dashboard_stats
+from live_events import live_events
+from partitions import history_since
+from parking_rois import DEFAULT_CAMERA, CalibrationError, ReferenceFrame, calibration_cache, reference_frames, calibration_to_dict, compile_calibration, validate_polygon, validate_thresholds
 
 logger = logging.getLogger(__name__)
 
@@ -109,30 +126,16 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Get summary data for dashboard
-    face_count = AttendanceRecord.query.filter(
-        AttendanceRecord.user_id == current_user.id,
-        AttendanceRecord.check_in_time >= datetime.now().replace(hour=0, minute=0, second=0)
-    ).count()
-    
-    # For admin, show organization-wide stats
-    if current_user.role == 'admin':
-        org = current_user.organization
-        plate_count = PlateDetectionLog.query.filter_by(organization_id=org).count()
-        parking_spaces = ParkingSpace.query.filter_by(organization_id=org).count()
-        occupied_spaces = ParkingSpace.query.filter_by(organization_id=org, is_occupied=True).count()
-    else:
-        plate_count = 0
-        parking_spaces = 0
-        occupied_spaces = 0
+    # Summary numbers come from one query, cached for a few seconds per organization
+    stats = dashboard_stats.get(current_user.organization, current_user.id, admin=current_user.role == 'admin')
     
     return render_template(
         'dashboard.html',
-        face_count=face_count,
-        plate_count=plate_count,
-        parking_spaces=parking_spaces,
-        occupied_spaces=occupied_spaces,
-        free_spaces=parking_spaces - occupied_spaces
+        face_count=stats["face_count"],
+        plate_count=stats.get("plate_count", 0),
+        parking_spaces=stats.get("parking_spaces", 0),
+        occupied_spaces=stats.get("occupied_spaces", 0),
+        free_spaces=stats.get("free_spaces", 0)
     )
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -143,13 +146,17 @@ def profile():
         last_name = request.form.get('last_name')
         organization = request.form.get('organization')
         
-        current_user.first_name = first_name
-        current_user.last_name = last_name
-        current_user.organization = organization
+        # current_user is a cached snapshot; change the row itself
+        user = current_user.load()
+        user.first_name = first_name
+        user.last_name = last_name
+        user.organization = organization
         
         try:
             db.session.commit()
             flash('Profile updated successfully!', 'success')
+            # The commit dropped the cached identity; the next request loads the new one
+            return redirect(url_for('profile'))
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error updating profile: {str(e)}")
@@ -202,8 +209,14 @@ def register_face():
         db.session.add(face_data)
         db.session.commit()
         
+        # Keep the in-memory gallery in step with the table
+        face_gallery.replace_user(current_user.id, face_data.id, face_encoding)
+        
         return jsonify({"success": True, "message": "Face registered successfully"})
     
+    except CVWorkerError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error registering face: {str(e)}")
@@ -227,41 +240,78 @@ def face_attendance():
         if user_id is None:
             return jsonify({"success": False, "message": "Face not recognized or no face detected"}), 400
         
-        # Check if user already has an open attendance record for today
-        today = datetime.now().date()
-        existing_record = AttendanceRecord.query.filter(
-            AttendanceRecord.user_id == user_id,
-            AttendanceRecord.check_in_time >= today,
-            AttendanceRecord.check_out_time.is_(None)
-        ).first()
+        event = record_attendance([user_id])[0]
+        db.session.commit()
+        dashboard_stats.invalidate(user_ids=[user_id])
         
-        if existing_record:
-            # Mark checkout time
-            existing_record.check_out_time = datetime.now()
-            db.session.commit()
-            return jsonify({
-                "success": True, 
-                "message": "Check-out recorded successfully",
-                "type": "check_out",
-                "time": existing_record.check_out_time.strftime("%H:%M:%S")
-            })
+        if event["repeat"]:
+            message = "Check-out already recorded" if event["type"] == "check_out" else "Check-in already recorded"
+        elif event["type"] == "check_out":
+            message = "Check-out recorded successfully"
         else:
-            # Create new attendance record
-            new_record = AttendanceRecord(user_id=user_id)
-            db.session.add(new_record)
-            db.session.commit()
-            return jsonify({
-                "success": True, 
-                "message": "Check-in recorded successfully",
-                "type": "check_in",
-                "time": new_record.check_in_time.strftime("%H:%M:%S")
-            })
+            message = "Check-in recorded successfully"
+        
+        return jsonify({
+            "success": True, 
+            "message": message,
+            "type": event["type"],
+            "time": event["time"],
+            "repeat": event["repeat"]
+        })
     
+    except CVWorkerError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error recording attendance: {str(e)}")
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
+@app.route('/face-attendance/batch', methods=['POST'])
+@login_required
+def face_attendance_batch():
+    files = [f for f in request.files.getlist('face_images') if f.filename]
+    
+    if not files:
+        return jsonify({"success": False, "message": "No files provided"}), 400
+    
+    max_images = app.config['FACE_BATCH_MAX_IMAGES']
+    if len(files) > max_images:
+        return jsonify({"success": False, "message": f"At most {max_images} images per batch"}), 400
+    
+    try:
+        # Encode every face in every image and match them all in one pass
+        image_results = process_face_batch(files)
+        
+        # A person seen in several frames of the burst is recorded once
+        user_ids = []
+        for faces in image_results:
+            for face in faces:
+                if face["user_id"] is not None and face["user_id"] not in user_ids:
+                    user_ids.append(face["user_id"])
+        
+        events = record_attendance(user_ids)
+        db.session.commit()
+        dashboard_stats.invalidate(user_ids=user_ids)
+        
+        return jsonify({
+            "success": True,
+            "message": f"Recognized {len(user_ids)} people in {len(files)} images",
+            "images": [
+                {"filename": file.filename, "faces": faces}
+                for file, faces in zip(files, image_results)
+            ],
+            "events": events
+        })
+    
+    except CVWorkerError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error recording batch attendance: {str(e)}")
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+
 # License plate detection routes
 @app.route('/plate-detection')
 @login_required
@@ -270,10 +320,11 @@ def plate_detection():
     from flask_wtf import FlaskForm
     form = FlaskForm()
     
-    # Get recent plate detections
+    # Get recent plate detections (bounded in time so only the recent monthly partitions are scanned)
     if current_user.role == 'admin':
-        plate_logs = PlateDetectionLog.query.filter_by(
-            organization_id=current_user.organization
+        plate_logs = PlateDetectionLog.query.filter(
+            PlateDetectionLog.organization_id == current_user.organization,
+            PlateDetectionLog.timestamp >= history_since()
         ).order_by(PlateDetectionLog.timestamp.desc()).limit(20).all()
         
         # Get registered plates
@@ -295,7 +346,8 @@ def register_plate():
     if current_user.role != 'admin':
         return jsonify({"success": False, "message": "Unauthorized access"}), 403
     
-    plate_number = request.form.get('plate_number')
+    # Stored normalised so OCR output ('ABC1234') matches 'abc-1234'
+    plate_number = normalize_plate(request.form.get('plate_number'))
     owner_name = request.form.get('owner_name')
     vehicle_make = request.form.get('vehicle_make')
     vehicle_model = request.form.get('vehicle_model')
@@ -311,15 +363,7 @@ def register_plate():
             organization_id=current_user.organization
         ).first()
         
-        if existing_plate:
-            # Update existing plate
-            existing_plate.owner_name = owner_name
-            existing_plate.vehicle_make = vehicle_make
-            existing_plate.vehicle_model = vehicle_model
-            existing_plate.is_authorized = is_authorized
-            db.session.commit()
-            return jsonify({"success": True, "message": "Plate updated successfully"})
-        else:
+        if not existing_plate:
             # Create new plate
             new_plate = VehiclePlate(
                 plate_number=plate_number,
@@ -329,9 +373,27 @@ def register_plate():
                 is_authorized=is_authorized,
                 organization_id=current_user.organization
             )
-            db.session.add(new_plate)
-            db.session.commit()
-            return jsonify({"success": True, "message": "Plate registered successfully"})
+            try:
+                with db.session.begin_nested():
+                    db.session.add(new_plate)
+                db.session.commit()
+                plate_index.invalidate(current_user.organization)
+                return jsonify({"success": True, "message": "Plate registered successfully"})
+            except IntegrityError:
+                # Registered by a concurrent request since the lookup; update that row
+                existing_plate = VehiclePlate.query.filter_by(
+                    plate_number=plate_number,
+                    organization_id=current_user.organization
+                ).one()
+        
+        # Update existing plate
+        existing_plate.owner_name = owner_name
+        existing_plate.vehicle_make = vehicle_make
+        existing_plate.vehicle_model = vehicle_model
+        existing_plate.is_authorized = is_authorized
+        db.session.commit()
+        plate_index.invalidate(current_user.organization)
+        return jsonify({"success": True, "message": "Plate updated successfully"})
     
     except Exception as e:
         db.session.rollback()
@@ -349,59 +411,83 @@ def detect_plate():
     if file.filename == '':
         return jsonify({"success": False, "message": "No file selected"}), 400
     
+    camera_id = request.form.get('camera_id') or None
+    
+    if _wants_job():
+        return _submit_job('plate', file, camera_id=camera_id)
+    
     try:
-        # Process the image to detect license plate
-        plate_number, confidence = process_plate_detection(file)
-        
-        if not plate_number:
-            return jsonify({"success": False, "message": "No plate detected in the image"}), 400
-        
-        # Check if plate is authorized
-        plate_record = VehiclePlate.query.filter_by(
-            plate_number=plate_number,
-            organization_id=current_user.organization
-        ).first()
-        
-        is_authorized = False
-        owner_name = "Unknown"
-        vehicle_info = ""
-        
-        if plate_record:
-            is_authorized = plate_record.is_authorized
-            owner_name = plate_record.owner_name or "Unknown"
-            if plate_record.vehicle_make and plate_record.vehicle_model:
-                vehicle_info = f"{plate_record.vehicle_make} {plate_record.vehicle_model}"
-        
-        # Save detection log
-        filename = secure_filename(f"plate_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg")
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.seek(0)  # Reset file pointer before saving
-        file.save(file_path)
-        
-        log_entry = PlateDetectionLog(
-            plate_number=plate_number,
-            confidence=confidence,
-            is_authorized=is_authorized,
-            image_path=f"uploads/{filename}",
-            organization_id=current_user.organization
-        )
-        db.session.add(log_entry)
-        db.session.commit()
-        
-        return jsonify({
-            "success": True,
-            "plate_number": plate_number,
-            "confidence": confidence,
-            "is_authorized": is_authorized,
-            "owner_name": owner_name,
-            "vehicle_info": vehicle_info
-        })
+        body, status = _detect_plate_in_image(file, current_user.organization, camera_id)
+        return jsonify(body), status
     
+    except CVWorkerError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error detecting plate: {str(e)}")
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
+def _detect_plate_in_image(file, organization, camera_id=None):
+    """
+    Detect a plate in an uploaded image, look it up and log the detection.
+    
+    Args:
+        file: The uploaded image file
+        organization: Organization the detection is recorded for
+        camera_id: Optional gate camera the image came from; selects its
+            PLATE_GATE_ROIS search region and is logged as the location
+        
+    Returns:
+        Tuple of (response body dict, HTTP status)
+    """
+    # Read the upload once: the same bytes are analysed and saved
+    image_data = file.read()
+    
+    # Process the image to detect license plate
+    plate_number, confidence = process_plate_detection(image_data, camera_id)
+    
+    if not plate_number:
+        return {"success": False, "message": "No plate detected in the image"}, 400
+    
+    # Save the evidence image (written in the background, once per distinct frame)
+    image_path = upload_store.save(image_data, 'plates', filename=file.filename)
+    
+    # Check if plate is authorized and log the detection
+    log_entry, match = record_plate_detection(
+        plate_number, confidence, organization, image_path=image_path, location=camera_id
+    )
+    db.session.commit()
+    dashboard_stats.invalidate(organization)
+    
+    is_authorized = log_entry.is_authorized
+    owner_name = "Unknown"
+    vehicle_info = ""
+    matched_plate = None
+    match_distance = None
+    match_confusions_only = None
+    
+    if match:
+        plate_record = match.plate
+        owner_name = plate_record.owner_name or "Unknown"
+        if plate_record.vehicle_make and plate_record.vehicle_model:
+            vehicle_info = f"{plate_record.vehicle_make} {plate_record.vehicle_model}"
+        matched_plate = plate_record.plate_number
+        match_distance = match.distance
+        match_confusions_only = match.confusions_only
+    
+    return {
+        "success": True,
+        "plate_number": plate_number,
+        "confidence": confidence,
+        "is_authorized": is_authorized,
+        "owner_name": owner_name,
+        "vehicle_info": vehicle_info,
+        "matched_plate": matched_plate,
+        "match_distance": match_distance,
+        "match_confusions_only": match_confusions_only
+    }, 200
+
 # Parking space analysis routes
 @app.route('/parking-analysis')
 @login_required
@@ -419,9 +505,10 @@ def parking_analysis():
         organization_id=current_user.organization
     ).all()
     
-    # Get recent parking logs
+    # Get recent parking logs (bounded in time so only the recent monthly partitions are scanned)
     parking_logs = ParkingLog.query.join(ParkingSpace).filter(
-        ParkingSpace.organization_id == current_user.organization
+        ParkingSpace.organization_id == current_user.organization,
+        ParkingLog.timestamp >= history_since()
     ).order_by(ParkingLog.timestamp.desc()).limit(20).all()
     
     return render_template('parking_analysis.html', 
@@ -459,8 +546,18 @@ def add_parking_space():
             is_occupied=False
         )
         db.session.add(new_space)
+        db.session.flush()
+        live_events.stage(current_user.organization, 'parking', {
+            "spaces": [{"id": new_space.id, "identifier": new_space.space_identifier, "occupied": False}],
+            "occupied_change": 0,
+            "total_change": 1
+        })
         db.session.commit()
         
+        # Grid-scored cameras lay spaces out by count; start them afresh
+        reference_frames.reset(current_user.organization)
+        dashboard_stats.invalidate(current_user.organization)
+        
         return jsonify({
             "success": True, 
             "message": "Parking space added successfully",
@@ -491,105 +588,493 @@ def analyze_parking():
     if file.filename == '':
         return jsonify({"success": False, "message": "No file selected"}), 400
     
+    camera_id = request.form.get('camera_id') or DEFAULT_CAMERA
+    
+    if _wants_job():
+        return _submit_job('parking', file, camera_id=camera_id)
+    
     try:
-        # Process the image to analyze parking spaces
-        space_results = analyze_parking_spaces(file)
-        
-        if not space_results:
-            return jsonify({"success": False, "message": "No parking spaces detected in the image"}), 400
+        body, status = _analyze_parking_image(file, current_user.organization, camera_id)
+        return jsonify(body), status
+    
+    except CVWorkerError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error analyzing parking: {str(e)}")
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+
+def _analyze_parking_image(file, organization, camera_id=DEFAULT_CAMERA):
+    """
+    Analyze a parking image and record occupancy changes.
+    
+    Args:
+        file: The uploaded image file
+        organization: Organization whose spaces are updated
+        camera_id: Camera that took the image, selecting its ROI calibration
         
-        # Update parking spaces and create logs
-        updated_spaces = []
+    Returns:
+        Tuple of (response body dict, HTTP status)
+    """
+    image_data = file.read()
+    
+    # Compare with the last frame from this camera before touching the database
+    reference = reference_frames.get(organization, camera_id)
+    if reference is not None:
+        space_results, scores = analyze_parking_spaces(
+            image_data,
+            reference.space_ids,
+            reference.calibration,
+            previous=reference.occupancy,
+            reference=reference.gray
+        )
+        if scores is not None and not scores.changed.any():
+            return {
+                "success": True,
+                "message": "Analysis complete. No changes since the last frame.",
+                "updated_spaces": [],
+                "camera_id": camera_id,
+                "calibrated": reference.calibration is not None
+            }, 200
+    
+    # Load the organization's spaces once; only the columns the diff needs
+    spaces = db.session.execute(
+        select(ParkingSpace.id, ParkingSpace.space_identifier, ParkingSpace.is_occupied)
+        .where(ParkingSpace.organization_id == organization)
+        .order_by(ParkingSpace.id)
+    ).all()
+    space_ids = [space.id for space in spaces]
+    previous = {space.id: space.is_occupied for space in spaces}
+    calibration = calibration_cache.get(organization, camera_id)
+    
+    if reference is not None and (reference.space_ids != space_ids or reference.calibration is not calibration):
+        # Spaces or calibration changed since the reference was taken
+        reference = None
+    
+    if reference is None:
+        # No usable reference: score every space
+        space_results, scores = analyze_parking_spaces(image_data, space_ids, calibration, previous=previous)
+    
+    if scores is None and not space_results:
+        return {"success": False, "message": "No parking spaces detected in the image"}, 400
+    
+    if scores is not None:
+        # The scored frame becomes the reference for the next upload,
+        # replacing a stale entry rather than patching it
+        if reference is not None:
+            reference.gray = scores.gray
+            reference.occupancy.update(space_results)
+        else:
+            reference_frames.put(organization, camera_id, ReferenceFrame(
+                scores.gray, calibration, space_ids, {**previous, **space_results}
+            ))
+    
+    # Diff against the stored state in memory
+    changed = [
+        space for space in spaces
+        if space.id in space_results and space.is_occupied != space_results[space.id]
+    ]
+    updated_spaces = [
+        {"id": space.id, "identifier": space.space_identifier, "occupied": space_results[space.id]}
+        for space in changed
+    ]
+    
+    if changed:
+        now = datetime.utcnow()
         
-        for space_id, is_occupied in space_results.items():
-            # Get the space from database
-            space = ParkingSpace.query.filter_by(
-                id=space_id,
-                organization_id=current_user.organization
-            ).first()
-            
-            if space and space.is_occupied != is_occupied:
-                # Status changed, update and log
-                space.is_occupied = is_occupied
-                
-                # Create log entry
-                log_entry = ParkingLog(
-                    space_id=space.id,
-                    is_occupied=is_occupied,
-                    vehicle_plate=None  # We don't know the plate from image analysis alone
+        # One UPDATE per new state instead of one round-trip per space
+        for is_occupied in (True, False):
+            ids = [space.id for space in changed if space_results[space.id] == is_occupied]
+            if ids:
+                db.session.execute(
+                    update(ParkingSpace)
+                    .where(ParkingSpace.id.in_(ids), ParkingSpace.organization_id == organization)
+                    .values(is_occupied=is_occupied, last_updated=now)
+                    .execution_options(synchronize_session=False)
                 )
-                db.session.add(log_entry)
-                
-                updated_spaces.append({
-                    "id": space.id,
-                    "identifier": space.space_identifier,
-                    "occupied": is_occupied
-                })
         
-        db.session.commit()
+        # Log the changes with a single multi-row INSERT
+        # (vehicle_plate is unknown from image analysis alone)
+        db.session.execute(insert(ParkingLog), [
+            {"space_id": space.id, "is_occupied": space_results[space.id], "timestamp": now, "vehicle_plate": None}
+            for space in changed
+        ])
         
-        return jsonify({
-            "success": True,
-            "message": f"Analysis complete. {len(updated_spaces)} spaces updated.",
-            "updated_spaces": updated_spaces
+        occupied_change = sum(1 if space_results[space.id] else -1 for space in changed)
+        live_events.stage(organization, 'parking', {
+            "spaces": updated_spaces,
+            "occupied_change": occupied_change,
+            "total_change": 0
         })
     
+    db.session.commit()
+    if changed:
+        dashboard_stats.invalidate(organization)
+    
+    return {
+        "success": True,
+        "message": f"Analysis complete. {len(updated_spaces)} spaces updated.",
+        "updated_spaces": updated_spaces,
+        "camera_id": camera_id,
+        "calibrated": calibration is not None
+    }, 200
+
+# Parking ROI calibration API
+def _get_calibration(camera_id):
+    return CameraCalibration.query.filter_by(
+        organization_id=current_user.organization,
+        camera_id=camera_id
+    ).first()
+
+def _org_space_ids(space_ids):
+    """IDs among ``space_ids`` that belong to the current user's organization."""
+    return set(db.session.scalars(
+        select(ParkingSpace.id).where(
+            ParkingSpace.id.in_(space_ids),
+            ParkingSpace.organization_id == current_user.organization
+        )
+    ))
+
+@app.route('/api/parking/calibrations')
+@login_required
+def list_calibrations():
+    if current_user.role != 'admin':
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+    
+    calibrations = CameraCalibration.query.filter_by(organization_id=current_user.organization).all()
+    
+    return jsonify({
+        "success": True,
+        "calibrations": [
+            {
+                "camera_id": calibration.camera_id,
+                "frame_width": calibration.frame_width,
+                "frame_height": calibration.frame_height,
+                "spaces": len(calibration.rois)
+            }
+            for calibration in calibrations
+        ]
+    })
+
+@app.route('/api/parking/calibrations/<camera_id>', methods=['GET'])
+@login_required
+def get_calibration(camera_id):
+    if current_user.role != 'admin':
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+    
+    calibration = _get_calibration(camera_id)
+    if calibration is None:
+        return jsonify({"success": False, "message": "Camera is not calibrated"}), 404
+    
+    return jsonify({"success": True, "calibration": calibration_to_dict(calibration)})
+
+@app.route('/api/parking/calibrations/<camera_id>', methods=['PUT'])
+@login_required
+def save_calibration(camera_id):
+    """Replace a camera's calibration: frame size plus one polygon per space."""
+    if current_user.role != 'admin':
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+    
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        width = int(data.get('frame_width', 0))
+        height = int(data.get('frame_height', 0))
+    except (TypeError, ValueError):
+        width = height = 0
+    if width <= 0 or height <= 0:
+        return jsonify({"success": False, "message": "frame_width and frame_height are required"}), 400
+    
+    try:
+        rois = {}
+        for roi in data.get('rois', []):
+            rois[int(roi['space_id'])] = (
+                validate_polygon(roi.get('polygon') or [], width, height),
+                validate_thresholds(roi.get('occupied_threshold'), roi.get('vacant_threshold'))
+            )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": f"Invalid ROI: {str(e)}"}), 400
+    
+    unknown = set(rois) - _org_space_ids(list(rois))
+    if unknown:
+        return jsonify({"success": False, "message": f"Unknown parking spaces: {sorted(unknown)}"}), 400
+    
+    try:
+        calibration = _get_calibration(camera_id)
+        if calibration is None:
+            calibration = CameraCalibration(organization_id=current_user.organization, camera_id=camera_id)
+            db.session.add(calibration)
+        
+        calibration.frame_width = width
+        calibration.frame_height = height
+        
+        # Delete the replaced ROIs before inserting new ones for the same spaces
+        calibration.rois = []
+        db.session.flush()
+        calibration.rois = [
+            ParkingROI(
+                space_id=space_id,
+                polygon=json.dumps(polygon),
+                occupied_threshold=occupied_threshold,
+                vacant_threshold=vacant_threshold
+            )
+            for space_id, (polygon, (occupied_threshold, vacant_threshold)) in rois.items()
+        ]
+        db.session.flush()
+        
+        compile_calibration(calibration)
+        calibration.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        return jsonify({"success": True, "calibration": calibration_to_dict(calibration)})
+    
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error analyzing parking: {str(e)}")
+        logger.error(f"Error saving calibration: {str(e)}")
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/parking/calibrations/<camera_id>/spaces/<int:space_id>', methods=['PUT', 'DELETE'])
+@login_required
+def edit_calibration_roi(camera_id, space_id):
+    """Set or remove the polygon of one space in an existing calibration."""
+    if current_user.role != 'admin':
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+    
+    calibration = _get_calibration(camera_id)
+    if calibration is None:
+        return jsonify({"success": False, "message": "Camera is not calibrated"}), 404
+    
+    roi = next((roi for roi in calibration.rois if roi.space_id == space_id), None)
+    
+    if request.method == 'DELETE':
+        if roi is None:
+            return jsonify({"success": False, "message": "Space has no ROI for this camera"}), 404
+        calibration.rois.remove(roi)
+    else:
+        if not _org_space_ids([space_id]):
+            return jsonify({"success": False, "message": "Unknown parking space"}), 400
+        data = request.get_json(silent=True) or {}
+        try:
+            polygon = validate_polygon(data.get('polygon') or [], calibration.frame_width, calibration.frame_height)
+            occupied_threshold, vacant_threshold = validate_thresholds(
+                data.get('occupied_threshold'), data.get('vacant_threshold'))
+        except CalibrationError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        
+        if roi is None:
+            roi = ParkingROI(space_id=space_id)
+            calibration.rois.append(roi)
+        roi.polygon = json.dumps(polygon)
+        roi.occupied_threshold = occupied_threshold
+        roi.vacant_threshold = vacant_threshold
+    
+    try:
+        db.session.flush()
+        compile_calibration(calibration)
+        calibration.updated_at = datetime.utcnow()
+        db.session.commit()
+        return jsonify({"success": True, "calibration": calibration_to_dict(calibration)})
+    
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error editing calibration: {str(e)}")
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
+# Background analysis jobs
+def _wants_job():
+    """Check whether the client asked for asynchronous processing."""
+    return request.values.get('mode') == 'async'
+
+def _submit_job(job_type, file, **options):
+    """Queue an upload for background processing and return its job id."""
+    params = {
+        "user_id": current_user.id,
+        "organization": current_user.organization,
+        "filename": file.filename,
+        "options": options
+    }
+    
+    try:
+        job_id = job_queue.submit(job_type, file.read(), params)
+    except JobQueueFullError:
+        response = jsonify({"success": False, "message": "Too many pending jobs, please retry shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for('job_status', job_id=job_id),
+        "events_url": url_for('job_events', job_id=job_id)
+    }), 202
+
+def _run_upload_job(analyze):
+    """Adapt a route helper to the job queue's handler signature."""
+    def handler(payload, params):
+        file = FileStorage(stream=io.BytesIO(payload), filename=params.get("filename"))
+        body, status = analyze(file, params["organization"], **params.get("options", {}))
+        return dict(body, status_code=status)
+    return handler
+
+job_queue.register('plate', _run_upload_job(_detect_plate_in_image))
+job_queue.register('parking', _run_upload_job(_analyze_parking_image))
+
+@app.before_request
+def resume_background_jobs():
+    # Persisted jobs left by a previous process resume on the first request
+    if job_queue.persistent:
+        job_queue.start()
+
+def _get_own_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return None
+    
+    # Users see their own jobs, admins see their organization's
+    if job.params.get("user_id") == current_user.id:
+        return job
+    if current_user.role == 'admin' and job.params.get("organization") == current_user.organization:
+        return job
+    return None
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = _get_own_job(job_id)
+    
+    if job is None:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    job = _get_own_job(job_id)
+    
+    if job is None:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    
+    keepalive = app.config['JOB_EVENTS_KEEPALIVE']
+    deadline = time.monotonic() + app.config['JOB_EVENTS_MAX_AGE']
+    
+    @stream_with_context
+    def stream():
+        current = job
+        last_status = None
+        while True:
+            if current is None:
+                yield "event: error\ndata: {\"message\": \"Job expired\"}\n\n"
+                return
+            if current.status != last_status:
+                last_status = current.status
+                yield f"event: status\ndata: {json.dumps(current.to_dict())}\n\n"
+                if current.status in FINISHED_STATES:
+                    return
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # The client falls back to polling the status URL
+                return
+            current = job_queue.wait(job_id, last_status, min(keepalive, remaining))
+    
+    return _event_stream(stream)
+
+# Event streams each hold a worker thread for as long as they are open
+_event_stream_slots = threading.BoundedSemaphore(app.config['SSE_MAX_STREAMS'])
+
+def _event_stream(stream):
+    """
+    Server-Sent Events response for a generator function.
+    
+    At most SSE_MAX_STREAMS streams are open per process, so they can't take
+    every worker thread; past that the client gets a 503 and falls back to
+    polling.
+    """
+    if not _event_stream_slots.acquire(blocking=False):
+        response = jsonify({"success": False, "message": "Too many open event streams"})
+        response.status_code = 503
+        return response
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Released when the server closes the response, even if the stream never started
+    response.call_on_close(_event_stream_slots.release)
+    return response
+
 # Reports
 @app.route('/reports')
 @login_required
 def reports():
     return render_template('reports.html')
 
+def _report_range():
+    """
+    Date range of a report request.
+    
+    Accepts ``start`` and ``end`` (YYYY-MM-DD, inclusive) or ``days``
+    (the last N days up to today); defaults to the past 7 days.
+    
+    Returns:
+        Tuple of (start date, end date)
+    
+    Raises:
+        ValueError: If the parameters are malformed, the range is reversed
+                    or longer than REPORT_MAX_DAYS
+    """
+    from datetime import date, timedelta
+    
+    max_days = app.config['REPORT_MAX_DAYS']
+    end = date.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow().date()
+    if end == date.max:
+        # The queries run up to the day after the end
+        raise ValueError("end is out of range")
+    if request.args.get('start'):
+        start = date.fromisoformat(request.args['start'])
+    else:
+        days = int(request.args.get('days', 7))
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        if days > max_days:
+            raise ValueError(f"days must be at most {max_days}")
+        try:
+            start = end - timedelta(days=days)
+        except OverflowError:
+            raise ValueError("start is out of range") from None
+    
+    if start > end:
+        raise ValueError("start must not be after end")
+    if (end - start).days > max_days:
+        raise ValueError(f"range must be at most {max_days} days")
+    return start, end
+
 @app.route('/api/attendance-data')
 @login_required
 def attendance_data():
-    # Get attendance data for the past 7 days
-    from sqlalchemy import text
-    from datetime import datetime, timedelta
-    
-    # Get date from 7 days ago
-    seven_days_ago = datetime.now() - timedelta(days=7)
+    try:
+        start, end = _report_range()
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid date range: {str(e)}"}), 400
     
+    # Read the per-user daily rollup instead of grouping the raw records
     if current_user.role == 'admin':
         # Admin gets data for all users in organization
-        attendance_data = db.session.execute(
-            text("""
-            SELECT date(check_in_time) as date, count(*) as count
-            FROM attendance_record
-            JOIN user ON attendance_record.user_id = user.id
-            WHERE user.organization = :org
-            AND check_in_time >= :seven_days_ago
-            GROUP BY date(check_in_time)
-            ORDER BY date(check_in_time)
-            """), 
-            {"org": current_user.organization, "seven_days_ago": seven_days_ago}
-        ).fetchall()
+        rows = attendance_by_day(start, end, organization=current_user.organization)
     else:
         # Regular user gets only their own data
-        attendance_data = db.session.execute(
-            text("""
-            SELECT date(check_in_time) as date, count(*) as count
-            FROM attendance_record
-            WHERE user_id = :user_id
-            AND check_in_time >= :seven_days_ago
-            GROUP BY date(check_in_time)
-            ORDER BY date(check_in_time)
-            """), 
-            {"user_id": current_user.id, "seven_days_ago": seven_days_ago}
-        ).fetchall()
+        rows = attendance_by_day(start, end, user_id=current_user.id)
     
     # Format data for chart.js
-    labels = [row[0] for row in attendance_data]
-    values = [row[1] for row in attendance_data]
-    
     return jsonify({
-        "labels": labels,
-        "data": values
+        "labels": [day.isoformat() for day, _ in rows],
+        "data": [count for _, count in rows]
     })
 
 @app.route('/api/plate-data')
@@ -598,32 +1083,23 @@ def plate_data():
     if current_user.role != 'admin':
         return jsonify({"success": False, "message": "Unauthorized access"}), 403
     
-    # Get license plate data for the past 7 days
-    from sqlalchemy import text
-    from datetime import datetime, timedelta
-    
-    # Get date from 7 days ago
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    
-    plate_data = db.session.execute(
-        text("""
-        SELECT date(timestamp) as date, count(*) as count
-        FROM plate_detection_log
-        WHERE organization_id = :org
-        AND timestamp >= :seven_days_ago
-        GROUP BY date(timestamp)
-        ORDER BY date(timestamp)
-        """), 
-        {"org": current_user.organization, "seven_days_ago": seven_days_ago}
-    ).fetchall()
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('day', 'hour'):
+        return jsonify({"success": False, "message": "granularity must be 'day' or 'hour'"}), 400
     
-    # Format data for chart.js
-    labels = [row[0] for row in plate_data]
-    values = [row[1] for row in plate_data]
+    try:
+        start, end = _report_range()
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid date range: {str(e)}"}), 400
+    
+    rows = plate_detections_by_period(current_user.organization, start, end, granularity)
+    label_format = "%Y-%m-%d %H:00" if granularity == 'hour' else "%Y-%m-%d"
     
+    # Format data for chart.js
     return jsonify({
-        "labels": labels,
-        "data": values
+        "labels": [period.strftime(label_format) for period, _, _ in rows],
+        "data": [detections for _, detections, _ in rows],
+        "unauthorized": [unauthorized for _, _, unauthorized in rows]
     })
 
 @app.route('/api/parking-data')
@@ -632,22 +1108,80 @@ def parking_data():
     if current_user.role != 'admin':
         return jsonify({"success": False, "message": "Unauthorized access"}), 403
     
-    # Get current parking space statistics
-    total_spaces = ParkingSpace.query.filter_by(organization_id=current_user.organization).count()
-    occupied_spaces = ParkingSpace.query.filter_by(organization_id=current_user.organization, is_occupied=True).count()
-    free_spaces = total_spaces - occupied_spaces
+    # Get current parking space statistics (shared with the dashboard page)
+    stats = dashboard_stats.get(current_user.organization, current_user.id, admin=True)
     
     return jsonify({
-        "total": total_spaces,
-        "occupied": occupied_spaces,
-        "free": free_spaces
+        "total": stats["parking_spaces"],
+        "occupied": stats["occupied_spaces"],
+        "free": stats["free_spaces"]
     })
 
+def _visible_live_event(message):
+    """The part of an organization's live event the current user may see, or None."""
+    if current_user.role == 'admin' or message["event"] == 'resync':
+        return message
+    
+    # Regular users only follow their own attendance, like /api/attendance-data
+    if message["event"] != 'attendance':
+        return None
+    data = message["data"]
+    check_ins = {
+        day: [current_user.id] for day, user_ids in data["check_ins"].items() if current_user.id in user_ids
+    }
+    check_outs = [current_user.id] if current_user.id in data["check_outs"] else []
+    if not check_ins and not check_outs:
+        return None
+    return {"event": "attendance", "data": {"check_ins": check_ins, "check_outs": check_outs}}
+
+@app.route('/api/live-events')
+@login_required
+def live_events_stream():
+    keepalive = app.config['LIVE_EVENTS_KEEPALIVE']
+    deadline = time.monotonic() + app.config['LIVE_EVENTS_MAX_AGE']
+    
+    @stream_with_context
+    def stream():
+        subscription = live_events.subscribe(current_user.organization)
+        try:
+            # Sent once subscribed: the client (re)loads its widgets now, so
+            # no change can fall between the snapshot and the deltas
+            yield "event: ready\ndata: {}\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Streams are closed periodically so idle tabs give their
+                    # thread back; the browser reconnects and gets 'ready' again
+                    return
+                message = subscription.get(min(keepalive, remaining))
+                if message is None:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                message = _visible_live_event(message)
+                if message is not None:
+                    yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            subscription.close()
+    
+    return _event_stream(stream)
+
 # Error handlers
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('error.html', error_code=404, error_message="Page not found"), 404
 
+@app.errorhandler(CVWorkerError)
+def cv_worker_unavailable(e):
+    # Overloaded or timed-out CV jobs are rejected instead of tying up the worker
+    logger.warning(f"CV job rejected: {str(e)}")
+    status = 503 if isinstance(e, CVOverloadedError) else 504
+    response = jsonify({"success": False, "message": "Image processing is busy, please retry shortly"})
+    response.status_code = status
+    if status == 503:
+        response.headers['Retry-After'] = '1'
+    return response
+
 @app.errorhandler(500)
 def internal_server_error(e):
     return render_template('error.html', error_code=500, error_message="Internal server error"), 500
@@ -291,12 +291,8 @@ function detectPlate() {
         formData.append('csrf_token', csrfToken);
     }
     
-    // Send the image to the server
-    fetch('/detect-plate', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    // Queue the image for background processing and wait for the result
+    submitJob('/detect-plate', formData)
     .then(data => {
         if (processingMessage) {
             processingMessage.style.display = 'none';
@@ -313,6 +309,8 @@ function detectPlate() {
                     <div class="alert alert-success">
                         <h4 class="alert-heading">Plate Detected!</h4>
                         <p><strong>Plate Number:</strong> ${data.plate_number}</p>
+                        ${data.matched_plate && data.match_distance > 0 ?
+                            `<p><strong>${data.match_confusions_only ? 'Matched' : 'Similar'} Registered Plate:</strong> ${data.matched_plate} (distance ${data.match_distance})</p>` : ''}
                         <p><strong>Confidence:</strong> ${(data.confidence * 100).toFixed(2)}%</p>
                         <p><strong>Status:</strong> ${authorizationStatus}</p>
                         <p><strong>Owner:</strong> ${data.owner_name}</p>
@@ -360,12 +358,8 @@ function analyzeParking() {
         formData.append('csrf_token', csrfToken);
     }
     
-    // Send the image to the server
-    fetch('/analyze-parking', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    // Queue the image for background processing and wait for the result
+    submitJob('/analyze-parking', formData)
     .then(data => {
         if (processingMessage) {
             processingMessage.style.display = 'none';
@@ -391,6 +385,77 @@ function analyzeParking() {
     });
 }
 
+/**
+ * Submit an upload as a background job and resolve with its result.
+ * Results are streamed over Server-Sent Events, falling back to polling
+ * the job status endpoint when EventSource is unavailable or drops.
+ */
+function submitJob(url, formData) {
+    formData.append('mode', 'async');
+    
+    return fetch(url, {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success || !data.job_id) {
+            // Rejected up front (validation error, queue full, ...)
+            return data;
+        }
+        return waitForJob(data);
+    });
+}
+
+/**
+ * Wait for a queued job to finish
+ */
+function waitForJob(job) {
+    return new Promise((resolve, reject) => {
+        const finish = status => {
+            if (status.status === 'completed') {
+                resolve(status.result);
+            } else {
+                resolve({ success: false, message: status.error || 'Processing failed' });
+            }
+        };
+        
+        const poll = () => {
+            fetch(job.status_url)
+                .then(response => response.json())
+                .then(status => {
+                    if (status.success === false) {
+                        // Unknown or expired job
+                        resolve(status);
+                    } else if (status.status === 'completed' || status.status === 'failed') {
+                        finish(status);
+                    } else {
+                        setTimeout(poll, 1000);
+                    }
+                })
+                .catch(reject);
+        };
+        
+        if (!window.EventSource) {
+            poll();
+            return;
+        }
+        
+        const source = new EventSource(job.events_url);
+        source.addEventListener('status', event => {
+            const status = JSON.parse(event.data);
+            if (status.status === 'completed' || status.status === 'failed') {
+                source.close();
+                finish(status);
+            }
+        });
+        source.onerror = () => {
+            source.close();
+            poll();
+        };
+    });
+}
+
 /**
  * Update parking space status in the UI
  */
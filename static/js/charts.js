@@ -1,71 +1,121 @@
 // charts.js - Handles chart functionality for reports
 
+// Chart instances, kept to apply live updates
+const reportCharts = {};
+
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize charts if on the reports page
     if (document.getElementById('attendanceChartContainer')) {
         initAttendanceChart();
     }
-    
+
     if (document.getElementById('plateChartContainer')) {
         initPlateChart();
     }
-    
+
     if (document.getElementById('parkingChartContainer')) {
         initParkingChart();
     }
+
+    // Load the data once the live stream is up, then apply its changes as they happen
+    subscribeLiveEvents({
+        ready: loadReportData,
+        attendance: delta => {
+            checkInsByDay(delta).forEach(([day, count]) => addToChart(reportCharts.attendance, day, count));
+        },
+        plate: detection => {
+            // Repeat sightings of a logged plate don't add to the counts
+            if (detection.new) {
+                addToChart(reportCharts.plate, detection.timestamp.slice(0, 10), 1);
+            }
+        },
+        parking: delta => {
+            if (reportCharts.parking) {
+                const data = reportCharts.parking.data.datasets[0].data;
+                data[0] += delta.occupied_change;
+                data[1] += delta.total_change - delta.occupied_change;
+                reportCharts.parking.update();
+                updateParkingSummary(data[0] + data[1], data[0], data[1]);
+            }
+        }
+    });
 });
 
+/**
+ * Load the current data into the charts (on page load and whenever the live stream reconnects)
+ */
+function loadReportData() {
+    if (reportCharts.attendance) {
+        loadAttendanceData();
+    }
+
+    if (reportCharts.plate) {
+        loadPlateData();
+    }
+
+    if (reportCharts.parking) {
+        loadParkingData();
+    }
+}
+
 /**
  * Initialize the attendance chart
  */
 function initAttendanceChart() {
-    // Fetch attendance data from the server
-    fetch('/api/attendance-data')
-        .then(response => response.json())
-        .then(data => {
-            // Create the chart
-            const ctx = document.getElementById('attendanceChart').getContext('2d');
-            new Chart(ctx, {
-                type: 'bar',
-                data: {
-                    labels: data.labels,
-                    datasets: [{
-                        label: 'Daily Attendance',
-                        data: data.data,
-                        backgroundColor: 'rgba(75, 192, 192, 0.2)',
-                        borderColor: 'rgba(75, 192, 192, 1)',
-                        borderWidth: 1
-                    }]
+    const ctx = document.getElementById('attendanceChart').getContext('2d');
+    reportCharts.attendance = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: [],
+            datasets: [{
+                label: 'Daily Attendance',
+                data: [],
+                backgroundColor: 'rgba(75, 192, 192, 0.2)',
+                borderColor: 'rgba(75, 192, 192, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {
+            responsive: true,
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    title: {
+                        display: true,
+                        text: 'Number of Check-ins'
+                    }
                 },
-                options: {
-                    responsive: true,
-                    scales: {
-                        y: {
-                            beginAtZero: true,
-                            title: {
-                                display: true,
-                                text: 'Number of Check-ins'
-                            }
-                        },
-                        x: {
-                            title: {
-                                display: true,
-                                text: 'Date'
-                            }
-                        }
-                    },
-                    plugins: {
-                        title: {
-                            display: true,
-                            text: 'Attendance Over Time'
-                        },
-                        legend: {
-                            display: true,
-                            position: 'top'
-                        }
+                x: {
+                    title: {
+                        display: true,
+                        text: 'Date'
                     }
                 }
-            });
+            },
+            plugins: {
+                title: {
+                    display: true,
+                    text: 'Attendance Over Time'
+                },
+                legend: {
+                    display: true,
+                    position: 'top'
+                }
+            }
+        }
+    });
+}
+
+/**
+ * Fetch attendance data from the server into the chart
+ */
+function loadAttendanceData() {
+    fetch('/api/attendance-data')
+        .then(response => response.json())
+        .then(data => {
+            reportCharts.attendance.data.labels = data.labels;
+            reportCharts.attendance.data.datasets[0].data = data.data;
+            reportCharts.attendance.update();
         })
         .catch(error => {
             console.error('Error loading attendance data:', error);
@@ -77,55 +127,62 @@ function initAttendanceChart() {
  * Initialize the license plate detection chart
  */
 function initPlateChart() {
-    // Fetch plate detection data from the server
-    fetch('/api/plate-data')
-        .then(response => response.json())
-        .then(data => {
-            // Create the chart
-            const ctx = document.getElementById('plateChart').getContext('2d');
-            new Chart(ctx, {
-                type: 'line',
-                data: {
-                    labels: data.labels,
-                    datasets: [{
-                        label: 'License Plate Detections',
-                        data: data.data,
-                        fill: false,
-                        backgroundColor: 'rgba(153, 102, 255, 0.2)',
-                        borderColor: 'rgba(153, 102, 255, 1)',
-                        borderWidth: 1,
-                        tension: 0.1
-                    }]
+    const ctx = document.getElementById('plateChart').getContext('2d');
+    reportCharts.plate = new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: [],
+            datasets: [{
+                label: 'License Plate Detections',
+                data: [],
+                fill: false,
+                backgroundColor: 'rgba(153, 102, 255, 0.2)',
+                borderColor: 'rgba(153, 102, 255, 1)',
+                borderWidth: 1,
+                tension: 0.1
+            }]
+        },
+        options: {
+            responsive: true,
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    title: {
+                        display: true,
+                        text: 'Number of Detections'
+                    }
                 },
-                options: {
-                    responsive: true,
-                    scales: {
-                        y: {
-                            beginAtZero: true,
-                            title: {
-                                display: true,
-                                text: 'Number of Detections'
-                            }
-                        },
-                        x: {
-                            title: {
-                                display: true,
-                                text: 'Date'
-                            }
-                        }
-                    },
-                    plugins: {
-                        title: {
-                            display: true,
-                            text: 'License Plate Detections Over Time'
-                        },
-                        legend: {
-                            display: true,
-                            position: 'top'
-                        }
+                x: {
+                    title: {
+                        display: true,
+                        text: 'Date'
                     }
                 }
-            });
+            },
+            plugins: {
+                title: {
+                    display: true,
+                    text: 'License Plate Detections Over Time'
+                },
+                legend: {
+                    display: true,
+                    position: 'top'
+                }
+            }
+        }
+    });
+}
+
+/**
+ * Fetch plate detection data from the server into the chart
+ */
+function loadPlateData() {
+    fetch('/api/plate-data')
+        .then(response => response.json())
+        .then(data => {
+            reportCharts.plate.data.labels = data.labels;
+            reportCharts.plate.data.datasets[0].data = data.data;
+            reportCharts.plate.update();
         })
         .catch(error => {
             console.error('Error loading plate data:', error);
@@ -137,54 +194,50 @@ function initPlateChart() {
  * Initialize the parking space status chart
  */
 function initParkingChart() {
-    // Fetch parking data from the server
-    fetch('/api/parking-data')
-        .then(response => response.json())
-        .then(data => {
-            // Create the chart
-            const ctx = document.getElementById('parkingChart').getContext('2d');
-            new Chart(ctx, {
-                type: 'doughnut',
-                data: {
-                    labels: ['Occupied Spaces', 'Free Spaces'],
-                    datasets: [{
-                        data: [data.occupied, data.free],
-                        backgroundColor: [
-                            'rgba(255, 99, 132, 0.2)',
-                            'rgba(75, 192, 192, 0.2)'
-                        ],
-                        borderColor: [
-                            'rgba(255, 99, 132, 1)',
-                            'rgba(75, 192, 192, 1)'
-                        ],
-                        borderWidth: 1
-                    }]
+    const ctx = document.getElementById('parkingChart').getContext('2d');
+    reportCharts.parking = new Chart(ctx, {
+        type: 'doughnut',
+        data: {
+            labels: ['Occupied Spaces', 'Free Spaces'],
+            datasets: [{
+                data: [0, 0],
+                backgroundColor: [
+                    'rgba(255, 99, 132, 0.2)',
+                    'rgba(75, 192, 192, 0.2)'
+                ],
+                borderColor: [
+                    'rgba(255, 99, 132, 1)',
+                    'rgba(75, 192, 192, 1)'
+                ],
+                borderWidth: 1
+            }]
+        },
+        options: {
+            responsive: true,
+            plugins: {
+                title: {
+                    display: true,
+                    text: 'Current Parking Space Status'
                 },
-                options: {
-                    responsive: true,
-                    plugins: {
-                        title: {
-                            display: true,
-                            text: 'Current Parking Space Status'
-                        },
-                        legend: {
-                            display: true,
-                            position: 'top'
-                        }
-                    }
+                legend: {
+                    display: true,
+                    position: 'top'
                 }
-            });
-            
-            // Update the summary text
-            const summaryElement = document.getElementById('parkingSummary');
-            if (summaryElement) {
-                summaryElement.innerHTML = `
-                    <p><strong>Total Spaces:</strong> ${data.total}</p>
-                    <p><strong>Occupied Spaces:</strong> ${data.occupied}</p>
-                    <p><strong>Free Spaces:</strong> ${data.free}</p>
-                    <p><strong>Occupancy Rate:</strong> ${Math.round((data.occupied / data.total) * 100)}%</p>
-                `;
             }
+        }
+    });
+}
+
+/**
+ * Fetch parking data from the server into the chart
+ */
+function loadParkingData() {
+    fetch('/api/parking-data')
+        .then(response => response.json())
+        .then(data => {
+            reportCharts.parking.data.datasets[0].data = [data.occupied, data.free];
+            reportCharts.parking.update();
+            updateParkingSummary(data.total, data.occupied, data.free);
         })
         .catch(error => {
             console.error('Error loading parking data:', error);
@@ -192,6 +245,21 @@ function initParkingChart() {
         });
 }
 
+/**
+ * Update the parking summary text
+ */
+function updateParkingSummary(total, occupied, free) {
+    const summaryElement = document.getElementById('parkingSummary');
+    if (summaryElement) {
+        summaryElement.innerHTML = `
+            <p><strong>Total Spaces:</strong> ${total}</p>
+            <p><strong>Occupied Spaces:</strong> ${occupied}</p>
+            <p><strong>Free Spaces:</strong> ${free}</p>
+            <p><strong>Occupancy Rate:</strong> ${total ? Math.round((occupied / total) * 100) : 0}%</p>
+        `;
+    }
+}
+
 /**
  * Show an error message when chart data fails to load
  */
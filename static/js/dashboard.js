@@ -12,6 +12,9 @@ document.addEventListener('DOMContentLoaded', function() {
     setInterval(updateCurrentTime, 1000);
 });
 
+// Chart instances, kept to apply live updates
+const dashboardCharts = {};
+
 /**
  * Initialize charts on the dashboard
  */
@@ -20,7 +23,7 @@ function initCharts() {
     const attendanceChartElement = document.getElementById('attendanceChart');
     if (attendanceChartElement) {
         // Create a placeholder attendance chart
-        new Chart(attendanceChartElement, {
+        dashboardCharts.attendance = new Chart(attendanceChartElement, {
             type: 'bar',
             data: {
                 labels: ['Loading...'],
@@ -50,104 +53,193 @@ function initCharts() {
                 }
             }
         });
-        
-        // Load actual attendance data
+    }
+    
+    // Only initialize parking chart if the container exists
+    const parkingChartElement = document.getElementById('parkingChart');
+    if (parkingChartElement) {
+        // Create a doughnut chart for parking status
+        dashboardCharts.parking = new Chart(parkingChartElement, {
+            type: 'doughnut',
+            data: {
+                labels: ['Occupied', 'Free'],
+                datasets: [{
+                    data: [0, 0],
+                    backgroundColor: [
+                        'rgba(255, 99, 132, 0.2)',
+                        'rgba(75, 192, 192, 0.2)'
+                    ],
+                    borderColor: [
+                        'rgba(255, 99, 132, 1)',
+                        'rgba(75, 192, 192, 1)'
+                    ],
+                    borderWidth: 1
+                }]
+            },
+            options: {
+                responsive: true,
+                plugins: {
+                    legend: {
+                        position: 'top',
+                    },
+                    title: {
+                        display: true,
+                        text: 'Parking Space Status'
+                    }
+                }
+            }
+        });
+    }
+    
+    // Only initialize plate chart if the container exists
+    const plateChartElement = document.getElementById('plateChart');
+    if (plateChartElement) {
+        // Create a line chart for plate detections
+        dashboardCharts.plate = new Chart(plateChartElement, {
+            type: 'line',
+            data: {
+                labels: [],
+                datasets: [{
+                    label: 'Plate Detections',
+                    data: [],
+                    fill: false,
+                    borderColor: 'rgba(153, 102, 255, 1)',
+                    tension: 0.1
+                }]
+            },
+            options: {
+                scales: {
+                    y: {
+                        beginAtZero: true,
+                        title: {
+                            display: true,
+                            text: 'Count'
+                        }
+                    },
+                    x: {
+                        title: {
+                            display: true,
+                            text: 'Date'
+                        }
+                    }
+                }
+            }
+        });
+    }
+    
+    // Load the data once the live stream is up, then apply its changes as they happen
+    subscribeLiveEvents({
+        ready: loadChartData,
+        attendance: applyAttendanceEvent,
+        plate: applyPlateEvent,
+        parking: applyParkingEvent
+    });
+}
+
+/**
+ * Load the current chart data (on page load and whenever the live stream reconnects)
+ */
+function loadChartData() {
+    if (dashboardCharts.attendance) {
         fetch('/api/attendance-data')
             .then(response => response.json())
             .then(data => {
                 // Update the chart with the real data
-                attendanceChartElement.chart.data.labels = data.labels;
-                attendanceChartElement.chart.data.datasets[0].data = data.data;
-                attendanceChartElement.chart.update();
+                dashboardCharts.attendance.data.labels = data.labels;
+                dashboardCharts.attendance.data.datasets[0].data = data.data;
+                dashboardCharts.attendance.update();
             })
             .catch(error => console.error('Error loading attendance data:', error));
     }
     
-    // Only initialize parking chart if the container exists
-    const parkingChartElement = document.getElementById('parkingChart');
-    if (parkingChartElement) {
-        // Load parking data
+    if (dashboardCharts.parking) {
         fetch('/api/parking-data')
             .then(response => response.json())
             .then(data => {
-                // Create a doughnut chart for parking status
-                new Chart(parkingChartElement, {
-                    type: 'doughnut',
-                    data: {
-                        labels: ['Occupied', 'Free'],
-                        datasets: [{
-                            data: [data.occupied, data.free],
-                            backgroundColor: [
-                                'rgba(255, 99, 132, 0.2)',
-                                'rgba(75, 192, 192, 0.2)'
-                            ],
-                            borderColor: [
-                                'rgba(255, 99, 132, 1)',
-                                'rgba(75, 192, 192, 1)'
-                            ],
-                            borderWidth: 1
-                        }]
-                    },
-                    options: {
-                        responsive: true,
-                        plugins: {
-                            legend: {
-                                position: 'top',
-                            },
-                            title: {
-                                display: true,
-                                text: 'Parking Space Status'
-                            }
-                        }
-                    }
-                });
+                if (data.success === false) {
+                    return;
+                }
+                dashboardCharts.parking.data.datasets[0].data = [data.occupied, data.free];
+                dashboardCharts.parking.update();
+                setStat('occupied-spaces', data.occupied);
+                setStat('free-spaces', data.free);
             })
             .catch(error => console.error('Error loading parking data:', error));
     }
     
-    // Only initialize plate chart if the container exists
-    const plateChartElement = document.getElementById('plateChart');
-    if (plateChartElement) {
-        // Load plate detection data
+    if (dashboardCharts.plate) {
         fetch('/api/plate-data')
             .then(response => response.json())
             .then(data => {
-                // Create a line chart for plate detections
-                new Chart(plateChartElement, {
-                    type: 'line',
-                    data: {
-                        labels: data.labels,
-                        datasets: [{
-                            label: 'Plate Detections',
-                            data: data.data,
-                            fill: false,
-                            borderColor: 'rgba(153, 102, 255, 1)',
-                            tension: 0.1
-                        }]
-                    },
-                    options: {
-                        scales: {
-                            y: {
-                                beginAtZero: true,
-                                title: {
-                                    display: true,
-                                    text: 'Count'
-                                }
-                            },
-                            x: {
-                                title: {
-                                    display: true,
-                                    text: 'Date'
-                                }
-                            }
-                        }
-                    }
-                });
+                dashboardCharts.plate.data.labels = data.labels;
+                dashboardCharts.plate.data.datasets[0].data = data.data;
+                dashboardCharts.plate.update();
             })
             .catch(error => console.error('Error loading plate data:', error));
     }
 }
 
+/**
+ * Apply a live attendance change
+ */
+function applyAttendanceEvent(delta) {
+    checkInsByDay(delta).forEach(([day, count]) => addToChart(dashboardCharts.attendance, day, count));
+    
+    // The check-in card counts the current user's own check-ins
+    const userId = Number(document.getElementById('dashboard').dataset.userId);
+    Object.values(delta.check_ins).forEach(userIds => {
+        if (userIds.includes(userId)) {
+            addToStat('face-count', 1);
+        }
+    });
+}
+
+/**
+ * Apply a live plate detection (repeat sightings of a logged plate don't add to the counts)
+ */
+function applyPlateEvent(detection) {
+    if (!detection.new) {
+        return;
+    }
+    addToChart(dashboardCharts.plate, detection.timestamp.slice(0, 10), 1);
+    addToStat('plate-count', 1);
+}
+
+/**
+ * Apply a live parking occupancy change
+ */
+function applyParkingEvent(delta) {
+    const free = delta.total_change - delta.occupied_change;
+    if (dashboardCharts.parking) {
+        const data = dashboardCharts.parking.data.datasets[0].data;
+        data[0] += delta.occupied_change;
+        data[1] += free;
+        dashboardCharts.parking.update();
+    }
+    addToStat('occupied-spaces', delta.occupied_change);
+    addToStat('free-spaces', free);
+}
+
+/**
+ * Set a stat card's number
+ */
+function setStat(id, value) {
+    const element = document.getElementById(id);
+    if (element) {
+        element.textContent = value;
+    }
+}
+
+/**
+ * Add to a stat card's number
+ */
+function addToStat(id, amount) {
+    const element = document.getElementById(id);
+    if (element && amount) {
+        element.textContent = (parseInt(element.textContent, 10) || 0) + amount;
+    }
+}
+
 /**
  * Set up event listeners for dashboard elements
  */
@@ -0,0 +1,86 @@
+// live.js - Server-pushed updates for the dashboard and report widgets
+
+// Seconds between reloads while the server has no stream free for this tab
+const LIVE_FALLBACK_INTERVAL = 30;
+
+/**
+ * Subscribe to the organization's live events.
+ *
+ * handlers.ready is called whenever the widgets should (re)load their data:
+ * once the stream is connected, after a reconnect and when the server
+ * dropped events for this client. handlers.attendance, handlers.plate and
+ * handlers.parking receive the parsed delta of each change.
+ *
+ * The server closes streams periodically and refuses new ones when it has
+ * too many open; the widgets are then reloaded every LIVE_FALLBACK_INTERVAL
+ * seconds until a stream can be opened again.
+ */
+function subscribeLiveEvents(handlers) {
+    const ready = handlers.ready || function() {};
+
+    if (!window.EventSource) {
+        // No push support: load once, like before
+        ready();
+        return;
+    }
+
+    let source = null;
+    const connect = () => {
+        source = new EventSource('/api/live-events');
+        source.addEventListener('ready', ready);
+        source.addEventListener('resync', ready);
+
+        ['attendance', 'plate', 'parking'].forEach(type => {
+            source.addEventListener(type, event => {
+                if (handlers[type]) {
+                    handlers[type](JSON.parse(event.data));
+                }
+            });
+        });
+
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                // Refused (e.g. 503): poll for a while, then try streaming again
+                console.warn('Live updates unavailable, refreshing periodically');
+                ready();
+                setTimeout(connect, LIVE_FALLBACK_INTERVAL * 1000);
+            } else {
+                // Closed by the server or the network; the browser reconnects and 'ready' follows
+                console.warn('Live updates interrupted, reconnecting...');
+            }
+        };
+    };
+
+    connect();
+    window.addEventListener('beforeunload', () => source && source.close());
+}
+
+/**
+ * Add to the value of a label in a chart, inserting the label in order if needed
+ */
+function addToChart(chart, label, amount, datasetIndex = 0) {
+    if (!chart || !amount) {
+        return;
+    }
+
+    const labels = chart.data.labels;
+    let index = labels.indexOf(label);
+    if (index === -1) {
+        // Labels are ISO dates, so string order is time order
+        index = labels.findIndex(existing => existing > label);
+        if (index === -1) {
+            index = labels.length;
+        }
+        labels.splice(index, 0, label);
+        chart.data.datasets.forEach(dataset => dataset.data.splice(index, 0, 0));
+    }
+    chart.data.datasets[datasetIndex].data[index] += amount;
+    chart.update();
+}
+
+/**
+ * Count the check-ins of an attendance event per day
+ */
+function checkInsByDay(delta) {
+    return Object.entries(delta.check_ins).map(([day, userIds]) => [day, userIds.length]);
+}
@@ -0,0 +1,284 @@
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from app import app, db
+from computer_vision import CV_LIBRARIES_AVAILABLE, detect_faces_in_image, find_plate_in_image, plate_gate_roi
+from face_gallery import face_gallery
+from frames import Frame
+from dashboard_stats import dashboard_stats
+from detections import record_attendance, record_plate_detection
+
+logger = logging.getLogger(__name__)
+
+# A decoded frame and its position in the stream (timestamp in seconds)
+StreamFrame = namedtuple('StreamFrame', ['index', 'timestamp', 'image'])
+
+LIVE_PREFIXES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://')
+
+def is_live_source(source):
+    """Network streams and camera indexes are live; anything else is a file."""
+    return isinstance(source, int) or str(source).lower().startswith(LIVE_PREFIXES)
+
+def read_frames(source, fps=None, stop_event=None):
+    """
+    Decode frames from a video file, RTSP/MJPEG URL or camera index.
+
+    Frames are only decoded when they are due under ``fps``; the ones in
+    between are grabbed (demuxed) and skipped without paying for a decode.
+
+    Args:
+        source: Path, URL or integer camera index accepted by cv2.VideoCapture
+        fps: Maximum frames per second to emit (None for every frame)
+        stop_event: Optional threading.Event that ends the stream
+
+    Yields:
+        StreamFrame tuples; timestamps are media time for files and
+        monotonic wall-clock time for live sources
+    """
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video source {source}")
+
+    live = is_live_source(source)
+    interval = 1.0 / fps if fps else 0.0
+    next_due = None
+    index = -1
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if not capture.grab():
+                break
+            index += 1
+
+            timestamp = time.monotonic() if live else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if next_due is not None and timestamp < next_due:
+                continue
+
+            ok, image = capture.retrieve()
+            if not ok:
+                continue
+
+            next_due = timestamp + interval
+            yield StreamFrame(index, timestamp, image)
+    finally:
+        capture.release()
+
+class MotionGate:
+    """
+    Drop frames that look the same as the last frame let through.
+
+    Frames are compared on a small blurred grayscale thumbnail; a frame
+    passes when the fraction of thumbnail pixels whose intensity moved by
+    more than ``pixel_delta`` reaches ``threshold``.
+    """
+
+    def __init__(self, threshold=0.01, pixel_delta=25, width=160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.skipped = 0
+        self._reference = None
+
+    def _thumbnail(self, image):
+        h, w = image.shape[:2]
+        height = max(1, int(h * self.width / w))
+        small = cv2.resize(image, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed(self, image):
+        """Check a frame against the reference, adopting it if it changed."""
+        thumbnail = self._thumbnail(image)
+        if self._reference is not None and self._reference.shape == thumbnail.shape:
+            diff = cv2.absdiff(thumbnail, self._reference)
+            if np.count_nonzero(diff > self.pixel_delta) < self.threshold * diff.size:
+                self.skipped += 1
+                return False
+        self._reference = thumbnail
+        return True
+
+    def __call__(self, frames):
+        for frame in frames:
+            if self.changed(frame.image):
+                yield frame
+
+class FrameBuffer:
+    """
+    Bounded hand-off between a decoding thread and a slower consumer.
+
+    The producer iterates ``frames`` on a background thread. When the buffer
+    is full and ``drop`` is set, the oldest buffered frame is discarded so a
+    slow detector always sees recent frames and memory stays bounded; with
+    ``drop`` unset (files) the producer waits instead, so no frame is lost.
+    """
+
+    _END = object()
+
+    def __init__(self, frames, maxsize=4, drop=True):
+        self.dropped = 0
+        self._frames = frames
+        self._drop = drop
+        self._items = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._produce, name="frame-reader", daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            for frame in self._frames:
+                with self._cond:
+                    while not self._drop and len(self._items) >= self._maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    if len(self._items) >= self._maxsize:
+                        self._items.popleft()
+                        self.dropped += 1
+                    self._items.append(frame)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            # Release the capture on this thread rather than at interpreter exit
+            if hasattr(self._frames, 'close'):
+                self._frames.close()
+            with self._cond:
+                self._items.append(self._END)
+                self._cond.notify_all()
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                item = self._items.popleft()
+                self._cond.notify_all()
+            if item is self._END:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+class StreamIngestor:
+    """
+    Continuous attendance and plate reading from a video source.
+
+    Pipeline: decode at STREAM_FPS -> motion gate -> bounded buffer ->
+    face and/or plate detection -> the same AttendanceRecord and
+    PlateDetectionLog writes the upload routes make. Every stage is a
+    generator, so ``run`` can be driven frame by frame (e.g. against a
+    local video file) or left running on a live feed.
+    """
+
+    def __init__(self, source, organization=None, faces=True, plates=True, location=None,
+                 fps=None, motion_threshold=None, buffer_size=None):
+        self.source = source
+        self.organization = organization
+        self.faces = faces and CV_LIBRARIES_AVAILABLE
+        self.plates = plates and organization is not None
+        self.location = location
+        self.plate_roi = plate_gate_roi(location)
+        self.fps = fps if fps is not None else app.config.get('STREAM_FPS', 2)
+        self.buffer_size = buffer_size or app.config.get('STREAM_BUFFER_SIZE', 4)
+        self.gate = MotionGate(threshold=motion_threshold if motion_threshold is not None
+                               else app.config.get('STREAM_MOTION_THRESHOLD', 0.01))
+        self.stop_event = threading.Event()
+        self.processed = 0
+        self.buffer = None
+
+        if faces and not self.faces:
+            logger.warning("face_recognition not available - stream face detection disabled")
+        if plates and not self.plates:
+            logger.warning("No organization given - stream plate detection disabled")
+
+    def frames(self):
+        """Sampled, motion-gated frames behind a bounded buffer."""
+        decoded = read_frames(self.source, fps=self.fps, stop_event=self.stop_event)
+        self.buffer = FrameBuffer(self.gate(decoded), maxsize=self.buffer_size,
+                                  drop=is_live_source(self.source))
+        return iter(self.buffer)
+
+    def process(self, frame):
+        """
+        Run the detectors on one frame and record the results.
+
+        Returns:
+            Dict with the frame index, attendance events and plate detections
+        """
+        result = {"frame": frame.index, "timestamp": frame.timestamp, "attendance": [], "plates": []}
+        # Both detectors share the frame's converted views
+        image = Frame.of(frame.image)
+
+        if self.faces:
+            _, encodings = detect_faces_in_image(image, all_faces=True)
+            if encodings:
+                face_gallery.ensure_loaded()
+                user_ids, _ = face_gallery.match_many(encodings)
+                recognized = list(dict.fromkeys(u for u in user_ids if u is not None))
+                result["attendance"] = record_attendance(recognized, detection_method='video_stream')
+
+        if self.plates:
+            plate_number, confidence = find_plate_in_image(image, roi=self.plate_roi)
+            if plate_number:
+                log_entry, _ = record_plate_detection(plate_number, confidence, self.organization,
+                                                      location=self.location)
+                result["plates"].append({
+                    "plate_number": plate_number,
+                    "confidence": confidence,
+                    "is_authorized": log_entry.is_authorized
+                })
+
+        db.session.commit()
+        if result["attendance"] or result["plates"]:
+            dashboard_stats.invalidate(self.organization if result["plates"] else None,
+                                       user_ids=[event["user_id"] for event in result["attendance"]])
+        self.processed += 1
+        return result
+
+    def run(self, max_frames=None):
+        """
+        Process the stream until it ends, ``stop`` is called or ``max_frames``.
+
+        Yields:
+            The result dict of every processed frame
+        """
+        try:
+            for frame in self.frames():
+                try:
+                    yield self.process(frame)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error processing frame {frame.index}: {str(e)}")
+                if max_frames is not None and self.processed >= max_frames:
+                    break
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.buffer is not None:
+            self.buffer.close()
+
+    @property
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "motion_skipped": self.gate.skipped,
+            "dropped": self.buffer.dropped if self.buffer is not None else 0,
+        }
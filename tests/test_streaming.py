@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+# The app reads its configuration on import: point it at a scratch database
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir.name, 'test.db')
+os.environ['CV_POOL_WORKERS'] = '0'
+
+from flask_migrate import upgrade  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import PlateDetectionLog  # noqa: E402
+from streaming import FrameBuffer, MotionGate, StreamFrame, StreamIngestor  # noqa: E402
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+def setUpModule():
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+
+def tearDownModule():
+    with app.app_context():
+        db.engine.dispose()
+    _tmpdir.cleanup()
+
+def scene(car_x=None, width=320, height=240):
+    """A dark frame, with a bright 'car' whose left edge is at car_x if given."""
+    image = np.full((height, width, 3), 40, dtype=np.uint8)
+    if car_x is not None:
+        image[80:160, car_x:car_x + 80] = 220
+    return image
+
+def stream(images):
+    return [StreamFrame(index, index / 10.0, image) for index, image in enumerate(images)]
+
+class MotionGateTest(unittest.TestCase):
+
+    def test_passes_only_frames_that_changed(self):
+        noisy = scene()
+        noisy[0:2, 0:2] = 50  # far below the change threshold
+        frames = stream([scene(), scene(), noisy, scene(40), scene(40), scene(120)])
+
+        gate = MotionGate()
+        passed = [frame.index for frame in gate(frames)]
+
+        # The first frame becomes the reference; only the car appearing and moving pass
+        self.assertEqual(passed, [0, 3, 5])
+        self.assertEqual(gate.skipped, 3)
+
+class FrameBufferTest(unittest.TestCase):
+
+    def test_drops_oldest_frames_when_full(self):
+        buffer = FrameBuffer(iter(stream([scene(x) for x in range(0, 200, 40)])), maxsize=2, drop=True)
+        # Let the producer run ahead of a consumer that hasn't started yet
+        buffer._thread.join(timeout=5)
+
+        self.assertEqual([frame.index for frame in buffer], [3, 4])
+        self.assertEqual(buffer.dropped, 3)
+
+    def test_keeps_every_frame_without_drop(self):
+        buffer = FrameBuffer(iter(stream([scene(x) for x in range(0, 200, 40)])), maxsize=1, drop=False)
+
+        self.assertEqual([frame.index for frame in buffer], [0, 1, 2, 3, 4])
+        self.assertEqual(buffer.dropped, 0)
+
+class StreamIngestorTest(unittest.TestCase):
+
+    def setUp(self):
+        # Parked scene, a car crossing the frame, then the scene parked again
+        images = [scene(), scene(), scene(20), scene(80), scene(140), scene(140), scene(140), scene(200)]
+        self.path = os.path.join(_tmpdir.name, 'gate.avi')
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (320, 240))
+        for image in images:
+            writer.write(image)
+        writer.release()
+
+    def test_gates_frames_and_dedups_repeated_plate(self):
+        def read_plate(image, roi=None):
+            # Stands in for the OCR: the car carries one plate wherever it is
+            return ("AB12CDE", 0.9) if image.bgr.mean() > 50 else (None, 0)
+
+        with app.app_context(), mock.patch('streaming.find_plate_in_image', side_effect=read_plate):
+            # Sample above the video's 10 fps so every frame is decoded
+            ingestor = StreamIngestor(self.path, organization='test-org', faces=False,
+                                      location='test-gate', fps=100)
+            results = list(ingestor.run())
+
+            # Frames 1, 5 and 6 repeat the frame before them and never reach the detector
+            self.assertEqual([result["frame"] for result in results], [0, 2, 3, 4, 7])
+            self.assertEqual(ingestor.stats, {"processed": 5, "motion_skipped": 3, "dropped": 0})
+
+            # Four sightings of the same plate at the same gate are one log entry
+            logs = PlateDetectionLog.query.filter_by(organization_id='test-org').all()
+            self.assertEqual(len(logs), 1)
+            self.assertEqual(logs[0].plate_number, "AB12CDE")
+            self.assertEqual(logs[0].detection_count, 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from app import app
+
+class Sighting:
+    """One identity seen continuously within the tracker's window."""
+
+    __slots__ = ('key', 'first_seen', 'last_seen', 'count', 'record_id', 'state')
+
+    def __init__(self, key, now):
+        self.key = key
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 1
+        self.record_id = None  # Database row the sighting was recorded as
+        self.state = None  # Caller-defined, e.g. the attendance event type
+
+class DetectionTracker:
+    """
+    Time-window cache that collapses repeated detections of the same identity.
+
+    A key (plate text, user id, ...) seen again within ``window`` seconds of
+    its last sighting extends the existing sighting instead of starting a new
+    one, so a car idling at the gate or a person lingering at the kiosk is
+    one event with first/last seen times and a count. Entries expire once
+    they go quiet for a full window. The cache lives in process memory, so
+    each app worker debounces on its own.
+    """
+
+    def __init__(self, window_setting, default_window, max_entries=10000):
+        self._window_setting = window_setting
+        self._default_window = default_window
+        self._max_entries = max_entries
+        self._entries = OrderedDict()  # Least recently seen first
+        self._lock = threading.Lock()
+
+    @property
+    def window(self):
+        return timedelta(seconds=app.config.get(self._window_setting, self._default_window))
+
+    def observe(self, key, now=None):
+        """
+        Record a detection of ``key``.
+
+        Returns:
+            Tuple of (Sighting, repeat) where repeat is True if the key was
+            already seen within the window
+        """
+        now = now or datetime.utcnow()
+        window = self.window
+
+        with self._lock:
+            self._purge(now - window)
+
+            sighting = self._entries.get(key)
+            if sighting is not None:
+                sighting.last_seen = now
+                sighting.count += 1
+                self._entries.move_to_end(key)
+                return sighting, True
+
+            sighting = Sighting(key, now)
+            self._entries[key] = sighting
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            return sighting, False
+
+    def forget(self, key):
+        """Drop a key so its next detection starts a new sighting."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _purge(self, cutoff):
+        while self._entries:
+            key, sighting = next(iter(self._entries.items()))
+            if sighting.last_seen >= cutoff:
+                break
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+# Shared trackers for this process
+plate_tracker = DetectionTracker('PLATE_DEDUP_WINDOW', 60)
+attendance_tracker = DetectionTracker('ATTENDANCE_DEDUP_WINDOW', 120)
@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from app import app
+from background import background_writer
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+
+# Layout of stored files: [<namespace>/]ab/cd/<sha256>.<ext>, plus <sha256>.thumb.jpg
+_SHARD = re.compile(r'[0-9a-f]{2}$')
+_STORED_NAME = re.compile(r'([0-9a-f]{64})(?:\.thumb\.jpg|\.[a-z0-9]+)$')
+
+def _extension(data, filename=None):
+    """File extension for encoded image bytes, from their signature."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if filename and '.' in filename:
+        return filename.rsplit('.', 1)[1].lower()
+    return 'bin'
+
+def thumbnail_path(image_path):
+    """Path of the thumbnail stored next to an image (same form as image_path)."""
+    return os.path.splitext(image_path)[0] + THUMBNAIL_SUFFIX
+
+class UploadStore:
+    """
+    Content-addressed storage for uploaded and evidence images.
+
+    An image is stored once under UPLOAD_FOLDER/<namespace>/ab/cd/<sha256>.<ext>,
+    sharded on the first hash bytes so no directory grows unbounded; saving
+    the same frame again returns the existing path and only refreshes its
+    modification time, which retention (``prune``) goes by. Writes
+    run on the shared background writer so requests don't wait on the disk
+    (falling back to a synchronous write if its queue is full), optionally
+    re-encoding JPEGs at UPLOAD_JPEG_QUALITY and adding a thumbnail
+    UPLOAD_THUMBNAIL_WIDTH pixels wide.
+    """
+
+    def __init__(self, writer=background_writer):
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    @property
+    def root(self):
+        return app.config['UPLOAD_FOLDER']
+
+    def absolute_path(self, image_path):
+        """Filesystem path of a static-relative 'uploads/...' path returned by ``save``."""
+        return os.path.normpath(os.path.join(self.root, os.path.relpath(image_path, 'uploads')))
+
+    def save(self, data, namespace='', filename=None):
+        """
+        Store an image.
+
+        Args:
+            data: Encoded image bytes
+            namespace: Subfolder of the upload folder (e.g. 'plates')
+            filename: Original file name, used for the extension of
+                      formats that are not recognised from the bytes
+
+        Returns:
+            Path of the stored image relative to the static folder
+            (e.g. 'uploads/plates/3f/a2/3fa2....jpg'); the file may still
+            be queued for writing
+        """
+        data = bytes(data)
+        digest = hashlib.sha256(data).hexdigest()
+        relative = os.path.join(namespace, digest[:2], digest[2:4], f"{digest}.{_extension(data, filename)}")
+        path = os.path.join(self.root, relative)
+        static_path = os.path.join('uploads', relative)
+
+        with self._lock:
+            if path in self._pending:
+                return static_path
+            try:
+                # Already stored: restart its retention clock
+                os.utime(path)
+                return static_path
+            except FileNotFoundError:
+                pass
+            self._pending.add(path)
+
+        if not self._writer.submit(self._write, path, data):
+            logger.warning("Upload writer backed up, saving synchronously")
+            self._write(path, data)
+        return static_path
+
+    def _write(self, path, data):
+        try:
+            encoded = data
+            quality = app.config.get('UPLOAD_JPEG_QUALITY', 0)
+            thumbnail_width = app.config.get('UPLOAD_THUMBNAIL_WIDTH', 0)
+            image = None
+            if (quality and path.endswith('.jpg')) or thumbnail_width:
+                import cv2
+                import numpy as np
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+            if image is not None and quality and path.endswith('.jpg'):
+                ok, recompressed = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if ok and len(recompressed) < len(data):
+                    encoded = recompressed.tobytes()
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, encoded)
+
+            if image is not None and thumbnail_width:
+                h, w = image.shape[:2]
+                if w > thumbnail_width:
+                    size = (thumbnail_width, max(1, int(h * thumbnail_width / w)))
+                    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+                ok, thumbnail = cv2.imencode('.jpg', image)
+                if ok:
+                    _write_atomic(thumbnail_path(path), thumbnail.tobytes())
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def _shard_directories(self):
+        """Second-level shard directories (``[<namespace>/]ab/cd``) of the store."""
+        def subdirectories(path):
+            try:
+                return [entry for entry in os.scandir(path) if entry.is_dir(follow_symlinks=False)]
+            except OSError:
+                return []
+
+        for top in subdirectories(self.root):
+            # Either a shard of the default namespace or a namespace folder
+            firsts = [top] if _SHARD.match(top.name) else [entry for entry in subdirectories(top.path)
+                                                             if _SHARD.match(entry.name)]
+            for first in firsts:
+                for second in subdirectories(first.path):
+                    if _SHARD.match(second.name):
+                        yield first.name + second.name, second.path
+
+    def _stored_files(self):
+        """
+        Files of the store, grouped by image: only files named after their content hash in
+        the matching shard are included, so nothing else under UPLOAD_FOLDER is touched.
+
+        Yields:
+            Lists of absolute paths (an image and its thumbnail, if any)
+        """
+        for prefix, directory in self._shard_directories():
+            groups = {}
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                found = _STORED_NAME.match(entry.name)
+                if found and found.group(1).startswith(prefix) and entry.is_file(follow_symlinks=False):
+                    groups.setdefault(found.group(1), []).append(os.path.normpath(entry.path))
+            yield from groups.values()
+
+    def prune(self, max_age, referenced=(), dry_run=False):
+        """
+        Delete stored images older than ``max_age`` seconds, keeping referenced ones.
+
+        Only the store's own shard folders are walked. The old images are
+        found first, then ``referenced`` is read once and compared against
+        them, so it can be a query streamed in batches and nothing is held
+        for the images that are still recent. A thumbnail goes with its image.
+
+        Args:
+            max_age: Minimum age in seconds (by modification time of the image) of files removed
+            referenced: Iterable of static-relative paths that must be kept
+                        (e.g. PlateDetectionLog.image_path values); not read
+                        when no image is old enough
+            dry_run: Only count what would be removed
+
+        Returns:
+            Tuple of (files removed, bytes freed)
+        """
+        cutoff = time.time() - max_age
+        expired = {}  # image -> paths removed with it
+        for paths in self._stored_files():
+            images = [path for path in paths if not path.endswith(THUMBNAIL_SUFFIX)] or paths
+            try:
+                if max(os.stat(path).st_mtime for path in images) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            for path in paths:
+                expired[path] = paths
+
+        if expired:
+            for image_path in referenced:
+                for path in (self.absolute_path(image_path), self.absolute_path(thumbnail_path(image_path))):
+                    for kept in expired.get(path, ()):
+                        expired.pop(kept, None)
+
+        removed = 0
+        freed = 0
+        emptied = set()
+        for path in expired:
+            try:
+                size = os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+            emptied.add(os.path.dirname(path))
+
+        if not dry_run:
+            # Drop shard directories emptied by the pass
+            for directory in emptied:
+                for shard in (directory, os.path.dirname(directory)):
+                    try:
+                        os.rmdir(shard)
+                    except OSError:
+                        break
+
+        return removed, freed
+
+def _write_atomic(path, data):
+    # Unique temporary name: another process may be storing the same image
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Shared store for this process
+upload_store = UploadStore()
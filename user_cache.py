@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from app import app, db
+from models import User
+
+# Columns copied into the cached identity (never the password hash)
+IDENTITY_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'organization', 'created_at')
+
+class CachedUser(UserMixin):
+    """
+    Read-only snapshot of a User row, stored as the request's current_user.
+
+    Has the fields routes and templates read (id, role, organization,
+    names...) but is not attached to a session: code that changes the
+    user loads the row with ``load``.
+    """
+
+    def __init__(self, user):
+        for field in IDENTITY_FIELDS:
+            setattr(self, field, getattr(user, field))
+
+    def load(self):
+        """The User row behind this identity, in the current session."""
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+class UserCache:
+    """
+    Per-process cache of logged-in users for Flask-Login's user loader.
+
+    Holds up to USER_CACHE_SIZE identities (least recently used dropped
+    first) for USER_CACHE_TTL seconds, so an authenticated request costs no
+    user query. Changes to a User made through the ORM in this process
+    invalidate it when they commit; changes made elsewhere (another worker,
+    SQL by hand) show up once the entry expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # Least recently used first
+
+    def get(self, user_id):
+        """
+        The identity of a user.
+
+        Returns:
+            CachedUser, or None if there is no such user
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = CachedUser(user)
+
+        ttl = app.config.get('USER_CACHE_TTL', 60)
+        max_entries = app.config.get('USER_CACHE_SIZE', 1024)
+        with self._lock:
+            self._entries[user_id] = (now + ttl, identity)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id=None):
+        """Drop a user's cached identity, or every identity if no user is given."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _mark_changed(self, mapper, connection, target):
+        # Invalidated after the commit so a concurrent request can't re-cache the old row
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('changed_users', set()).add(target.id)
+
+    def _after_commit(self, session):
+        for user_id in session.info.pop('changed_users', ()):
+            self.invalidate(user_id)
+
+    def _after_rollback(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop('changed_users', None)
+
+# Shared cache for this process
+user_cache = UserCache()
+
+event.listen(User, 'after_update', user_cache._mark_changed)
+event.listen(User, 'after_delete', user_cache._mark_changed)
+event.listen(db.session, 'after_commit', user_cache._after_commit)
+event.listen(db.session, 'after_soft_rollback', user_cache._after_rollback)
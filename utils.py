@@ -1,10 +1,8 @@
-import os
 import cv2
 import logging
 import numpy as np
-from datetime import datetime
-from werkzeug.utils import secure_filename
-from app import app
+from frames import Frame, reduction_for
+from upload_store import upload_store
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +15,9 @@ def save_image(file, subfolder=''):
     """
     Save an uploaded image file to the uploads directory.
     
+    Images are content-addressed (see UploadStore): identical uploads share
+    one file, and the write happens in the background.
+    
     Args:
         file: The file object to save
         subfolder: Optional subfolder within uploads
@@ -29,55 +30,39 @@ def save_image(file, subfolder=''):
             logger.warning(f"Invalid file or filename: {file.filename if file else 'None'}")
             return None
         
-        # Create directory if it doesn't exist
-        save_dir = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
-        os.makedirs(save_dir, exist_ok=True)
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = secure_filename(f"{timestamp}_{file.filename}")
-        
-        # Save the file
-        filepath = os.path.join(save_dir, filename)
-        file.save(filepath)
-        
-        # Return the relative path
-        return os.path.join('uploads', subfolder, filename)
+        return upload_store.save(file.read(), subfolder, filename=file.filename)
     
     except Exception as e:
         logger.error(f"Error saving image: {str(e)}")
         return None
 
-def preprocess_image(image_path):
+def preprocess_image(image):
     """
     Preprocess an image for computer vision tasks.
     
     Args:
-        image_path: Path to the image file
+        image: A decoded Frame (e.g. the one the detectors used), or the
+            path to an image file
         
     Returns:
         Preprocessed image as NumPy array
     """
     try:
-        # Read image
-        image = cv2.imread(image_path)
+        if isinstance(image, Frame):
+            frame = image
+        else:
+            # Only grayscale is needed; decode no larger than the 640x480 output
+            with open(image, 'rb') as f:
+                data = f.read()
+            frame = Frame.decode(data, reduce=reduction_for(data, 640, 480), grayscale=True)
         
-        if image is None:
-            logger.error(f"Failed to read image at {image_path}")
+        if frame is None:
+            logger.error(f"Failed to read image at {image}")
             return None
         
-        # Resize for consistency
-        image = cv2.resize(image, (640, 480))
-        
-        # Apply some basic preprocessing
-        # - Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # - Apply Gaussian blur to reduce noise
-        blur = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Return preprocessed image
-        return blur
+        # Resize for consistency, then blur to reduce noise
+        gray = cv2.resize(frame.gray, (640, 480), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
     
     except Exception as e:
         logger.error(f"Error preprocessing image: {str(e)}")